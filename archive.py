@@ -0,0 +1,246 @@
+"""Retention: old messages move to per-month archive files next to the database.
+
+Archive files (`messages-YYYY-MM.db`) hold the same rows with zlib-compressed
+text and their links. The hot database keeps `archive_index` (ID, month, chat,
+count, dates) so a search opens only the months that have the ID, and stats
+stay all-time: archived rows are removed while the `archiving` marker row keeps
+the stats triggers out, and rebuild_stats() adds the index back in.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from db import MESSAGE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    sender_id INTEGER,
+    sender_username TEXT,
+    sender_first_name TEXT,
+    date INTEGER,
+    text BLOB,  -- zlib
+    media_type TEXT,
+    file_id TEXT,
+    is_forward INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS message_male_ids (
+    male_id TEXT NOT NULL,
+    date INTEGER,
+    message_id_ref INTEGER NOT NULL,
+    PRIMARY KEY (male_id, date, message_id_ref)
+) WITHOUT ROWID;
+"""
+COLUMNS = "id, chat_id, message_id, sender_id, sender_username, sender_first_name, date, text, " \
+          "media_type, file_id, is_forward"
+MAX_ATTACHED = 8  # SQLite allows 10 attached databases per connection
+
+
+def deflate(text: Optional[str]) -> Optional[bytes]:
+    """Plain zlib, which the database's inflate() SQL function reads (see textstore.py)."""
+    return None if text is None else zlib.compress(text.encode("utf-8"), 6)
+
+
+def parse_retention(spec: str) -> dict[int, int]:
+    """'-1001:90,-1002:365' -> {chat_id: days}."""
+    out = {}
+    for item in (spec or "").split(","):
+        if item.strip():
+            chat_id, _, days = item.partition(":")
+            out[int(chat_id)] = int(days)
+    return out
+
+
+class ArchiveStore:
+    def __init__(self, directory: str):
+        self.dir = Path(directory)
+        self._local = threading.local()
+
+    def path(self, month: str) -> Path:
+        return self.dir / f"messages-{month}.db"
+
+    def months(self) -> list[str]:
+        return sorted(p.stem.split("-", 1)[1] for p in self.dir.glob("messages-*.db"))
+
+    # ---- Moving rows out
+    def archive(self, db, days: int = 0, per_chat: dict[int, int] = None, batch: int = 5000,
+                pause: float = 0.05) -> dict:
+        """Moves messages older than their chat's retention (`per_chat`, else `days`; 0 keeps
+        them) to the archives, in batches that each hold the write lock briefly. Blocking."""
+        now = int(time.time())
+        default = now - days * 86400 if days > 0 else 0
+        cutoffs = {str(c): now - d * 86400 if d > 0 else 0 for c, d in (per_chat or {}).items()}
+        horizon = max([default, *cutoffs.values()])
+        moved = 0
+        while n := self._archive_batch(db, json.dumps(cutoffs), default, horizon, batch):
+            moved += n
+            time.sleep(pause)  # let queued writes in
+        if moved:
+            logger.info("Archived %s messages", moved)
+        return {"archived": moved}
+
+    def _open(self, month: str) -> sqlite3.Connection:
+        path = self.path(month)
+        fresh = not path.exists()
+        if fresh:
+            self.dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path)
+        if fresh:
+            conn.executescript(ARCHIVE_SCHEMA)
+        return conn
+
+    def _archive_batch(self, db, cutoffs: str, default: int, horizon: int, limit: int) -> int:
+        with db.write_lock:
+            conn = db.conn
+            rows = conn.execute(
+                f"""SELECT {MESSAGE_FIELDS}, strftime('%Y-%m', m.date, 'unixepoch') AS month FROM messages m
+                    WHERE m.date < ? AND m.date < coalesce(json_extract(?, '$."' || m.chat_id || '"'), ?)
+                    ORDER BY m.date LIMIT ?""", (horizon, cutoffs, default, limit)).fetchall()
+            if not rows:
+                return 0
+            ids = json.dumps([r["id"] for r in rows])
+            links = conn.execute(
+                """SELECT mm.message_id_ref, printf('%010d', mm.male_id) AS male_id FROM message_male_ids mm
+                   WHERE mm.message_id_ref IN (SELECT value FROM json_each(?))""", (ids,)).fetchall()
+            by_id = {r["id"]: r for r in rows}
+            by_month: dict[str, list] = {}
+            for r in rows:
+                by_month.setdefault(r["month"], []).append(r)
+            # archive first: if we stop before the delete, the next run re-inserts idempotently
+            for month, month_rows in by_month.items():
+                month_ids = {r["id"] for r in month_rows}
+                arc = self._open(month)
+                try:
+                    with arc:
+                        arc.executemany(
+                            f"INSERT OR IGNORE INTO messages({COLUMNS}) VALUES(?,?,?,?,?,?,?,?,?,?,?)",
+                            [(*tuple(r)[:7], deflate(r["text"]), *tuple(r)[8:11]) for r in month_rows])
+                        arc.executemany(
+                            "INSERT OR IGNORE INTO message_male_ids(male_id, date, message_id_ref) VALUES(?,?,?)",
+                            [(l["male_id"], by_id[l["message_id_ref"]]["date"], l["message_id_ref"])
+                             for l in links if l["message_id_ref"] in month_ids])
+                finally:
+                    arc.close()
+            with conn:
+                conn.executemany(
+                    """INSERT INTO archive_index(male_id, month, chat_id, msg_count, first_date, last_date)
+                       VALUES(?,?,?,1,?,?)
+                       ON CONFLICT(male_id, month, chat_id) DO UPDATE SET msg_count = msg_count + 1,
+                           first_date = min(first_date, excluded.first_date),
+                           last_date = max(last_date, excluded.last_date)""",
+                    [(l["male_id"], by_id[l["message_id_ref"]]["month"], by_id[l["message_id_ref"]]["chat_id"],
+                      by_id[l["message_id_ref"]]["date"], by_id[l["message_id_ref"]]["date"]) for l in links])
+                conn.execute(
+                    """INSERT INTO stats_totals(key, value) VALUES('archived', ?)
+                       ON CONFLICT(key) DO UPDATE SET value = value + excluded.value""", (len(rows),))
+                # archived deletes must not touch the all-time aggregates (trg_messages_del, trg_links_del);
+                # the marker lives only inside this transaction
+                conn.execute("INSERT INTO archiving(id) VALUES(1)")
+                conn.execute("DELETE FROM message_male_ids WHERE message_id_ref IN (SELECT value FROM json_each(?))",
+                             (ids,))
+                conn.execute("DELETE FROM messages WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+                conn.execute("DELETE FROM archiving")
+            return len(rows)
+
+    # ---- Searching
+    def _attach(self, conn: sqlite3.Connection, month: str) -> Optional[str]:
+        """Attaches a month read-only to this thread's connection (LRU of MAX_ATTACHED)."""
+        local = self._local
+        if getattr(local, "conn", None) is not conn:
+            local.conn, local.attached = conn, OrderedDict()
+        alias = local.attached.get(month)
+        if alias is None:
+            path = self.path(month)
+            if not path.exists():
+                return None
+            if len(local.attached) >= MAX_ATTACHED:
+                _, old = local.attached.popitem(last=False)
+                conn.execute(f"DETACH DATABASE {old}")
+            alias = "arc_" + month.replace("-", "_")
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (f"{path.resolve().as_uri()}?mode=ro",))
+            local.attached[month] = alias
+        else:
+            local.attached.move_to_end(month)
+        return alias
+
+    def search(self, db, male_id: str, limit: int, before: Optional[tuple[int, int]], hot_rows) -> list:
+        """Merges hot results with archived ones into the next page (newest first). Runs on a reader thread;
+        archives are only opened for months that have the ID and could still make the page."""
+        conn = db.rconn
+        months = conn.execute(
+            """SELECT month, MAX(last_date) FROM archive_index WHERE male_id = ? AND first_date <= ?
+               GROUP BY month ORDER BY month DESC""",
+            (male_id, before[0] if before else 1 << 62)).fetchall()
+        rows = list(hot_rows)
+        for month, last_date in months:
+            if len(rows) >= limit:
+                rows.sort(key=lambda r: (r["date"], r["id"]), reverse=True)
+                if rows[limit - 1]["date"] > last_date:
+                    break  # this and older months can't make the page
+            alias = self._attach(conn, month)
+            if alias is None:
+                continue
+            keyset = "AND (mm.date, mm.message_id_ref) < (?, ?)" if before else ""
+            rows += conn.execute(
+                f"""SELECT m.id, m.chat_id, m.message_id, m.sender_id, m.sender_username, m.sender_first_name,
+                           m.date, inflate(m.text) AS text, m.media_type, m.file_id, m.is_forward, mm.male_id
+                    FROM {alias}.message_male_ids mm JOIN {alias}.messages m ON m.id = mm.message_id_ref
+                    WHERE mm.male_id = ? {keyset}
+                    ORDER BY mm.date DESC, mm.message_id_ref DESC LIMIT ?""",
+                (male_id, *(before or ()), limit)).fetchall()
+        rows.sort(key=lambda r: (r["date"], r["id"]), reverse=True)
+        return rows[:limit]
+
+
+def maintain(db, vacuum_pages: int = 0) -> dict:
+    """Returns freed pages to the OS and truncates the WAL; reports the space reclaimed.
+
+    Incremental vacuum needs auto_vacuum=INCREMENTAL, which an existing database
+    only gets through one full VACUUM: pass vacuum_pages=-1 once to convert.
+    """
+    def sizes():
+        wal = Path(f"{db.path}-wal")
+        return os.path.getsize(db.path), wal.stat().st_size if wal.exists() else 0
+
+    started = time.perf_counter()
+    with db.write_lock:
+        conn = db.conn
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        db_before, wal_before = sizes()
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if vacuum_pages < 0:
+            if mode != 2:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        elif mode == 2:
+            conn.execute(f"PRAGMA incremental_vacuum({vacuum_pages})" if vacuum_pages else "PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA optimize")
+        busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        db_after, wal_after = sizes()
+    report = {
+        "db_bytes": db_after,
+        "wal_bytes": wal_after,
+        "reclaimed_db_bytes": db_before - db_after,
+        "reclaimed_wal_bytes": wal_before - wal_after,
+        "free_pages": free_after,
+        "free_pages_before": free_before,
+        "page_size": page_size,
+        "auto_vacuum": "incremental" if mode == 2 or vacuum_pages < 0 else "none",
+        "checkpoint_busy": bool(busy),
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    logger.info("Maintenance: %s", report)
+    return report
@@ -0,0 +1,88 @@
+"""Minimal local stand-in for the Telegram Bot API, for benchmarks and end-to-end runs.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:<port>. Every call is
+recorded; getUpdates serves whatever was queued with push_update().
+"""
+import asyncio
+import json
+import time
+from typing import Optional
+
+from aiohttp import web
+
+
+class FakeBotAPI:
+    def __init__(self):
+        self.calls: list[tuple[float, str, dict]] = []
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.webhook_url: Optional[str] = None
+        self._message_id = 0
+        self._waiters: dict[int, list[asyncio.Future]] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def push_update(self, update: dict):
+        self.updates.put_nowait(update)
+
+    def wait_reply(self, chat_id: int) -> asyncio.Future:
+        """Resolves with the time of the next message the bot sends to chat_id."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append(fut)
+        return fut
+
+    def _message(self, chat_id) -> dict:
+        self._message_id += 1
+        return {"message_id": self._message_id, "date": int(time.time()),
+                "chat": {"id": int(chat_id), "type": "private" if int(chat_id) > 0 else "supergroup"}}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        if not params and request.can_read_body:
+            params = await request.json()
+        now = time.perf_counter()
+        self.calls.append((now, method, params))
+        if method == "getupdates":
+            result = []
+            try:
+                result.append(await asyncio.wait_for(self.updates.get(), float(params.get("timeout") or 0) or 0.01))
+                while not self.updates.empty():
+                    result.append(self.updates.get_nowait())
+            except asyncio.TimeoutError:
+                pass
+        elif method == "getme":
+            result = {"id": 42, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        elif method == "setwebhook":
+            self.webhook_url = params.get("url")
+            result = True
+        elif method == "copymessages":
+            result = [{"message_id": self._message(params["chat_id"])["message_id"]}
+                      for _ in json.loads(params["message_ids"])]
+        elif method.startswith("send") or method in ("copymessage", "editmessagetext"):
+            if method == "sendmediagroup":
+                result = [self._message(params["chat_id"]) for _ in json.loads(params["media"])]
+            elif method == "copymessage":
+                result = {"message_id": self._message(params["chat_id"])["message_id"]}
+            else:
+                result = self._message(params["chat_id"])
+        else:
+            result = True
+        chat_id = params.get("chat_id")
+        if chat_id is not None and method != "getupdates":
+            for fut in self._waiters.pop(int(chat_id), []):
+                if not fut.done():
+                    fut.set_result(now)
+        return web.json_response({"ok": True, "result": result})
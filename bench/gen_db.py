@@ -0,0 +1,138 @@
+"""Synthetic database for benchmarks: messages with Zipf-distributed male IDs.
+
+    python bench/gen_db.py /tmp/bench.db --messages 1000000 [--ids 125000] [--chats 200]
+
+A few IDs appear in thousands of messages and most in one or two, like in real
+groups. Rows are appended to an existing database. Stats and FTS triggers are
+dropped for the load and the aggregates rebuilt in one pass afterwards (the
+triggers come back the next time the database is opened); with --no-fts the
+text index is left empty, which saves most of the time on 100M rows.
+"""
+import argparse
+import logging
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from db import DB  # noqa: E402
+
+logger = logging.getLogger("gen_db")
+
+ID_BASE = 1_000_000_000
+ID_SPAN = 9_000_000_000
+ID_STRIDE = 2_654_435_761  # prime, coprime with ID_SPAN: rank -> ID is a bijection
+WORDS = ("анкета", "встреча", "фото", "проверен", "отзыв", "минус", "плюс", "адекватный", "опасен", "номер",
+         "город", "вечер", "помогите", "кто", "знает", "такого", "пишет", "всем", "девочки", "осторожно")
+
+
+def male_id(rank: int) -> str:
+    """Spreads ranks over the whole 10-digit range so popularity doesn't follow numeric order."""
+    return str(ID_BASE + rank * ID_STRIDE % ID_SPAN)
+
+
+class Zipf:
+    """Ranks 1..n with P(rank) ~ 1/rank**s, sampled by inverting the continuous CDF (no tables)."""
+
+    def __init__(self, n: int, s: float = 1.1, rng: random.Random = None):
+        self.n = n
+        self.s = s
+        self.rng = rng or random.Random()
+        self._top = n ** (1 - s) - 1 if s != 1 else math.log(n)
+
+    def rank(self) -> int:
+        u = self.rng.random()
+        if self.s == 1:
+            r = math.exp(u * self._top)
+        else:
+            r = (u * self._top + 1) ** (1 / (1 - self.s))
+        return min(self.n, max(1, int(r)))
+
+    def male_id(self) -> str:
+        return male_id(self.rank())
+
+
+def message_text(rng: random.Random, ids: list[str]) -> str:
+    words = rng.sample(WORDS, rng.randint(2, 8))
+    for mid in ids:
+        words.insert(rng.randint(0, len(words)), mid)
+    return " ".join(words)
+
+
+def generate(path: str, messages: int, ids: int = 0, chats: int = 200, s: float = 1.1, seed: int = 1,
+             days: int = 730, batch: int = 50000, fts: bool = True):
+    rng = random.Random(seed)
+    zipf = Zipf(ids or max(1, messages // 8), s, rng)
+    db = DB(path, readers=1)
+    conn = db.conn
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger'").fetchall():
+        conn.execute(f'DROP TRIGGER "{name}"')
+
+    chat_ids = [-1001000000000 - i for i in range(chats)]
+    for chat_id in chat_ids:
+        female = str(ID_BASE + rng.randrange(ID_SPAN))
+        db.add_allowed_chat(chat_id, f"Группа {female}", female, 0)
+    next_id = (conn.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0) + 1
+    next_msg = {chat_id: (conn.execute("SELECT MAX(message_id) FROM messages WHERE chat_id=?",
+                                       (chat_id,)).fetchone()[0] or 0) + 1 for chat_id in chat_ids}
+    start = int(time.time()) - days * 86400
+    step = days * 86400 / max(1, messages)
+
+    started = time.perf_counter()
+    done = 0
+    while done < messages:
+        n = min(batch, messages - done)
+        rows, links = [], []
+        for i in range(n):
+            chat_id = chat_ids[min(chats - 1, int(rng.paretovariate(1.2)) - 1)]  # a few busy chats
+            found = {zipf.male_id() for _ in range(rng.choices((1, 2, 3), (80, 15, 5))[0])}
+            kind = rng.random()
+            media_type, file_id = ("text", None) if kind < 0.7 else \
+                ("photo", f"AgAC{next_id:x}") if kind < 0.95 else ("video", f"BAAC{next_id:x}")
+            rows.append((next_id, chat_id, next_msg[chat_id], 7000 + rng.randrange(5000), None, "user",
+                         int(start + (done + i) * step), message_text(rng, sorted(found)), media_type, file_id, 0))
+            links.extend((next_id, mid) for mid in found)
+            next_msg[chat_id] += 1
+            next_id += 1
+        with conn:
+            conn.executemany(
+                """INSERT INTO messages(id, chat_id, message_id, sender_id, sender_username, sender_first_name,
+                       date, text, media_type, file_id, is_forward) VALUES(?,?,?,?,?,?,?,?,?,?,?)""", rows)
+            conn.executemany("INSERT OR IGNORE INTO message_male_ids(message_id_ref, male_id) VALUES(?,?)", links)
+        done += n
+        logger.info("%s/%s messages, %.0f msg/s", done, messages, done / (time.perf_counter() - started))
+
+    logger.info("Rebuilding stats")
+    db.rebuild_stats()
+    if fts:
+        logger.info("Rebuilding the text index")
+        db.rebuild_fts()
+    else:
+        db.set_setting("fts:built", "1")
+    conn.execute("PRAGMA synchronous=FULL")
+    db.close()
+    DB(path, readers=1).close()  # recreates the triggers
+    logger.info("Done in %.1fs", time.perf_counter() - started)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Generate a synthetic bot database")
+    parser.add_argument("path")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--ids", type=int, default=0, help="distinct male IDs (default: messages / 8)")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--zipf", type=float, default=1.1, help="skew of the ID distribution")
+    parser.add_argument("--days", type=int, default=730, help="time span of the messages")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-fts", action="store_true", help="leave the full-text index empty")
+    args = parser.parse_args()
+    generate(args.path, args.messages, args.ids, args.chats, args.zipf, args.seed, args.days, fts=not args.no_fts)
+
+
+if __name__ == "__main__":
+    main()
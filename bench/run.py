@@ -0,0 +1,297 @@
+"""End-to-end benchmarks: synthetic updates through the real Dispatcher, handlers and DB.
+
+    python bench/gen_db.py /tmp/bench.db --messages 1000000
+    python bench/run.py --db /tmp/bench.db [--out result.json] [--compare previous.json]
+
+Updates are built as aiogram `Update` objects and fed with `dp.feed_update`;
+the Bot API is replaced by an in-process session that answers every method
+(uploads are read to the end, so exports pay for producing the file). Flood
+limits are lifted: the numbers are the bot's own cost. The ingest and edit
+scenarios write to the database, so use a generated copy, not production data.
+
+Each scenario reports throughput and p50/p95/p99 latency of one `feed_update`;
+ingest and edits include the final flush in their throughput.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from gen_db import Zipf, message_text
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+ADMIN_ID = 500
+GROUP_SENDER = 7001
+
+
+# ---- Bot API stand-in
+def fake_session():
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import InputFile
+
+    class FakeSession(BaseSession):
+        """Answers every Bot API method in-process; responses still go through aiogram's parsing."""
+
+        def __init__(self):
+            super().__init__()
+            self.calls = Counter()
+            self.uploaded = 0
+            self.markups: dict[int, object] = {}
+            self._message_id = 0
+
+        def _message(self, chat_id) -> dict:
+            self._message_id += 1
+            return {"message_id": self._message_id, "date": int(time.time()),
+                    "chat": {"id": int(chat_id), "type": "private"}}
+
+        async def make_request(self, bot, method, timeout=None):
+            name = method.__api_method__
+            self.calls[name] += 1
+            for value in method.__dict__.values():
+                if isinstance(value, InputFile):
+                    async for chunk in value.read(bot):
+                        self.uploaded += len(chunk)
+            chat_id = getattr(method, "chat_id", 0)
+            if name == "getMe":
+                result = {"id": bot.id, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+            elif name == "copyMessages":
+                result = [{"message_id": self._message(chat_id)["message_id"]} for _ in method.message_ids]
+            elif name == "copyMessage":
+                result = {"message_id": self._message(chat_id)["message_id"]}
+            elif name == "sendMediaGroup":
+                result = [self._message(chat_id) for _ in method.media]
+            elif name.startswith("send"):
+                result = self._message(chat_id)
+                if name == "sendMessage":
+                    self.markups[chat_id] = method.reply_markup
+            else:
+                result = True
+            return self.check_response(bot, method, 200, json.dumps({"ok": True, "result": result})).result
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return FakeSession()
+
+
+# ---- Synthetic updates
+class Updates:
+    def __init__(self, Update, zipf: Zipf, rng: random.Random):
+        self.Update = Update
+        self.zipf = zipf
+        self.rng = rng
+        self.next_id = 1
+
+    def _update(self, **payload):
+        self.next_id += 1
+        return self.Update.model_validate({"update_id": self.next_id, **payload})
+
+    def _message(self, chat: dict, user_id: int, text: str, message_id: int = None) -> dict:
+        return {"message_id": message_id or self.next_id, "date": int(time.time()), "chat": chat, "text": text,
+                "from": {"id": user_id, "is_bot": False, "first_name": "u", "username": f"u{user_id}"}}
+
+    def group(self, chat_id: int, message_id: int, ids: list[str]):
+        chat = {"id": chat_id, "type": "supergroup", "title": "bench"}
+        return self._update(message=self._message(chat, GROUP_SENDER, message_text(self.rng, ids), message_id))
+
+    def group_edit(self, chat_id: int, message_id: int, ids: list[str]):
+        chat = {"id": chat_id, "type": "supergroup", "title": "bench"}
+        msg = self._message(chat, GROUP_SENDER, message_text(self.rng, ids), message_id)
+        msg["edit_date"] = int(time.time())
+        return self._update(edited_message=msg)
+
+    def private(self, text: str, user_id: int = ADMIN_ID):
+        return self._update(message=self._message({"id": user_id, "type": "private"}, user_id, text))
+
+    def callback(self, data: str, user_id: int = ADMIN_ID):
+        return self._update(callback_query={
+            "id": str(self.next_id), "chat_instance": "bench", "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "message": self._message({"id": user_id, "type": "private"}, 42, "…"),
+        })
+
+
+# ---- Measurement
+def summary(latencies: list[float], elapsed: float) -> dict:
+    ms = sorted(x * 1000 for x in latencies)
+    if not ms:
+        return {"n": 0}
+    pick = lambda q: round(ms[min(len(ms) - 1, int(q * len(ms)))], 3)
+    return {"n": len(ms), "per_s": round(len(ms) / elapsed, 1) if elapsed else None,
+            "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(ms[-1], 3)}
+
+
+async def feed_all(app, updates) -> tuple[list[float], float]:
+    latencies = []
+    started = time.perf_counter()
+    for update in updates:
+        t0 = time.perf_counter()
+        await app.dp.feed_update(app.bot, update)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - started
+
+
+# ---- Scenarios
+async def bench_ingest(app, gen: Updates, n: int, chat_ids: list[int], sent: list):
+    next_msg = {c: (app.db.conn.execute("SELECT MAX(message_id) FROM messages WHERE chat_id=?", (c,)).fetchone()[0]
+                    or 0) + 1_000_000 for c in chat_ids}
+    updates = []
+    for _ in range(n):
+        chat_id = gen.rng.choice(chat_ids)
+        ids = sorted({gen.zipf.male_id() for _ in range(gen.rng.choice((1, 1, 1, 2, 3)))})
+        updates.append(gen.group(chat_id, next_msg[chat_id], ids))
+        sent.append((chat_id, next_msg[chat_id]))
+        next_msg[chat_id] += 1
+    latencies, elapsed = await feed_all(app, updates)
+    t0 = time.perf_counter()
+    await app.ingest.flush()
+    return summary(latencies, elapsed + time.perf_counter() - t0)
+
+
+async def bench_edits(app, gen: Updates, n: int, sent: list):
+    updates = []
+    for chat_id, message_id in gen.rng.sample(sent, min(n, len(sent))):
+        ids = sorted({gen.zipf.male_id() for _ in range(gen.rng.choice((0, 1, 1, 2)))})
+        updates.append(gen.group_edit(chat_id, message_id, ids))
+    latencies, elapsed = await feed_all(app, updates)
+    t0 = time.perf_counter()
+    await app.ingest.flush_edits(force=True)
+    return summary(latencies, elapsed + time.perf_counter() - t0)
+
+
+async def bench_search(app, gen: Updates, session, n: int, pages: int):
+    first, more = [], []
+    started = time.perf_counter()
+    for _ in range(n):
+        latencies, _ = await feed_all(app, [gen.private(gen.zipf.male_id())])
+        first.extend(latencies)
+        for _ in range(pages):
+            markup = session.markups.get(ADMIN_ID)
+            data = markup.inline_keyboard[0][0].callback_data if markup else ""
+            if not data.startswith("more:"):
+                break
+            session.markups.pop(ADMIN_ID, None)
+            latencies, _ = await feed_all(app, [gen.callback(data)])
+            more.extend(latencies)
+    elapsed = time.perf_counter() - started
+    return {"first_page": summary(first, elapsed), "more": summary(more, elapsed)}
+
+
+async def bench_stats(app, gen: Updates, n: int):
+    return summary(*await feed_all(app, [gen.private("📊 Статистика") for _ in range(n)]))
+
+
+async def bench_export(app, gen: Updates, session, n: int):
+    latencies = []
+    started = time.perf_counter()
+    before = session.uploaded
+    for _ in range(n):
+        await app.dp.feed_update(app.bot, gen.callback("export:male"))
+        ids = " ".join(sorted({gen.zipf.male_id() for _ in range(gen.rng.randint(1, 3))}))
+        t0 = time.perf_counter()
+        await app.dp.feed_update(app.bot, gen.private(ids))
+        latencies.append(time.perf_counter() - t0)
+    result = summary(latencies, time.perf_counter() - started)
+    result["uploaded_bytes"] = session.uploaded - before
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, previous: dict):
+    """Prints p50/p95 changes per scenario against an earlier report."""
+    def flat(results, prefix=""):
+        for name, value in results.items():
+            if "p50_ms" in value:
+                yield prefix + name, value
+            elif isinstance(value, dict):
+                yield from flat(value, f"{prefix}{name}.")
+    old = dict(flat(previous["results"]))
+    print(f"vs {previous.get('commit')}:")
+    for name, new in flat(current["results"]):
+        if name in old and old[name].get("p50_ms"):
+            print(f"  {name:20} p50 {new['p50_ms'] / old[name]['p50_ms']:6.2f}x  "
+                  f"p95 {new['p95_ms'] / old[name]['p95_ms']:6.2f}x")
+
+
+async def main(args):
+    os.environ.update(BOT_TOKEN="42:bench", DB_PATH=args.db, OWNER_ID=str(ADMIN_ID), EXTENSIONS="",
+                      METRICS_PORT="0", WEBHOOK_PORT="0", LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+                      DB_SLOW_MS="1000000", DELIVERY_GLOBAL_RATE="1e9", DELIVERY_CHAT_RATE="1e9",
+                      DELIVERY_CHAT_BURST="1e9")
+    import bot as app  # reads the environment above
+    from aiogram.types import Update
+
+    session = app.bot.session = fake_session()
+    app.ingest.start()
+    rng = random.Random(args.seed)
+    ids = app.db.conn.execute("SELECT COUNT(*) FROM male_stats").fetchone()[0]
+    gen = Updates(Update, Zipf(max(1, ids), args.zipf, rng), rng)
+    chat_ids = [r["chat_id"] for r in app.db.list_allowed_chats()]
+    if not chat_ids:
+        chat_ids = [-1001000000000 - i for i in range(10)]
+        for chat_id in chat_ids:
+            app.db.add_allowed_chat(chat_id, "bench", None, 0)
+    messages = app.db.count_stats()[1]
+
+    results, sent = {}, []
+    results["ingest"] = await bench_ingest(app, gen, args.ingest, chat_ids, sent)
+    results["edits"] = await bench_edits(app, gen, args.edits, sent)
+    results["search"] = await bench_search(app, gen, session, args.searches, args.pages)
+    results["stats"] = await bench_stats(app, gen, args.stats)
+    results["export"] = await bench_export(app, gen, session, args.exports)
+    await app.ingest.stop()
+
+    report = {
+        "commit": git_commit(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "db": {"path": args.db, "messages": messages, "male_ids": ids, "chats": len(chat_ids),
+               "size_bytes": Path(args.db).stat().st_size},
+        "params": {k: v for k, v in vars(args).items() if k not in ("db", "out", "compare")},
+        "results": results,
+        "api_calls": dict(session.calls),
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    print(text)
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+    app.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks against a synthetic database")
+    parser.add_argument("--db", required=True, help="database made by gen_db.py (it is written to)")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare with")
+    parser.add_argument("--ingest", type=int, default=20000)
+    parser.add_argument("--edits", type=int, default=5000)
+    parser.add_argument("--searches", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=3, help="\"more\" pages per search")
+    parser.add_argument("--stats", type=int, default=200)
+    parser.add_argument("--exports", type=int, default=20)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""Group-ingest throughput of supervisor mode for several worker counts, against FakeBotAPI.
+
+    python bench/supervisor_scaling.py [--messages 20000] [--chats 200] [--workers 1,2,4]
+
+Each run starts `supervisor.py` on a fresh database, queues the messages in
+getUpdates and stops the clock when all of them are stored. The supervisor polls
+only once every worker has imported the bot, so the clock starts on ready workers.
+Workers add throughput only up to the number of cores (`cpus` in the report), and
+the supervisor's single writer stays the ceiling; run it on the production machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fake_api import FakeBotAPI
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from db import DB  # noqa: E402
+
+
+def group_update(update_id: int, chat_id: int) -> dict:
+    text = f"Анкета {random.randint(10**9, 10**10 - 1)} и {random.randint(10**9, 10**10 - 1)}"
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "chat": {"id": chat_id, "type": "supergroup", "title": f"chat {chat_id}"},
+        "from": {"id": 7, "is_bot": False, "first_name": "u", "username": "sender"},
+    }}
+
+
+async def run_once(workers: int, messages: int, chats: int) -> dict:
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, "bench.db")
+    chat_ids = [-1001000000000 - i for i in range(chats)]
+    db = DB(db_path, readers=1)
+    for chat_id in chat_ids:
+        db.add_allowed_chat(chat_id, f"chat {chat_id}", None, 0)
+    db.close()
+
+    api = FakeBotAPI()
+    base = await api.start()
+    env = dict(os.environ, BOT_TOKEN="42:fake", TELEGRAM_API_URL=base, DB_PATH=db_path, WEBHOOK_PORT="0",
+               METRICS_PORT="0", LOG_LEVEL="WARNING")
+    proc = await asyncio.create_subprocess_exec(sys.executable, str(ROOT / "supervisor.py"), "--workers",
+                                                str(workers), env=env, cwd=ROOT)
+    while not any(method == "getupdates" for _, method, _ in api.calls):
+        await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    for i in range(1, messages + 1):
+        api.push_update(group_update(i, random.choice(chat_ids)))
+    conn = sqlite3.connect(db_path)
+    stored = 0
+    while stored < messages:
+        await asyncio.sleep(0.1)
+        stored = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    elapsed = time.perf_counter() - started
+    conn.close()
+
+    proc.send_signal(signal.SIGTERM)
+    await proc.wait()
+    await api.stop()
+    return {"workers": workers, "cpus": os.cpu_count(), "messages": messages, "seconds": round(elapsed, 2),
+            "msg_per_s": round(messages / elapsed, 1)}
+
+
+async def main(messages: int, chats: int, workers: list[int]):
+    report = [await run_once(n, messages, chats) for n in workers]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--workers", default="1,2,4")
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.chats, [int(n) for n in args.workers.split(",")]))
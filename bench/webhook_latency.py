@@ -0,0 +1,97 @@
+"""Update-to-reply latency of long polling vs the webhook server, against FakeBotAPI.
+
+    python bench/webhook_latency.py [--updates 500] [--concurrency 50]
+
+Each update is a /start from its own private chat; latency runs from handing the
+update over (getUpdates queue or webhook POST) until the bot's reply reaches
+the fake API.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from fake_api import FakeBotAPI  # noqa: E402
+
+
+def start_update(update_id: int, user_id: int) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": "/start",
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    }}
+
+
+def summary(latencies: list[float], elapsed: float) -> dict:
+    ms = sorted(x * 1000 for x in latencies)
+    pick = lambda q: round(ms[min(len(ms) - 1, int(q * len(ms)))], 2)
+    return {"n": len(ms), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "updates_per_s": round(len(ms) / elapsed, 1)}
+
+
+async def drive(api: FakeBotAPI, deliver, n: int, concurrency: int, first_id: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with sem:
+            user_id = 1_000_000 + first_id + i
+            reply = api.wait_reply(user_id)
+            t0 = time.perf_counter()
+            await deliver(start_update(first_id + i, user_id))
+            latencies.append(await asyncio.wait_for(reply, 30) - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return summary(latencies, time.perf_counter() - started)
+
+
+async def main(n: int, concurrency: int, workers: int):
+    api = FakeBotAPI()
+    base = await api.start()
+    tmp = tempfile.mkdtemp()
+    os.environ.update(BOT_TOKEN="42:fake", TELEGRAM_API_URL=base, DB_PATH=os.path.join(tmp, "bench.db"),
+                      METRICS_PORT="0", WEBHOOK_PORT="0")
+    import bot as app  # reads the environment above
+    logging.getLogger().setLevel(logging.WARNING)  # per-update INFO lines would dominate the timings
+
+    report = {}
+    polling = asyncio.create_task(app.dp.start_polling(app.bot, handle_signals=False, close_bot_session=False))
+    await asyncio.sleep(0.2)
+    report["polling"] = await drive(api, lambda u: asyncio.sleep(0, api.push_update(u)), n, concurrency, 1)
+    await app.dp.stop_polling()
+    await polling
+
+    server = app.WebhookServer(app.dp, app.bot, secret="bench", workers=workers)
+    await server.start("127.0.0.1", 0)
+    port = server._runner.addresses[0][1]
+    async with aiohttp.ClientSession(headers={"X-Telegram-Bot-Api-Secret-Token": "bench"}) as http:
+        async def post(update):
+            async with http.post(f"http://127.0.0.1:{port}/webhook", json=update) as resp:
+                assert resp.status == 200, resp.status
+        report["webhook"] = await drive(api, post, n, concurrency, n + 1)
+    await server.stop()
+
+    await app.ingest.stop()
+    await app.bot.session.close()
+    app.db.close()
+    await api.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.concurrency, args.workers))
@@ -1,19 +1,33 @@
 
-import os, asyncio, time, csv
+import os, asyncio, time, html, io, sqlite3, signal
 import logging
+from typing import Optional
 from dotenv import load_dotenv
 from logging_config import setup_logging
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ChatType
-from aiogram.filters import Command, CommandStart
-from aiogram.types import Message, CallbackQuery
+from aiogram.filters import Command, CommandObject, CommandStart
+from aiogram.types import BufferedInputFile, Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 
 from db import DB
-from utils import extract_text_and_media, extract_male_ids
-from i18n import t
+from ingest import IngestQueue
+from export import export_csv, part_filename, summary_csv, SpooledInputFile
+from snapshot import make_snapshot, prune_snapshots, snapshot_parts
+from archive import ArchiveStore, maintain, parse_retention
+from delivery import Delivery
+from ratelimit import RateLimiter, parse_policies
+from webhook import WebhookServer
+import metrics
+from utils import ID_RE, extract_text_and_media, extract_male_ids, encode_cursor, decode_cursor, fts_query, message_link
+from i18n import t, RU, UK
+from router import PREFIX_RE, StateStore, TextRouter
+from idindex import IdIndex
+from watch import WatchDigest, WatchIndex, digest_lines, watch_list_messages
 
 # --------------- ENV & INIT ---------------
 load_dotenv()
@@ -25,16 +39,86 @@ OWNER_ID = int(os.getenv("OWNER_ID", "0"))
 LANG_DEFAULT = os.getenv("LANG", "ru")
 DB_PATH = os.getenv("DB_PATH", "./bot.db")
 EXTENSIONS = [m.strip() for m in (os.getenv("EXTENSIONS", "") or "").split(",") if m.strip()]
-
-db = DB(DB_PATH)
-if OWNER_ID:
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+INGEST_BATCH = int(os.getenv("INGEST_BATCH", "200"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "250"))
+EDIT_WINDOW_MS = int(os.getenv("EDIT_WINDOW_MS", "1000"))
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "0")) or None
+DB_SLOW_MS = float(os.getenv("DB_SLOW_MS", "200"))
+DB_LOG_SAMPLE = float(os.getenv("DB_LOG_SAMPLE", "1"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "gzip")
+SNAPSHOT_EXCLUDE = tuple(x.strip() for x in os.getenv("SNAPSHOT_EXCLUDE", "settings").split(",") if x.strip())
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+SNAPSHOT_INTERVAL_H = float(os.getenv("SNAPSHOT_INTERVAL_H", "0"))
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "7"))
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", "25"))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", "1"))
+DELIVERY_CHAT_BURST = float(os.getenv("DELIVERY_CHAT_BURST", "10"))
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+RATE_LIMIT_SAVE_S = float(os.getenv("RATE_LIMIT_SAVE_S", "60"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "0"))
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE = int(os.getenv("WEBHOOK_QUEUE", "1000"))
+WORKERS = int(os.getenv("WORKERS", "0"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_CHATS = parse_retention(os.getenv("RETENTION_CHATS", ""))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+MAINTENANCE_INTERVAL_H = float(os.getenv("MAINTENANCE_INTERVAL_H", "24"))
+TEXT_DEDUP = os.getenv("TEXT_DEDUP", "0") == "1"
+ID_INDEX_REFRESH_S = float(os.getenv("ID_INDEX_REFRESH_S", "30"))
+WATCH_DIGEST_S = float(os.getenv("WATCH_DIGEST_S", "60"))
+WATCH_LIMIT = int(os.getenv("WATCH_LIMIT", "5000"))
+BULK_MAX_IDS = int(os.getenv("BULK_MAX_IDS", "5000"))
+
+metrics.configure(slow_ms=DB_SLOW_MS, arg_sample=DB_LOG_SAMPLE)
+
+# set by supervisor.py: workers only read, every write goes to the supervisor's writer
+IS_WORKER = os.getenv("SUPERVISOR_WORKER") == "1"
+
+db = DB(DB_PATH, readers=DB_READERS, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL, dedup_texts=TEXT_DEDUP,
+        read_only=IS_WORKER)
+if OWNER_ID and not IS_WORKER:
     db.add_admin(OWNER_ID)
-
-bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+ingest = IngestQueue(db, batch_size=INGEST_BATCH, flush_ms=INGEST_FLUSH_MS, edit_window_ms=EDIT_WINDOW_MS)
+metrics.REGISTRY.add_collector("ingest", ingest.stats)
+metrics.REGISTRY.add_collector("cache", lambda: {
+    f"{name}_{kind}": getattr(getattr(db, f"{name}_cache"), kind)
+    for name in ("allowed", "admin", "lang") for kind in ("hits", "misses")
+})
+
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
 dp = Dispatcher()
+delivery = Delivery(bot, db, global_rate=DELIVERY_GLOBAL_RATE, chat_rate=DELIVERY_CHAT_RATE,
+                    chat_burst=DELIVERY_CHAT_BURST)
+limiter = RateLimiter(db, parse_policies(RATE_LIMITS))
+limiter.load()
+archives = ArchiveStore(ARCHIVE_DIR)
 
 PAGE_SIZE = 5
-ADM_PENDING: dict[int, str] = {}
+SUGGEST_LIMIT = 10
+# known IDs for prefix lookups and "did you mean"; loaded on startup, fed by ingest
+id_index = IdIndex()
+# what the admin was last prompted for (export IDs, female ID); one-shot, expires
+pending = StateStore(ttl=600)
+text_router = TextRouter((RU, UK), {
+    "menu_search": "search_menu",
+    "menu_mine": "my_queries",
+    "menu_admin": "admin_menu",
+    "menu_lang": "switch_lang",
+    "admin_search_female": "prompt_female",
+    "admin_stats": "stats",
+    "admin_export": "export_menu",
+}, pending)
 
 def lang_for(user_id: int) -> str:
     return db.get_user_lang(user_id) or LANG_DEFAULT
@@ -63,77 +147,381 @@ def has_access(message: Message) -> bool:
         return True
     return False  # ядро: доступ только админам; пользователей-список можно добавить расширением
 
+def role_for(user_id: int) -> str:
+    if is_superadmin(user_id):
+        return "owner"
+    return "admin" if is_admin(user_id) else "user"
+
+def rate_allowed(user_id: int, action: str) -> bool:
+    return limiter.allow(user_id, role_for(user_id), action)
+
 # --------------- BASIC ---------------
 @dp.message(CommandStart())
 async def start(message: Message):
     uid = message.from_user.id
-    db.upsert_user(uid, message.from_user.first_name or "", message.from_user.last_name or "", message.from_user.username or "", None)
+    await db.aio.upsert_user(uid, message.from_user.first_name or "", message.from_user.last_name or "", message.from_user.username or "", None)
     await message.answer(t(lang_for(uid), "start"), reply_markup=main_menu(uid))
 
-@dp.message(F.text.in_({"🌐 Язык: Русский", "🌐 Мова: Українська"}))
 async def switch_lang(message: Message):
     uid = message.from_user.id
     cur = lang_for(uid)
     new = "uk" if cur == "ru" else "ru"
-    db.set_user_lang(uid, new)
+    await db.aio.set_user_lang(uid, new)
     await message.answer(t(new, "menu_lang_set"), reply_markup=main_menu(uid))
 
+# --------------- EXPORT BY MALE ID ---------------
+async def export_male_csv(message: Message):
+    uid = message.from_user.id
+    if not is_admin(uid):
+        return
+    males = sorted(extract_male_ids(message.text))
+    if not males:
+        await message.answer(t(lang_for(uid), "bad_id"))
+        return
+    if not rate_allowed(uid, "export"):
+        await message.answer(t(lang_for(uid), "rate_limited"))
+        return
+    if not await send_export(uid, males):
+        await message.answer(t(lang_for(uid), "search_not_found"))
+
+async def send_export(uid: int, males: list[str]) -> bool:
+    """Sends the CSV parts of `males` to `uid`; False if they have no messages."""
+    parts = await db.aio.run(export_csv, db, males, EXPORT_FORMAT, write=False)
+    if not parts:
+        return False
+    label = males[0] if len(males) == 1 else f"{len(males)} ID"
+    try:
+        for i, f in enumerate(parts, 1):
+            caption = f"CSV для {label}" + (f" ({i}/{len(parts)})" if len(parts) > 1 else "")
+            await bot.send_document(uid, document=SpooledInputFile(f, part_filename(males, EXPORT_FORMAT, i, len(parts))),
+                                    caption=caption)
+    finally:
+        for f in parts:
+            f.close()
+    return True
+
 # --------------- SEARCH (MEN) ---------------
-@dp.message(F.text.in_({"🔍 Поиск по ID (мужчины)", "🔍 Пошук за ID (чоловіки)"}))
 async def search_menu_entry(message: Message):
     if not has_access(message):
         await message.answer(t(lang_for(message.from_user.id), "not_authorized"))
         return
     await message.answer(t(lang_for(message.from_user.id), "search_enter_id"))
 
-@dp.message(F.text.regexp(r"^\d{10}$"))
 async def male_search(message: Message):
     if not has_access(message):
         await message.answer(t(lang_for(message.from_user.id), "not_authorized"))
         return
     uid = message.from_user.id
-    if not db.rate_limit_allowed(uid, int(time.time())):
+    if not rate_allowed(uid, "search"):
         await message.answer(t(lang_for(uid), "rate_limited"))
         return
     male = message.text.strip()
-    db.log_search(uid, "male", male)
-    await send_results(message, male, 0)
+    await db.aio.log_search(uid, "male", male)
+    await send_results(message, male)
 
-async def send_results(message: Message, male_id: str, offset: int):
+def id_buttons(ids: list[str]):
+    kb = InlineKeyboardBuilder()
+    for male_id in ids:
+        kb.button(text=male_id, callback_data=f"sid:{male_id}")
+    kb.adjust(2)
+    return kb.as_markup()
+
+async def male_prefix(message: Message):
     uid = message.from_user.id
+    if not has_access(message):
+        await message.answer(t(lang_for(uid), "not_authorized"))
+        return
+    if not rate_allowed(uid, "search"):
+        await message.answer(t(lang_for(uid), "rate_limited"))
+        return
     lang = lang_for(uid)
-    total = db.count_by_male(male_id)
-    rows = db.search_by_male(male_id, limit=PAGE_SIZE, offset=offset)
+    prefix = PREFIX_RE.fullmatch(message.text.strip()).group(1)
+    await db.aio.log_search(uid, "prefix", prefix)
+    count, first = id_index.prefix(prefix, SUGGEST_LIMIT)
+    if not count:
+        await message.answer(t(lang, "prefix_none", prefix=prefix))
+        return
+    text = t(lang, "prefix_found", prefix=prefix, count=count)
+    if count > len(first):
+        text += "\n" + t(lang, "prefix_first", shown=len(first))
+    await message.answer(text, reply_markup=id_buttons(first))
+
+@dp.callback_query(F.data.startswith("sid:"))
+async def cb_suggested_id(call: CallbackQuery):
+    uid = call.from_user.id
+    if not is_admin(uid):
+        await call.answer(t(lang_for(uid), "not_authorized"))
+        return
+    if not rate_allowed(uid, "search"):
+        await call.answer(t(lang_for(uid), "rate_limited"))
+        return
+    male = call.data.split(":", 1)[1]
+    await db.aio.log_search(uid, "male", male)
+    await send_results(call.message, male)
+    await call.answer()
+
+async def send_results(message: Message, male_id: str, before: Optional[tuple[int, int]] = None,
+                       shown: int = 0, offset: int = 0):
+    uid = message.chat.id  # also right for "more" callbacks, where message is the bot's own
+    lang = lang_for(uid)
+    total = await db.aio.count_by_male(male_id)
+    rows = await db.aio.search_by_male(male_id, limit=PAGE_SIZE, offset=offset, before=before)
+    if not offset:  # archived months are merged in by keyset; old offset buttons see the hot rows only
+        rows = await db.aio.run(archives.search, db, male_id, PAGE_SIZE, before, rows, write=False)
     if not rows:
-        await message.answer(t(lang, "search_not_found"))
+        similar = id_index.similar(male_id, SUGGEST_LIMIT) if not shown else []
+        if similar:
+            await message.answer(t(lang, "search_suggest"), reply_markup=id_buttons(similar))
+        else:
+            await message.answer(t(lang, "search_not_found"))
         return
-    for row in rows:
-        try:
-            await bot.copy_message(chat_id=uid, from_chat_id=row["chat_id"], message_id=row["message_id"])
-        except Exception:
-            await message.answer(row["text"] or "(no text)")
-    new_offset = offset + PAGE_SIZE
-    if new_offset < total:
+    await delivery.send_rows(uid, rows)
+    shown += len(rows)
+    if shown < total:
+        last = rows[-1]
         kb = InlineKeyboardBuilder()
-        kb.button(text=t(lang, "more"), callback_data=f"more:{male_id}:{new_offset}")
-        await message.answer(f"{new_offset}/{total}", reply_markup=kb.as_markup())
+        kb.button(text=t(lang, "more"), callback_data=f"more:{male_id}:{encode_cursor(last['date'], last['id'], shown)}")
+        await message.answer(f"{shown}/{total}", reply_markup=kb.as_markup())
     else:
         await message.answer(f"{total}/{total}")
 
 @dp.callback_query(F.data.startswith("more:"))
 async def cb_more(call: CallbackQuery):
-    _, male_id, off = call.data.split(":")
-    await send_results(call.message, male_id, int(off))
+    if not rate_allowed(call.from_user.id, "more"):
+        await call.answer(t(lang_for(call.from_user.id), "rate_limited"))
+        return
+    _, male_id, cursor = call.data.split(":")
+    if "." in cursor:
+        date, msg_id, shown = decode_cursor(cursor)
+        await send_results(call.message, male_id, before=(date, msg_id), shown=shown)
+    else:  # buttons sent before cursor pagination carry a plain offset
+        await send_results(call.message, male_id, shown=int(cursor), offset=int(cursor))
     await call.answer()
 
+# --------------- BULK LOOKUP ---------------
+BULK_SHOWN = 30
+BULK_FILE_LIMIT = 1024 * 1024
+# found IDs of each admin's last bulk lookup, for the "all messages" button
+bulk_results = StateStore(ttl=600)
+
+def ids_in_order(text: str) -> list[str]:
+    return list(dict.fromkeys(m.group(1) for m in ID_RE.finditer(text or "")))
+
+async def bulk_lookup(message: Message, male_ids: list[str]):
+    """One aggregated query for all IDs; a summary message plus a CSV file when it doesn't fit."""
+    uid = message.from_user.id
+    lang = lang_for(uid)
+    if not has_access(message):
+        await message.answer(t(lang, "not_authorized"))
+        return
+    if not male_ids:
+        await message.answer(t(lang, "bulk_usage"))
+        return
+    if len(male_ids) > BULK_MAX_IDS:
+        await message.answer(t(lang, "bulk_too_many", limit=BULK_MAX_IDS))
+        return
+    if not rate_allowed(uid, "bulk"):
+        await message.answer(t(lang, "rate_limited"))
+        return
+    await db.aio.log_search(uid, "bulk", f"{len(male_ids)} ID")
+    rows = await db.aio.get_male_stats_many(male_ids)
+    found = [r for r in rows if r["msg_count"]]
+    missing = [r["male_id"] for r in rows if not r["msg_count"]]
+    lines = [t(lang, "bulk_summary", total=len(rows), found=len(found), missing=len(missing))]
+    for r in found[:BULK_SHOWN]:
+        last = time.strftime("%Y-%m-%d", time.localtime(r["last_date"])) if r["last_date"] else "?"
+        lines.append(t(lang, "bulk_line", id=r["male_id"], count=r["msg_count"], chats=r["chat_count"], last=last))
+    if len(found) > BULK_SHOWN:
+        lines.append(t(lang, "bulk_more", n=len(found) - BULK_SHOWN))
+    if missing and len(missing) <= BULK_SHOWN:
+        lines.append(t(lang, "bulk_missing", ids=" ".join(missing)))
+    markup = None
+    if found:
+        bulk_results.set(uid, [r["male_id"] for r in found])
+        kb = InlineKeyboardBuilder()
+        kb.button(text=t(lang, "bulk_report"), callback_data="bulk:report")
+        markup = kb.as_markup()
+    await message.answer("\n".join(lines), reply_markup=markup)
+    if len(found) > BULK_SHOWN or len(missing) > BULK_SHOWN:
+        await message.answer_document(BufferedInputFile(summary_csv(rows), filename=f"bulk_{len(rows)}_ids.csv"))
+
+async def male_bulk(message: Message):
+    await bulk_lookup(message, ids_in_order(message.text))
+
+@dp.message(Command("bulk"))
+async def bulk_cmd(message: Message, command: CommandObject):
+    await bulk_lookup(message, ids_in_order(command.args))
+
+@dp.message(F.chat.type == ChatType.PRIVATE, F.document.file_name.regexp(r"(?i).+\.(txt|csv)$"))
+async def bulk_file(message: Message):
+    uid = message.from_user.id
+    if not has_access(message):
+        await message.answer(t(lang_for(uid), "not_authorized"))
+        return
+    if (message.document.file_size or 0) > BULK_FILE_LIMIT:
+        await message.answer(t(lang_for(uid), "bulk_bad_file", mb=BULK_FILE_LIMIT // (1024 * 1024)))
+        return
+    data = await bot.download(message.document, destination=io.BytesIO())
+    await bulk_lookup(message, ids_in_order(data.getvalue().decode("utf-8", errors="ignore")))
+
+@dp.callback_query(F.data == "bulk:report")
+async def cb_bulk_report(call: CallbackQuery):
+    uid = call.from_user.id
+    if not is_admin(uid):
+        await call.answer(t(lang_for(uid), "not_authorized"))
+        return
+    males = bulk_results.get(uid)
+    if not males:
+        await call.answer(t(lang_for(uid), "bulk_expired"))
+        return
+    if not rate_allowed(uid, "export"):
+        await call.answer(t(lang_for(uid), "rate_limited"))
+        return
+    await call.answer("OK")
+    if not await send_export(uid, sorted(males)):
+        await call.message.answer(t(lang_for(uid), "search_not_found"))
+
+# --------------- WATCHLISTS ---------------
+watches = WatchIndex()
+watches.load(db.load_watches())
+# other processes' /watch and /unwatch arrive as cache invalidations (supervisor mode)
+db.on_invalidate(("add_watches", "remove_watches"), lambda: watches.load(db.load_watches()))
+
+def render_digest(user_id: int, items: list, dropped: int) -> str:
+    lang = lang_for(user_id)
+    lines = [t(lang, "watch_digest")]
+    lines += digest_lines(items, lambda chat_id: (db.get_allowed_chat(chat_id) or {"title": None})["title"])
+    if dropped:
+        lines.append(t(lang, "watch_digest_more", n=dropped))
+    return "\n".join(lines)
+
+digest = WatchDigest(delivery, render_digest, interval=WATCH_DIGEST_S)
+metrics.REGISTRY.add_collector("watch", lambda: {"subscriptions": len(watches), **digest.stats()})
+
+@dp.message(Command("watch"))
+async def watch_cmd(message: Message, command: CommandObject):
+    uid = message.from_user.id
+    if not is_admin(uid):
+        await message.answer(t(lang_for(uid), "admin_only"))
+        return
+    ids = extract_male_ids(command.args or "")
+    if not ids:
+        await message.answer(t(lang_for(uid), "watch_usage"))
+        return
+    current = await db.aio.list_watches(uid)
+    if len(set(current) | set(ids)) > WATCH_LIMIT:
+        await message.answer(t(lang_for(uid), "watch_limit", limit=WATCH_LIMIT))
+        return
+    added = await db.aio.add_watches(uid, ids)
+    watches.add(uid, ids)
+    await message.answer(t(lang_for(uid), "watch_added", added=added, total=len(set(current) | set(ids))))
+
+@dp.message(Command("unwatch"))
+async def unwatch_cmd(message: Message, command: CommandObject):
+    uid = message.from_user.id
+    if not is_admin(uid):
+        await message.answer(t(lang_for(uid), "admin_only"))
+        return
+    args = (command.args or "").strip()
+    ids = None if args == "all" else extract_male_ids(args)
+    if ids is not None and not ids:
+        await message.answer(t(lang_for(uid), "watch_usage"))
+        return
+    current = await db.aio.list_watches(uid)
+    removed = await db.aio.remove_watches(uid, ids)
+    watches.remove(uid, current if ids is None else ids)
+    await message.answer(t(lang_for(uid), "unwatch_done", removed=removed, total=len(current) - removed))
+
+@dp.message(Command("watches"))
+async def watches_cmd(message: Message):
+    uid = message.from_user.id
+    if not is_admin(uid):
+        await message.answer(t(lang_for(uid), "admin_only"))
+        return
+    ids = await db.aio.list_watches(uid)
+    if not ids:
+        await message.answer(t(lang_for(uid), "watches_empty"))
+        return
+    for text in watch_list_messages(t(lang_for(uid), "watches_list", total=len(ids)), ids):
+        await message.answer(text)
+
+# --------------- FULL-TEXT SEARCH ---------------
+find_queries = StateStore(ttl=3600)  # last /find query per user, for "more"
+
+@dp.message(Command("find"))
+async def find_text(message: Message, command: CommandObject):
+    uid = message.from_user.id
+    if not has_access(message):
+        await message.answer(t(lang_for(uid), "not_authorized"))
+        return
+    query = fts_query(command.args or "")
+    if not query:
+        await message.answer(t(lang_for(uid), "find_usage"))
+        return
+    if not rate_allowed(uid, "search"):
+        await message.answer(t(lang_for(uid), "rate_limited"))
+        return
+    if backfill := await db.aio.fts_backfill_state():
+        after, upto = backfill
+        await message.answer(t(lang_for(uid), "find_pending", pct=100 * after // max(upto, 1)))
+        return
+    await db.aio.log_search(uid, "text", command.args.strip())
+    find_queries.set(uid, query)
+    await send_text_results(message, query, 0)
+
+async def send_text_results(message: Message, query: str, offset: int):
+    uid = message.chat.id
+    lang = lang_for(uid)
+    try:
+        rows = await db.aio.search_text(query, limit=PAGE_SIZE + 1, offset=offset)
+    except sqlite3.OperationalError:
+        logger.warning("Bad FTS query %r", query)
+        rows = []
+    if not rows:
+        await message.answer(t(lang, "find_not_found"))
+        return
+    lines = []
+    for i, r in enumerate(rows[:PAGE_SIZE], offset + 1):
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["date"])) if r["date"] else "?"
+        link = message_link(r["chat_id"], r["message_id"])
+        head = f"{i}. {when} • " + (f'<a href="{link}">{r["chat_id"]}</a>' if link else str(r["chat_id"]))
+        if r["sender_username"]:
+            head += f" • @{html.escape(r['sender_username'])}"
+        snippet = html.escape(r["snippet"] or "").replace("\x02", "<b>").replace("\x03", "</b>")
+        lines.append(f"{head}\n{snippet}")
+    kb = None
+    if len(rows) > PAGE_SIZE:
+        kb = InlineKeyboardBuilder()
+        kb.button(text=t(lang, "more"), callback_data=f"find:{offset + PAGE_SIZE}")
+    await message.answer("\n\n".join(lines), reply_markup=kb.as_markup() if kb else None,
+                         disable_web_page_preview=True)
+
+@dp.callback_query(F.data.startswith("find:"))
+async def cb_find_more(call: CallbackQuery):
+    if not rate_allowed(call.from_user.id, "more"):
+        await call.answer(t(lang_for(call.from_user.id), "rate_limited"))
+        return
+    query = find_queries.get(call.from_user.id)
+    if query:
+        await send_text_results(call.message, query, int(call.data.split(":")[1]))
+    await call.answer()
+
+@dp.message(Command("rebuild_fts"))
+async def rebuild_fts(message: Message):
+    uid = message.from_user.id
+    if not is_superadmin(uid):
+        await message.answer(t(lang_for(uid), "only_superadmin"))
+        return
+    await db.aio.rebuild_fts()
+    await message.answer(t(lang_for(uid), "done"))
+
 # --------------- MY QUERIES ---------------
-@dp.message(F.text.in_({"🧾 Мои запросы", "🧾 Мої запити"}))
 async def my_queries(message: Message):
     if not has_access(message):
         await message.answer(t(lang_for(message.from_user.id), "not_authorized"))
         return
     uid = message.from_user.id
-    logs = db.get_user_searches(uid, 10)
+    logs = await db.aio.get_user_searches(uid, 10)
     if not logs:
         await message.answer("—")
         return
@@ -141,7 +529,6 @@ async def my_queries(message: Message):
     await message.answer("\n".join(lines))
 
 # --------------- ADMIN MENU ---------------
-@dp.message(F.text.in_({"⚙️ Админ", "⚙️ Адмін"}))
 async def admin_menu(message: Message):
     uid = message.from_user.id
     if not is_admin(uid):
@@ -158,37 +545,65 @@ async def admin_menu(message: Message):
     kb.adjust(2,2,2,1)
     await message.answer(t(lang, "admin_menu"), reply_markup=kb.as_markup(resize_keyboard=True))
 
-@dp.message(F.text.in_({"🔎 Поиск по женскому ID (из названия группы)", "🔎 Пошук за жіночим ID (з назви групи)"}))
 async def prompt_female(message: Message):
     uid = message.from_user.id
     if not is_admin(uid):
         await message.answer(t(lang_for(uid), "admin_only"))
         return
+    pending.set(uid, "female_search")
     await message.answer(t(lang_for(uid), "enter_female_id"))
 
-@dp.message(F.text.regexp(r"^f:\d{10}$|^\d{10}$"))
 async def handle_female_search(message: Message):
     uid = message.from_user.id
     if not is_admin(uid):
         return
-    female_id = message.text[-10:]
-    chats = [c for c in db.list_allowed_chats() if c["female_id"] == female_id]
+    female_id = ID_RE.search(message.text).group(1)
+    chats = [c for c in await db.aio.list_allowed_chats() if c["female_id"] == female_id]
     if not chats:
         await message.answer("Нет разрешённых чатов с таким женским ID.")
         return
     lines = [f"{c['title']} (chat_id={c['chat_id']})" for c in chats]
     await message.answer("\n".join(lines))
 
-@dp.message(F.text.in_({"📊 Статистика", "📊 Статистика"}))
 async def stats(message: Message):
     uid = message.from_user.id
     if not is_admin(uid):
         await message.answer(t(lang_for(uid), "admin_only"))
         return
-    men, msgs, chats = db.count_stats()
+    men, msgs, chats = await db.aio.count_stats()
     await message.answer(t(lang_for(uid), "stats", men=men, msgs=msgs, chats=chats))
 
-@dp.message(F.text.in_({"💾 Экспорт", "💾 Експорт"}))
+@dp.message(Command("rebuild_stats"))
+async def rebuild_stats(message: Message):
+    uid = message.from_user.id
+    if not is_superadmin(uid):
+        await message.answer(t(lang_for(uid), "only_superadmin"))
+        return
+    men, msgs, chats = await db.aio.rebuild_stats()
+    await message.answer(t(lang_for(uid), "stats", men=men, msgs=msgs, chats=chats))
+
+@dp.message(Command("dbstats"))
+async def db_stats(message: Message):
+    uid = message.from_user.id
+    if not is_admin(uid):
+        await message.answer(t(lang_for(uid), "admin_only"))
+        return
+    await message.answer(f"<pre>{metrics.REGISTRY.render_text()[:4000]}</pre>")
+
+@dp.message(Command("maintenance"))
+async def maintenance_cmd(message: Message, command: CommandObject):
+    uid = message.from_user.id
+    if not is_superadmin(uid):
+        await message.answer(t(lang_for(uid), "only_superadmin"))
+        return
+    # "/maintenance full" once converts an old database to incremental vacuum
+    report = await run_maintenance(vacuum_pages=-1 if (command.args or "").strip() == "full" else 0)
+    mb = lambda n: round(n / 1048576, 1)
+    await message.answer(t(lang_for(uid), "maintenance_report", archived=report["archived"],
+                           db_mb=mb(report["db_bytes"]), wal_mb=mb(report["wal_bytes"]),
+                           reclaimed_mb=mb(report["reclaimed_db_bytes"] + report["reclaimed_wal_bytes"]),
+                           free_pages=report["free_pages"]))
+
 async def export_menu(message: Message):
     uid = message.from_user.id
     if not is_admin(uid):
@@ -207,33 +622,57 @@ async def cb_export(call: CallbackQuery):
         return
     kind = call.data.split(":")[1]
     if kind == "male":
-        ADM_PENDING[uid] = "export_male"
+        pending.set(uid, "export_male")
         await call.message.answer(t(lang_for(uid), "enter_male_id"))
         await call.answer("")
+    elif not rate_allowed(uid, "export"):
+        await call.answer(t(lang_for(uid), "rate_limited"))
     else:
-        await bot.send_document(uid, document=open(DB_PATH, "rb"), caption="DB dump (SQLite)")
         await call.answer("OK")
-
-@dp.message(F.text.regexp(r"^\d{10}$"))
-async def export_male_csv(message: Message):
-    uid = message.from_user.id
-    if ADM_PENDING.get(uid) != "export_male":
-        return
-    ADM_PENDING.pop(uid, None)
-    male = message.text.strip()
-    rows = db.search_by_male(male, limit=10**9, offset=0)
-    if not rows:
-        await message.answer(t(lang_for(uid), "search_not_found"))
-        return
-    fname = f"export_{male}.csv"
-    with open(fname, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["chat_id","message_id","date","text","media_type","sender_id","sender_username","male_id"])
-        for r in rows:
-            w.writerow([r["chat_id"], r["message_id"], r["date"], (r["text"] or "").replace("\n"," "), r["media_type"], r["sender_id"], r["sender_username"], r["male_id"]])
-    await bot.send_document(uid, document=open(fname, "rb"), caption=f"CSV для {male}")
+        path = await asyncio.to_thread(make_snapshot, DB_PATH, None, SNAPSHOT_EXCLUDE)
+        try:
+            for part in snapshot_parts(path):
+                await bot.send_document(uid, document=part, caption="DB dump (SQLite, gzip)")
+        finally:
+            path.unlink(missing_ok=True)
+
+# --------------- PRIVATE TEXT ROUTER ---------------
+PRIVATE_ACTIONS = {
+    "switch_lang": switch_lang,
+    "search_menu": search_menu_entry,
+    "male_search": male_search,
+    "male_prefix": male_prefix,
+    "male_bulk": male_bulk,
+    "female_search": handle_female_search,
+    "export_male": export_male_csv,
+    "my_queries": my_queries,
+    "admin_menu": admin_menu,
+    "prompt_female": prompt_female,
+    "stats": stats,
+    "export_menu": export_menu,
+}
+
+# one dict lookup per DM; texts the router doesn't know fall through to extensions
+@dp.message(F.chat.type == ChatType.PRIVATE, text_router)
+async def on_private_text(message: Message, action: str):
+    await PRIVATE_ACTIONS[action](message)
 
 # --------------- GROUP LISTENERS ---------------
+def message_row(message: Message, text: str, media_type: str, file_id: str) -> dict:
+    u = message.from_user
+    return dict(
+        chat_id=message.chat.id,
+        message_id=message.message_id,
+        sender_id=u.id if u else None,
+        sender_username=u.username if u else None,
+        sender_first_name=u.first_name if u else None,
+        date=int(message.date.timestamp()),
+        text=text,
+        media_type=media_type,
+        file_id=file_id,
+        is_forward=1 if (message.forward_from or message.forward_from_chat) else 0,
+    )
+
 @dp.message(F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}))
 async def on_group_message(message: Message):
     if db.get_allowed_chat(message.chat.id) is None:
@@ -244,33 +683,22 @@ async def on_group_message(message: Message):
     male_ids = extract_male_ids(text)
     if not male_ids:
         return
-    msg_db_id = db.save_message(
-        chat_id=message.chat.id,
-        message_id=message.message_id,
-        sender_id=message.from_user.id if message.from_user else None,
-        sender_username=message.from_user.username if message.from_user else None,
-        sender_first_name=message.from_user.first_name if message.from_user else None,
-        date=int(message.date.timestamp()),
-        text=text,
-        media_type=media_type,
-        file_id=file_id,
-        is_forward=1 if (message.forward_from or message.forward_from_chat) else 0,
-    )
-    db.link_male_ids(msg_db_id, male_ids)
+    await ingest.put(message_row(message, text, media_type, file_id), male_ids)
+    id_index.add(male_ids)
+    if matches := watches.match(male_ids):
+        digest.add(matches, message.chat.id, message.message_id)
 
 @dp.edited_message(F.chat.type.in_({ChatType.GROUP, ChatType.SUPERGROUP}))
 async def on_group_edited(message: Message):
     if db.get_allowed_chat(message.chat.id) is None:
         return
     text, media_type, file_id, is_forward = extract_text_and_media(message)
-    msg_row = db.conn.execute("SELECT id FROM messages WHERE chat_id=? AND message_id=?", (message.chat.id, message.message_id)).fetchone()
-    if not msg_row:
-        return
-    msg_db_id = msg_row["id"]
-    db.update_message_text(message.chat.id, message.message_id, text or "")
-    db.unlink_all_male_ids(msg_db_id)
+    # coalesced and applied as a diff; an edit that adds the first ID indexes the message
     male_ids = extract_male_ids(text or "")
-    db.link_male_ids(msg_db_id, male_ids)
+    await ingest.put_edit(message_row(message, text or "", media_type, file_id), male_ids)
+    id_index.add(male_ids)
+    if matches := watches.match(male_ids):
+        digest.add(matches, message.chat.id, message.message_id)
 
 # --------------- EXTENSIONS LOADER ---------------
 def load_extensions():
@@ -284,10 +712,117 @@ def load_extensions():
         except Exception as e:
             logger.error(f"[ext] error loading {mod}: {e}")
 
+# --------------- BACKGROUND JOBS ---------------
+async def snapshot_loop():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_H * 3600)
+        try:
+            await asyncio.to_thread(make_snapshot, DB_PATH, SNAPSHOT_DIR, SNAPSHOT_EXCLUDE)
+            prune_snapshots(SNAPSHOT_DIR, SNAPSHOT_KEEP)
+        except Exception:
+            logger.exception("Scheduled snapshot failed")
+
+async def fts_backfill_loop(pause: float = 0.05):
+    """Indexes messages that predate the full-text index, a batch at a time; /find waits for it."""
+    if await db.aio.fts_backfill_state() is None:
+        return
+    started = time.monotonic()
+    while True:
+        try:
+            progress = await db.aio.fts_backfill_batch()
+        except Exception:
+            logger.exception("FTS backfill batch failed")
+            await asyncio.sleep(60)
+            continue
+        if progress is None:
+            logger.info("FTS backfill done in %.0fs", time.monotonic() - started)
+            return
+        await asyncio.sleep(pause)  # lets ingest and edits in between batches
+
+async def id_index_loop():
+    while True:
+        await asyncio.sleep(ID_INDEX_REFRESH_S)
+        try:
+            await asyncio.to_thread(id_index.refresh, db)  # IDs ingested by other processes
+        except Exception:
+            logger.exception("ID index refresh failed")
+
+id_index_job: Optional[asyncio.Task] = None
+
+@dp.startup()
+async def on_startup():
+    global id_index_job
+    logger.info("ID index: %s", await asyncio.to_thread(id_index.load, db))
+    if ID_INDEX_REFRESH_S > 0:
+        id_index_job = asyncio.create_task(id_index_loop())
+    digest.start()
+
+@dp.shutdown()
+async def on_shutdown():
+    if id_index_job:
+        id_index_job.cancel()
+    await digest.stop()  # sends what is pending
+
+def maintenance_job(vacuum_pages: int = 0) -> dict:
+    """Archives what is past retention, drops unused texts, then vacuums and checkpoints.
+    Blocking; archiving takes the write lock per batch, so ingest keeps going in between."""
+    report = archives.archive(db, RETENTION_DAYS, RETENTION_CHATS)
+    report["texts_removed"] = db.gc_texts()
+    report.update(maintain(db, vacuum_pages))
+    return report
+
+async def run_maintenance(vacuum_pages: int = 0) -> dict:
+    if IS_WORKER:  # the supervisor owns the writer connection
+        return await db.aio.run(maintenance_job, vacuum_pages)
+    return await asyncio.to_thread(maintenance_job, vacuum_pages)
+
+async def maintenance_loop():
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL_H * 3600)
+        try:
+            await run_maintenance()
+        except Exception:
+            logger.exception("Scheduled maintenance failed")
+
+async def run_webhook():
+    server = WebhookServer(dp, bot, WEBHOOK_PATH, WEBHOOK_SECRET or None, WEBHOOK_WORKERS, WEBHOOK_QUEUE)
+    metrics.REGISTRY.add_collector("webhook", server.stats)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await dp.emit_startup(bot=bot)
+    await server.start(WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_URL or None)
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+
 # --------------- ENTRYPOINT ---------------
 async def main():
     load_extensions()
-    await dp.start_polling(bot)
+    ingest.start()
+    limiter.start(RATE_LIMIT_SAVE_S)
+    metrics_runner = await metrics.start_http(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    jobs = [asyncio.create_task(snapshot_loop())] if SNAPSHOT_INTERVAL_H > 0 else []
+    jobs.append(asyncio.create_task(fts_backfill_loop()))
+    if MAINTENANCE_INTERVAL_H > 0:
+        jobs.append(asyncio.create_task(maintenance_loop()))
+    try:
+        if WEBHOOK_PORT:
+            await run_webhook()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        for job in jobs:
+            job.cancel()
+        await ingest.stop()
+        await limiter.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -4,54 +4,286 @@ from pathlib import Path
 from typing import Optional
 
 import re
+import json
+import asyncio
 import logging
 import functools
-import inspect
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import profiled
+from textstore import MAX_DICTS, MIN_DEDUP_LEN, TextCodec, text_hash
 
 logger = logging.getLogger(__name__)
 
 
-def log_call(func):
+def reader(func):
+    """Marks a read-only method: AsyncDB runs it on the reader pool."""
+    func._db_read = True
+    return func
+
+
+def invalidating(func):
+    """Marks a write that invalidates lookup caches, so other processes drop theirs too."""
+    func._db_invalidates = True
+    return func
+
+
+def writer(func):
+    """Serializes writes on the shared writer connection."""
     @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        bound = inspect.signature(func).bind(*args, **kwargs)
-        bound.apply_defaults()
-        params = {k: v for k, v in bound.arguments.items() if k != "self"}
-        logger.info("Calling %s with %s", func.__name__, params)
-        try:
-            return func(*args, **kwargs)
-        except Exception:
-            logger.exception("Error in %s", func.__name__)
-            raise
+    def wrapper(self, *args, **kwargs):
+        with self.write_lock:
+            return func(self, *args, **kwargs)
     return wrapper
 
+
+_MISS = object()
+
+
+class LookupCache:
+    """Thread-safe LRU for hot lookups with an optional TTL (seconds)."""
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl or None
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._gen = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return _MISS
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is not _MISS:
+            return value
+        gen = self._gen
+        value = loader()
+        with self._lock:
+            # an invalidation raced with the load: don't cache a possibly stale value
+            if gen == self._gen:
+                self._data[key] = (value, time.monotonic() + self.ttl if self.ttl else None)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, key=_MISS):
+        with self._lock:
+            self._gen += 1
+            if key is _MISS:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+
+# messages columns with the body decoded from `texts` when it was deduplicated (textstore.py)
+MESSAGE_FIELDS = """m.id, m.chat_id, m.message_id, m.sender_id, m.sender_username, m.sender_first_name, m.date,
+    coalesce(m.text, (SELECT inflate(body) FROM texts WHERE hash = m.text_hash)) AS text,
+    m.media_type, m.file_id, m.is_forward"""
+
+
+# unlinking by message (edits, deletes, archiving); the TEXT table has its UNIQUE index for that
+LINKS_BY_MESSAGE_INDEX = "CREATE INDEX IF NOT EXISTS idx_links_msg ON message_male_ids(message_id_ref)"
+# TEXT table only (before migrate_ids.py): keyset search and the migration copy read links in this
+# order; the INTEGER table is clustered on its (male_id, message_id_ref) primary key instead
+TEXT_LINKS_INDEX = "CREATE INDEX IF NOT EXISTS idx_male_ref ON message_male_ids(male_id, message_id_ref)"
+
+
+def schema_statements(names: Optional[tuple[str, ...]] = None) -> list[str]:
+    """CREATE statements from messages.sql (only those of the named objects, if given), in file order."""
+    sql = Path(__file__).with_name("messages.sql").read_text(encoding="utf-8")
+    out, buf = [], ""
+    for line in sql.splitlines(keepends=True):
+        if not buf and (not line.strip() or line.lstrip().startswith("--")):
+            continue
+        buf += line
+        if sqlite3.complete_statement(buf):
+            words = buf.split()
+            if words[0].upper() == "CREATE" and (names is None or any(w in names for w in words[1:7])):
+                out.append(buf.strip())
+            buf = ""
+    return out
+
+
+def _normalized(sql: str) -> str:
+    """Trigger SQL as SQLite stores it (no IF NOT EXISTS, no final ';'), whitespace collapsed."""
+    return " ".join(re.sub(r"(?i)\bIF NOT EXISTS\s+", "", sql).rstrip(";").split())
+
+
+def integer_male_ids(conn: sqlite3.Connection) -> bool:
+    """Whether message_male_ids has the INTEGER schema (False: from before migrate_ids.py)."""
+    for r in conn.execute("PRAGMA table_info(message_male_ids)"):
+        if r[1] == "male_id":
+            return r[2].upper() == "INTEGER"
+    return False
+
+
 class DB:
-    @log_call
-    def __init__(self, path: str):
+    @profiled
+    def __init__(self, path: str, readers: int = 4, cache_size: int = 10000, cache_ttl: Optional[float] = None,
+                 dedup_texts: bool = False, read_only: bool = False):
+        """read_only: for supervisor workers, whose writes run in the supervisor (AsyncDB.route_writes);
+        the schema is left to the process that owns the writer connection."""
         self.path = Path(path)
-        self.conn = sqlite3.connect(self.path)
+        if read_only:
+            self.conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
-        self.ensure_schema()
+        self.dedup_texts = dedup_texts
+        self.texts = TextCodec(self._load_text_dicts)
+        self.conn.create_function("inflate", 1, self.texts.inflate, deterministic=True)
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._read_conns: list[sqlite3.Connection] = []
+        # allowed chats, admins and user languages are checked on every update
+        self.allowed_cache = LookupCache(cache_size, cache_ttl)
+        self.admin_cache = LookupCache(cache_size, cache_ttl)
+        self.lang_cache = LookupCache(cache_size, cache_ttl)
+        # write method name -> reloads of other in-memory state, run by invalidate_caches()
+        self.invalidation_hooks: dict[str, list] = {}
+        if read_only:
+            self.texts.load()
+        else:
+            self.ensure_schema()
+        self.aio = AsyncDB(self, readers)
+
+    @property
+    def rconn(self) -> sqlite3.Connection:
+        """Read-only WAL connection of the current thread, so reads never wait for the writer."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if str(self.path) == ":memory:":
+                return self.conn
+            conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.create_function("inflate", 1, self.texts.inflate, deterministic=True)
+            self._local.conn = conn
+            with self.write_lock:
+                self._read_conns.append(conn)
+        return conn
 
-    @log_call
+    def _load_text_dicts(self) -> list:
+        """Own connection: the codec may ask for a new dictionary from inside a running query."""
+        if str(self.path) == ":memory:":
+            return self.conn.execute("SELECT id, dict FROM text_dicts").fetchall()
+        conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT id, dict FROM text_dicts").fetchall()
+        finally:
+            conn.close()
+
+    def on_invalidate(self, methods: tuple[str, ...], hook):
+        """Runs hook() when another process reports one of these writes (supervisor mode)."""
+        for name in methods:
+            self.invalidation_hooks.setdefault(name, []).append(hook)
+
+    def invalidate_caches(self, method: Optional[str] = None):
+        """Drops the lookup caches after `method` ran elsewhere, and runs that write's hooks."""
+        for cache in (self.allowed_cache, self.admin_cache, self.lang_cache):
+            cache.invalidate()
+        for hook in self.invalidation_hooks.get(method, ()):
+            try:
+                hook()
+            except Exception:
+                logger.exception("Invalidation hook %r failed", hook)
+
+    def close(self):
+        self.aio.close()
+        for conn in self._read_conns:
+            conn.close()
+        self._read_conns.clear()
+        self.conn.close()
+
+    @profiled
+    @writer
     def ensure_schema(self):
-        sql = Path("messages.sql").read_text(encoding="utf-8")
+        sql = Path(__file__).with_name("messages.sql").read_text(encoding="utf-8")
+        columns = {r["name"] for r in self.conn.execute("PRAGMA table_info(messages)")}
+        if columns and "text_hash" not in columns:
+            # databases from before content-addressed texts: add the column, and let the
+            # script below recreate the FTS view/triggers that now read bodies from `texts`
+            with self.conn:
+                self.conn.execute("ALTER TABLE messages ADD COLUMN text_hash BLOB")
+                for name in ("trg_fts_ins", "trg_fts_del", "trg_fts_upd"):
+                    self.conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                self.conn.execute("DROP VIEW IF EXISTS messages_fts_src")
         self.conn.executescript(sql)
+        self.conn.execute(LINKS_BY_MESSAGE_INDEX if integer_male_ids(self.conn) else TEXT_LINKS_INDEX)
         self.conn.commit()
+        self._sync_triggers()
+        self.texts.load()
+        if self.conn.execute("SELECT 1 FROM settings WHERE key='stats:built'").fetchone() is None:
+            # aggregates appeared after data was already collected
+            self.rebuild_stats()
+        if self.conn.execute("SELECT 1 FROM settings WHERE key='fts:built'").fetchone() is None:
+            # the index appeared after data was already collected: rows up to now are indexed
+            # in the background (fts_backfill_batch), newer ones by the triggers
+            with self.conn:
+                self.conn.execute("INSERT OR IGNORE INTO fts_backfill(id, after, upto) "
+                                  "SELECT 1, 0, coalesce(MAX(id), 0) FROM messages")
+            if self.conn.execute("SELECT upto FROM fts_backfill").fetchone()[0] == 0:
+                self.fts_backfill_batch()  # new database, nothing to index: marks the index built
+
+    def _sync_triggers(self):
+        """Replaces triggers whose definition in messages.sql changed (CREATE ... IF NOT EXISTS keeps old ones).
+
+        Runs only when one differs, so normal starts do no DDL."""
+        stored = {r[0]: _normalized(r[1]) for r in self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type='trigger'")}
+        changed = []
+        for sql in schema_statements():
+            words = _normalized(sql).split()
+            if words[1].upper() != "TRIGGER":
+                continue
+            if words[2] in stored and stored[words[2]] != _normalized(sql):
+                changed.append((words[2], sql))
+        if not changed:
+            return
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for name, sql in changed:
+                self.conn.execute(f"DROP TRIGGER {name}")
+                self.conn.execute(sql)
+        logger.info("Updated triggers: %s", ", ".join(name for name, _ in changed))
 
     # ---- Admins
-    @log_call
+    @profiled
+    @writer
+    @invalidating
     def add_admin(self, user_id: int):
         self.conn.execute("INSERT OR IGNORE INTO admins(user_id) VALUES (?)", (user_id,))
         self.conn.commit()
+        self.admin_cache.invalidate(user_id)
 
-    @log_call
+    @profiled
+    @reader
     def is_admin(self, user_id: int) -> bool:
-        r = self.conn.execute("SELECT 1 FROM admins WHERE user_id=?", (user_id,)).fetchone()
-        return r is not None
+        return self.admin_cache.get_or_load(
+            user_id,
+            lambda: self.rconn.execute("SELECT 1 FROM admins WHERE user_id=?", (user_id,)).fetchone() is not None,
+        )
 
     # ---- Users table
-    @log_call
+    @profiled
+    @writer
+    @invalidating
     def set_user_lang(self, user_id: int, lang: str):
         self.conn.execute(
             """INSERT INTO users(user_id, lang) VALUES(?,?)
@@ -59,13 +291,20 @@ class DB:
                           (user_id, lang)
         )
         self.conn.commit()
+        self.lang_cache.invalidate(user_id)
 
-    @log_call
+    @profiled
+    @reader
     def get_user_lang(self, user_id: int) -> Optional[str]:
-        r = self.conn.execute("SELECT lang FROM users WHERE user_id=?", (user_id,)).fetchone()
+        return self.lang_cache.get_or_load(user_id, lambda: self._load_user_lang(user_id))
+
+    def _load_user_lang(self, user_id: int) -> Optional[str]:
+        r = self.rconn.execute("SELECT lang FROM users WHERE user_id=?", (user_id,)).fetchone()
         return r["lang"] if r and r["lang"] in ("ru","uk") else None
 
-    @log_call
+    @profiled
+    @writer
+    @invalidating
     def upsert_user(self, user_id: int, first_name: str, last_name: str, username: str, lang: Optional[str]):
         self.conn.execute(
             """INSERT INTO users(user_id, first_name, last_name, username, lang)
@@ -78,9 +317,12 @@ class DB:
             (user_id, first_name, last_name, username, lang),
         )
         self.conn.commit()
+        self.lang_cache.invalidate(user_id)
 
     # ---- Allowed chats (by female id in title)
-    @log_call
+    @profiled
+    @writer
+    @invalidating
     def add_allowed_chat(self, chat_id: int, title: str, female_id: str, added_by: int):
         self.conn.execute(
             """INSERT OR REPLACE INTO allowed_chats(chat_id, title, female_id, added_by)
@@ -88,22 +330,38 @@ class DB:
             (chat_id, title, female_id, added_by),
         )
         self.conn.commit()
+        self.allowed_cache.invalidate(chat_id)
+
+    @profiled
+    @writer
+    @invalidating
+    def remove_allowed_chat(self, chat_id: int):
+        self.conn.execute("DELETE FROM allowed_chats WHERE chat_id=?", (chat_id,))
+        self.conn.commit()
+        self.allowed_cache.invalidate(chat_id)
 
-    @log_call
+    @profiled
+    @reader
     def get_allowed_chat(self, chat_id: int):
-        return self.conn.execute("SELECT * FROM allowed_chats WHERE chat_id=?", (chat_id,)).fetchone()
+        return self.allowed_cache.get_or_load(
+            chat_id,
+            lambda: self.rconn.execute("SELECT * FROM allowed_chats WHERE chat_id=?", (chat_id,)).fetchone(),
+        )
 
-    @log_call
+    @profiled
+    @reader
     def list_allowed_chats(self):
-        return self.conn.execute("SELECT * FROM allowed_chats ORDER BY added_at DESC").fetchall()
+        return self.rconn.execute("SELECT * FROM allowed_chats ORDER BY added_at DESC").fetchall()
 
-    @log_call
+    @profiled
+    @reader
     def get_female_id_from_title(self, title: str):
         m = re.search(r'(?:^|[^0-9])([0-9]{10})(?:[^0-9]|$)', title or "")
         return m.group(1) if m else None
 
     # ---- KV settings (for extensions)
-    @log_call
+    @profiled
+    @writer
     def set_setting(self, key: str, value: str):
         self.conn.execute(
             "INSERT INTO settings(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
@@ -111,38 +369,184 @@ class DB:
         )
         self.conn.commit()
 
-    @log_call
+    @profiled
+    @reader
     def get_setting(self, key: str):
-        row = self.conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
+        row = self.rconn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
         return row["value"] if row else None
 
-    @log_call
+    @profiled
+    @writer
     def del_setting(self, key: str):
         self.conn.execute("DELETE FROM settings WHERE key=?", (key,))
         self.conn.commit()
 
     # ---- Messages / Linking
-    @log_call
+    def _store_text(self, text: Optional[str]) -> tuple[Optional[str], Optional[bytes]]:
+        """(text, text_hash) column values; with dedup on, long bodies go to `texts` once."""
+        if not self.dedup_texts or text is None or len(text) < MIN_DEDUP_LEN:
+            return text, None
+        h = text_hash(text)
+        if self.conn.execute("SELECT 1 FROM texts WHERE hash=?", (h,)).fetchone() is None:
+            self.conn.execute("INSERT INTO texts(hash, body) VALUES(?, ?)", (h, self.texts.compress(text)))
+        return None, h
+
+    def _insert_message(self, chat_id: int, message_id: int, sender_id: int, sender_username: str,
+                        sender_first_name: str, date: int, text: str, media_type: str,
+                        file_id: str, is_forward: int) -> int:
+        text, h = self._store_text(text)
+        cur = self.conn.execute(
+            """INSERT OR IGNORE INTO messages(chat_id, message_id, sender_id, sender_username,
+                    sender_first_name, date, text, media_type, file_id, is_forward, text_hash)
+                    VALUES(?,?,?,?,?,?,?,?,?,?,?)""",
+            (chat_id, message_id, sender_id, sender_username, sender_first_name, date, text, media_type, file_id,
+             is_forward, h),
+        )
+        if cur.rowcount == 1:
+            return cur.lastrowid
+        # already stored: only duplicates pay for the lookup
+        return self.conn.execute("SELECT id FROM messages WHERE chat_id=? AND message_id=?", (chat_id, message_id)).fetchone()["id"]
+
+    @profiled
+    @writer
     def save_message(self, chat_id: int, message_id: int, sender_id: int, sender_username: str,
                      sender_first_name: str, date: int, text: str, media_type: str,
                      file_id: str, is_forward: int) -> int:
-        cur = self.conn.cursor()
-        cur.execute(
-            """INSERT OR IGNORE INTO messages(chat_id, message_id, sender_id, sender_username,
-                    sender_first_name, date, text, media_type, file_id, is_forward)
-                    VALUES(?,?,?,?,?,?,?,?,?,?)""",
-            (chat_id, message_id, sender_id, sender_username, sender_first_name, date, text, media_type, file_id, is_forward),
-        )
+        msg_db_id = self._insert_message(chat_id, message_id, sender_id, sender_username, sender_first_name,
+                                         date, text, media_type, file_id, is_forward)
         self.conn.commit()
-        msg_db = cur.execute("SELECT id FROM messages WHERE chat_id=? AND message_id=?", (chat_id, message_id)).fetchone()
-        return msg_db["id"]
+        return msg_db_id
+
+    @profiled
+    @writer
+    def save_messages(self, batch: list[tuple[dict, list[str]]], checkpoint: Optional[tuple[str, str]] = None) -> list[int]:
+        """Stores (save_message kwargs, male_ids) pairs and their links in one transaction.
+
+        `checkpoint` is a (key, value) setting written in the same transaction (resumable imports).
+        """
+        ids = []
+        with self.conn:
+            if checkpoint:
+                self.conn.execute(
+                    "INSERT INTO settings(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                    checkpoint,
+                )
+            for row, male_ids in batch:
+                msg_db_id = self._insert_message(**row)
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO message_male_ids(message_id_ref, male_id) VALUES(?,?)",
+                    [(msg_db_id, mid) for mid in set(male_ids)],
+                )
+                ids.append(msg_db_id)
+        return ids
 
-    @log_call
+    @profiled
+    @writer
+    def apply_edits(self, batch: list[tuple[dict, list[str]]]) -> int:
+        """Applies edited messages ((save_message kwargs, male_ids) pairs) in one transaction.
+
+        Only links that changed are deleted or inserted; an edit that adds the first
+        ID to an unindexed message stores it. Returns the number of links changed.
+        """
+        changed = 0
+        with self.conn:
+            for row, male_ids in batch:
+                new = set(male_ids)
+                r = self.conn.execute("SELECT id FROM messages WHERE chat_id=? AND message_id=?",
+                                      (row["chat_id"], row["message_id"])).fetchone()
+                if r is None:
+                    if not new:
+                        continue
+                    msg_db_id, old = self._insert_message(**row), set()
+                else:
+                    msg_db_id = r["id"]
+                    text, h = self._store_text(row["text"])
+                    self.conn.execute(
+                        """UPDATE messages SET text=?, text_hash=?, media_type=?, file_id=?
+                           WHERE id=? AND (text IS NOT ? OR text_hash IS NOT ? OR media_type IS NOT ?
+                                           OR file_id IS NOT ?)""",
+                        (text, h, row["media_type"], row["file_id"], msg_db_id,
+                         text, h, row["media_type"], row["file_id"]),
+                    )
+                    old = {x[0] for x in self.conn.execute(
+                        "SELECT printf('%010d', male_id) FROM message_male_ids WHERE message_id_ref=?", (msg_db_id,))}
+                self.conn.executemany("DELETE FROM message_male_ids WHERE message_id_ref=? AND male_id=?",
+                                      [(msg_db_id, mid) for mid in old - new])
+                self.conn.executemany("INSERT OR IGNORE INTO message_male_ids(message_id_ref, male_id) VALUES(?,?)",
+                                      [(msg_db_id, mid) for mid in new - old])
+                changed += len(old ^ new)
+        return changed
+
+    def _link_diff(self, conn: sqlite3.Connection, rows: list[tuple]) -> list[tuple[int, set, set]]:
+        """(id, text, text_hash, male_ids) rows of one id range -> (id, links to drop, links to add).
+
+        Rows whose text changed since it was read (edited or deleted meanwhile) are
+        skipped: the edit already relinked them.
+        """
+        lo, hi = rows[0][0], rows[-1][0]
+        current = {r[0]: (r[1], r[2]) for r in conn.execute(
+            "SELECT id, text, text_hash FROM messages WHERE id BETWEEN ? AND ?", (lo, hi))}
+        old: dict[int, set] = {}
+        for ref, mid in conn.execute(
+                "SELECT message_id_ref, printf('%010d', male_id) FROM message_male_ids WHERE message_id_ref BETWEEN ? AND ?",
+                (lo, hi)):
+            old.setdefault(ref, set()).add(mid)
+        out = []
+        for msg_db_id, text, h, male_ids in rows:
+            if current.get(msg_db_id) != (text, h):
+                continue
+            was, new = old.get(msg_db_id, set()), set(male_ids)
+            if was != new:
+                out.append((msg_db_id, was - new, new - was))
+        return out
+
+    @reader
+    def diff_links(self, rows: list[tuple]) -> list[tuple[int, set, set]]:
+        """What relink_messages() would change, without writing (reindex dry run)."""
+        return self._link_diff(self.rconn, rows)
+
+    @profiled
+    @writer
+    def relink_messages(self, rows: list[tuple], checkpoint: Optional[tuple[str, str]] = None) -> tuple[int, int, int]:
+        """Re-links stored messages to freshly extracted IDs in one transaction (reindex.py).
+
+        `rows` as for _link_diff; only changed links are written, so the stats triggers
+        see exactly the difference. Returns (messages changed, links removed, links added).
+        """
+        removed = added = 0
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")  # the diff must not race the bot's edits
+            diff = self._link_diff(self.conn, rows) if rows else []
+            for msg_db_id, drop, add in diff:
+                self.conn.executemany("DELETE FROM message_male_ids WHERE message_id_ref=? AND male_id=?",
+                                      [(msg_db_id, mid) for mid in drop])
+                self.conn.executemany("INSERT OR IGNORE INTO message_male_ids(message_id_ref, male_id) VALUES(?,?)",
+                                      [(msg_db_id, mid) for mid in add])
+                removed += len(drop)
+                added += len(add)
+            if checkpoint:
+                self.conn.execute(
+                    "INSERT INTO settings(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                    checkpoint,
+                )
+        return len(diff), removed, added
+
+    @profiled
+    @reader
+    def get_message_db_id(self, chat_id: int, message_id: int) -> Optional[int]:
+        r = self.rconn.execute("SELECT id FROM messages WHERE chat_id=? AND message_id=?", (chat_id, message_id)).fetchone()
+        return r["id"] if r else None
+
+    @profiled
+    @writer
     def update_message_text(self, chat_id: int, message_id: int, text: str):
-        self.conn.execute("""UPDATE messages SET text=? WHERE chat_id=? AND message_id=?""", (text, chat_id, message_id))
+        text, h = self._store_text(text)
+        self.conn.execute("""UPDATE messages SET text=?, text_hash=? WHERE chat_id=? AND message_id=?""",
+                          (text, h, chat_id, message_id))
         self.conn.commit()
 
-    @log_call
+    @profiled
+    @writer
     def link_male_ids(self, message_db_id: int, male_ids: list[str]):
         for mid in set(male_ids):
             try:
@@ -157,67 +561,347 @@ class DB:
                 )
         self.conn.commit()
 
-    @log_call
+    @profiled
+    @writer
     def unlink_all_male_ids(self, message_db_id: int):
         self.conn.execute("DELETE FROM message_male_ids WHERE message_id_ref=?", (message_db_id,))
         self.conn.commit()
 
     # ---- Search / Stats
-    @log_call
-    def search_by_male(self, male_id: str, limit: int=5, offset: int=0):
-        return self.conn.execute(
-            """
-            SELECT m.*, mm.male_id FROM messages m
-            JOIN message_male_ids mm ON mm.message_id_ref = m.id
-            WHERE mm.male_id = ?
-            ORDER BY m.date DESC
+    @profiled
+    @reader
+    def search_by_male(self, male_id: str, limit: int=5, offset: int=0, before: Optional[tuple[int, int]] = None):
+        """Newest first. `before` is the (date, id) of the last row already shown (keyset cursor)."""
+        keyset = "AND (m.date, m.id) < (?, ?)" if before else ""
+        return self.rconn.execute(
+            f"""
+            SELECT {MESSAGE_FIELDS}, printf('%010d', mm.male_id) AS male_id FROM message_male_ids mm
+            JOIN messages m ON m.id = mm.message_id_ref
+            WHERE mm.male_id = ? {keyset}
+            ORDER BY m.date DESC, m.id DESC
             LIMIT ? OFFSET ?
         """,
-            (male_id, limit, offset),
+            (male_id, *(before or ()), limit, offset),
         ).fetchall()
 
-    @log_call
+    @reader
+    def iter_by_males(self, male_ids: list[str], batch: int = 1000):
+        """Yields rows of all `male_ids` in lists of `batch`, never holding the whole result."""
+        cur = self.rconn.execute(
+            f"""
+            SELECT {MESSAGE_FIELDS}, printf('%010d', mm.male_id) AS male_id FROM message_male_ids mm
+            JOIN messages m ON m.id = mm.message_id_ref
+            WHERE mm.male_id IN (SELECT value FROM json_each(?))
+            ORDER BY mm.male_id, m.date DESC, m.id DESC
+        """,
+            (json.dumps(list(male_ids)),),
+        )
+        try:
+            while rows := cur.fetchmany(batch):
+                yield rows
+        finally:
+            cur.close()
+
+    @profiled
+    @reader
     def count_by_male(self, male_id: str) -> int:
-        r = self.conn.execute(
+        r = self.rconn.execute("SELECT msg_count FROM male_stats WHERE male_id=?", (male_id,)).fetchone()
+        return r["msg_count"] if r else 0
+
+    @profiled
+    @reader
+    def get_male_stats(self, male_id: str):
+        """msg_count, chat_count, first_date, last_date of one male ID (None if never seen)."""
+        return self.rconn.execute("SELECT * FROM male_stats WHERE male_id=?", (male_id,)).fetchone()
+
+    @profiled
+    @reader
+    def get_male_stats_many(self, male_ids: list[str], top_chats: int = 3):
+        """male_stats of many IDs in one query, in the given order; unknown IDs get NULL counts.
+
+        `chats`: titles (or ids) of the chats with the most messages of the ID, '; '-separated.
+        """
+        return self.rconn.execute(
+            """SELECT q.value AS male_id, s.msg_count, s.chat_count, s.first_date, s.last_date,
+                      (SELECT group_concat(name, '; ') FROM (
+                           SELECT coalesce(a.title, c.chat_id) AS name FROM male_chat_stats c
+                           LEFT JOIN allowed_chats a ON a.chat_id = c.chat_id
+                           WHERE c.male_id = q.value ORDER BY c.msg_count DESC LIMIT ?)) AS chats
+               FROM json_each(?) q LEFT JOIN male_stats s ON s.male_id = q.value
+               ORDER BY q.key""",
+            (top_chats, json.dumps(male_ids)),
+        ).fetchall()
+
+    @profiled
+    @reader
+    def count_stats(self):
+        totals = dict(self.rconn.execute("SELECT key, value FROM stats_totals").fetchall())
+        chats = self.rconn.execute("SELECT COUNT(*) c FROM allowed_chats").fetchone()["c"]
+        return totals.get("men", 0), totals.get("messages", 0), chats
+
+    @profiled
+    @writer
+    def rebuild_stats(self):
+        """Recomputes male_stats, male_chat_stats and stats_totals from messages/message_male_ids
+        plus what was archived (archive_index)."""
+        links = """SELECT printf('%010d', mm.male_id) AS male_id, m.chat_id, 1 AS n, m.date AS first_date, m.date AS last_date
+                   FROM message_male_ids mm JOIN messages m ON m.id = mm.message_id_ref
+                   UNION ALL
+                   SELECT male_id, chat_id, msg_count, first_date, last_date FROM archive_index"""
+        with self.conn:
+            self.conn.execute("DELETE FROM male_chat_stats")
+            self.conn.execute("DELETE FROM male_stats")
+            self.conn.execute(
+                f"""INSERT INTO male_chat_stats(male_id, chat_id, msg_count)
+                    SELECT male_id, chat_id, SUM(n) FROM ({links})
+                    GROUP BY male_id, chat_id"""
+            )
+            self.conn.execute(
+                f"""INSERT INTO male_stats(male_id, msg_count, chat_count, first_date, last_date)
+                    SELECT male_id, SUM(n), COUNT(DISTINCT chat_id), MIN(first_date), MAX(last_date)
+                    FROM ({links}) GROUP BY male_id"""
+            )
+            self.conn.execute(
+                """INSERT OR REPLACE INTO stats_totals(key, value) VALUES
+                   ('men', (SELECT COUNT(*) FROM male_stats)),
+                   ('messages', (SELECT COUNT(*) FROM messages)
+                                + coalesce((SELECT value FROM stats_totals WHERE key = 'archived'), 0))"""
+            )
+            self.conn.execute("INSERT OR REPLACE INTO settings(key, value) VALUES('stats:built', '1')")
+        return self.count_stats()
+
+    # ---- Originals that can't be copied any more
+    @profiled
+    @reader
+    def load_gone_messages(self) -> set[tuple[int, int]]:
+        return {(r[0], r[1]) for r in self.rconn.execute("SELECT chat_id, message_id FROM gone_messages")}
+
+    @profiled
+    @writer
+    def mark_gone(self, chat_id: int, message_id: int):
+        self.conn.execute("INSERT OR IGNORE INTO gone_messages(chat_id, message_id) VALUES(?,?)", (chat_id, message_id))
+        self.conn.commit()
+
+    # ---- Full-text search
+    @profiled
+    @reader
+    def search_text(self, query: str, limit: int = 5, offset: int = 0):
+        """Best matches first for an FTS5 query (see utils.fts_query); snippet marks hits with \x02...\x03."""
+        return self.rconn.execute(
             """
-            SELECT COUNT(*) c FROM messages m
-            JOIN message_male_ids mm ON mm.message_id_ref = m.id
-            WHERE mm.male_id = ?
+            SELECT m.id, m.chat_id, m.message_id, m.date, m.sender_username,
+                   snippet(messages_fts, 0, char(2), char(3), '…', 16) AS snippet
+            FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?
         """,
-            (male_id,),
-        ).fetchone()
-        return r["c"] if r else 0
+            (query, limit, offset),
+        ).fetchall()
 
-    @log_call
-    def count_stats(self):
-        men = self.conn.execute("SELECT COUNT(DISTINCT male_id) c FROM message_male_ids").fetchone()["c"]
-        msgs = self.conn.execute("SELECT COUNT(*) c FROM messages").fetchone()["c"]
-        chats = self.conn.execute("SELECT COUNT(*) c FROM allowed_chats").fetchone()["c"]
-        return men, msgs, chats
+    @profiled
+    @writer
+    def rebuild_fts(self):
+        """Re-indexes all messages (backfill for databases that predate the index, or repairs)."""
+        with self.conn:
+            self.conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('rebuild')")
+            self.conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('optimize')")
+            self.conn.execute("DELETE FROM fts_backfill")
+            self.conn.execute("INSERT OR REPLACE INTO settings(key, value) VALUES('fts:built', '1')")
+
+    @profiled
+    @writer
+    def fts_backfill_batch(self, limit: int = 5000) -> Optional[tuple[int, int]]:
+        """Indexes the next `limit` messages that predate the index, in one short transaction.
+
+        Returns (indexed up to id, up to id to go), or None once the index is complete."""
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            state = self.conn.execute("SELECT after, upto FROM fts_backfill").fetchone()
+            if state is None:
+                return None
+            after, upto = state
+            last = self.conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM messages WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)",
+                (after, upto, limit)).fetchone()[0]
+            if last is None:
+                self.conn.execute("DELETE FROM fts_backfill")
+                self.conn.execute("INSERT OR REPLACE INTO settings(key, value) VALUES('fts:built', '1')")
+                return None
+            self.conn.execute(
+                """INSERT INTO messages_fts(rowid, text, sender_username)
+                   SELECT id, text, sender_username FROM messages_fts_src WHERE id > ? AND id <= ?""",
+                (after, last))
+            self.conn.execute("UPDATE fts_backfill SET after = ?", (last,))
+            return last, upto
+
+    @profiled
+    @reader
+    def fts_backfill_state(self) -> Optional[tuple[int, int]]:
+        """(indexed up to id, up to id to go) while the full-text index is being backfilled, else None."""
+        r = self.rconn.execute("SELECT after, upto FROM fts_backfill").fetchone()
+        return (r[0], r[1]) if r else None
+
+    # ---- Watchlists
+    @profiled
+    @writer
+    @invalidating
+    def add_watches(self, user_id: int, male_ids: list[str]) -> int:
+        with self.conn:
+            cur = self.conn.executemany("INSERT OR IGNORE INTO watches(male_id, user_id) VALUES(?, ?)",
+                                        [(mid, user_id) for mid in set(male_ids)])
+        return cur.rowcount
+
+    @profiled
+    @writer
+    @invalidating
+    def remove_watches(self, user_id: int, male_ids: Optional[list[str]] = None) -> int:
+        """Removes the given IDs, or all of the user's watches when male_ids is None."""
+        with self.conn:
+            if male_ids is None:
+                cur = self.conn.execute("DELETE FROM watches WHERE user_id=?", (user_id,))
+            else:
+                cur = self.conn.executemany("DELETE FROM watches WHERE male_id=? AND user_id=?",
+                                            [(mid, user_id) for mid in set(male_ids)])
+        return cur.rowcount
+
+    @profiled
+    @reader
+    def list_watches(self, user_id: int) -> list[str]:
+        return [r[0] for r in self.rconn.execute(
+            "SELECT printf('%010d', male_id) FROM watches WHERE user_id=? ORDER BY male_id", (user_id,))]
+
+    @profiled
+    @reader
+    def load_watches(self):
+        """(user_id, male_id) of every subscription."""
+        return self.rconn.execute("SELECT user_id, male_id FROM watches").fetchall()
+
+    # ---- Content-addressed texts (textstore.py)
+    @profiled
+    @writer
+    def add_text_dict(self, zdict: bytes) -> int:
+        """Stores a trained compression dictionary; new bodies use the newest one."""
+        if (self.conn.execute("SELECT MAX(id) FROM text_dicts").fetchone()[0] or 0) >= MAX_DICTS:
+            raise ValueError(f"at most {MAX_DICTS} text dictionaries")
+        with self.conn:
+            cur = self.conn.execute("INSERT INTO text_dicts(dict) VALUES(?)", (zdict,))
+        self.texts.load()
+        return cur.lastrowid
+
+    @profiled
+    @writer
+    def dedup_texts_batch(self, after_id: int, limit: int = 2000) -> tuple[Optional[int], int]:
+        """Moves inline texts of the next `limit` messages after `after_id` into `texts`.
+        Returns (converted, last id), or (None, after_id) when there is nothing left."""
+        rows = self.conn.execute("SELECT id, text FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+                                 (after_id, limit)).fetchall()
+        if not rows:
+            return None, after_id
+        dedup, self.dedup_texts = self.dedup_texts, True
+        converted = 0
+        try:
+            with self.conn:
+                # same text, so trg_fts_upd's WHEN leaves the full-text index as it is
+                for r in rows:
+                    text, h = self._store_text(r["text"])
+                    if h is not None:
+                        self.conn.execute("UPDATE messages SET text=NULL, text_hash=? WHERE id=?", (h, r["id"]))
+                        converted += 1
+        finally:
+            self.dedup_texts = dedup
+        return converted, rows[-1]["id"]
 
-    # ---- Logs / Rate limit
-    @log_call
+    @profiled
+    @writer
+    def gc_texts(self) -> int:
+        """Deletes bodies no message points at any more (edited, archived). Returns how many."""
+        with self.conn:
+            cur = self.conn.execute(
+                "DELETE FROM texts WHERE NOT EXISTS (SELECT 1 FROM messages WHERE text_hash = texts.hash)")
+        return cur.rowcount
+
+    # ---- Logs / Rate limit windows
+    @profiled
+    @writer
     def log_search(self, user_id: int, query_type: str, query_value: str):
         self.conn.execute("INSERT INTO searches(user_id, query_type, query_value) VALUES(?,?,?)", (user_id, query_type, query_value))
         self.conn.commit()
 
-    @log_call
+    @profiled
+    @reader
     def get_user_searches(self, user_id: int, limit=10):
-        return self.conn.execute(
+        return self.rconn.execute(
             """SELECT * FROM searches WHERE user_id=? ORDER BY created_at DESC LIMIT ?""",
             (user_id, limit),
         ).fetchall()
 
-    @log_call
-    def rate_limit_allowed(self, user_id: int, now_ts: int, min_interval: int = 2) -> bool:
-        r = self.conn.execute("SELECT last_action_ts FROM ratelimits WHERE user_id=?", (user_id,)).fetchone()
-        if r is None:
-            self.conn.execute("INSERT OR REPLACE INTO ratelimits(user_id, last_action_ts) VALUES(?,?)", (user_id, now_ts))
-            self.conn.commit()
-            return True
-        last = r["last_action_ts"]
-        if now_ts - last < min_interval:
-            return False
-        self.conn.execute("UPDATE ratelimits SET last_action_ts=? WHERE user_id=?", (now_ts, user_id))
-        self.conn.commit()
-        return True
+    @profiled
+    @reader
+    def load_rate_limits(self):
+        return self.rconn.execute("SELECT user_id, action, hits FROM ratelimit_windows").fetchall()
+
+    @profiled
+    @writer
+    def save_rate_limits(self, items: list[tuple[int, str, str]]):
+        """Stores (user_id, action, hits) windows in one transaction; empty hits remove the row."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO ratelimit_windows(user_id, action, hits) VALUES(?,?,?) "
+                "ON CONFLICT(user_id, action) DO UPDATE SET hits=excluded.hits",
+                [item for item in items if item[2]],
+            )
+            self.conn.executemany(
+                "DELETE FROM ratelimit_windows WHERE user_id=? AND action=?",
+                [item[:2] for item in items if not item[2]],
+            )
+
+class AsyncDB:
+    """Awaitable facade over DB: writes run on a single writer thread,
+    reads on a small pool of threads with their own read-only connections.
+    With route_writes(), writes go to another process instead (see supervisor.py)."""
+
+    def __init__(self, db: DB, readers: int = 4):
+        self._db = db
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix="db-reader")
+        self._remote = None
+
+    def route_writes(self, remote):
+        """remote: async (method name, args, kwargs) -> result, for every write method."""
+        self._remote = remote
+        for name in [n for n, v in self.__dict__.items() if getattr(v, "_db_call", False)]:
+            del self.__dict__[name]
+
+    def __getattr__(self, name: str):
+        meth = getattr(self._db, name)
+        if not callable(meth):
+            raise AttributeError(name)
+        is_read = getattr(meth, "_db_read", False)
+        pool = self._readers if is_read else self._writer
+        remote = None if is_read else self._remote
+
+        async def call(*args, **kwargs):
+            if remote is not None:
+                return await remote(name, args, kwargs)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(pool, functools.partial(meth, *args, **kwargs))
+
+        call.__name__ = name
+        call._db_call = True
+        self.__dict__[name] = call
+        return call
+
+    async def run(self, func, *args, write: bool = True):
+        """Runs an arbitrary callable (e.g. a multi-statement job) on the writer or a reader thread.
+
+        With route_writes(), write jobs run in the writer's process: `func` must be a
+        module-level function (pickled by name) that takes no DB argument."""
+        if write and self._remote is not None:
+            return await self._remote(None, (func, *args), {})
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer if write else self._readers, functools.partial(func, *args))
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
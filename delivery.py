@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+
+logger = logging.getLogger(__name__)
+
+COPY_BATCH = 100  # copyMessages accepts up to 100 ids
+# copy errors that mean the original itself is gone for good (lowercased substrings of the
+# description); anything else (the destination, bad parameters, transient failures) isn't cached
+GONE_ERRORS = ("message to copy not found", "message to forward not found", "message_id_invalid",
+               "message can't be copied")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, n: float = 1):
+        while True:
+            self._refill()
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            await asyncio.sleep((n - self.tokens) / self.rate)
+
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class Delivery:
+    """Sends search results within Telegram's flood limits.
+
+    Originals are copied in the order of `rows`, except that consecutive rows from
+    the same chat whose ids run in one direction share a copyMessages call, which
+    delivers oldest first: a newest-first page from one chat arrives oldest first
+    within each such run. Originals known to be gone are remembered in SQLite and
+    go straight to the stored-content fallback, which re-sends media by file_id.
+    """
+
+    def __init__(self, bot, db, global_rate: float = 25, chat_rate: float = 1, chat_burst: float = 10,
+                 max_retries: int = 3):
+        self.bot = bot
+        self.db = db
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: dict[int, TokenBucket] = {}
+        self.max_retries = max_retries
+        self.gone: set[tuple[int, int]] = db.load_gone_messages()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.idle()}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def call(self, chat_id: int, make_request, cost: int = 1):
+        """Awaits make_request() once both buckets allow it; sleeps and retries on RetryAfter."""
+        for attempt in range(self.max_retries + 1):
+            await self.global_bucket.acquire(min(cost, self.global_bucket.capacity))
+            await self._chat_bucket(chat_id).acquire(min(cost, self.chat_burst))
+            try:
+                return await make_request()
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning("Flood control for chat %s, retrying in %ss", chat_id, e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+    async def send_rows(self, chat_id: int, rows):
+        """Delivers rows (messages joined with their stored content) to chat_id, in order."""
+        stored = []  # consecutive known-gone rows, sent together so they can form albums
+        i = 0
+        while i < len(rows):
+            row = rows[i]
+            if (row["chat_id"], row["message_id"]) in self.gone:
+                stored.append(row)
+                i += 1
+                continue
+            await self.send_stored_rows(chat_id, stored)
+            stored = []
+            run, step = [row], 0
+            while (i + len(run) < len(rows) and len(run) < COPY_BATCH
+                   and rows[i + len(run)]["chat_id"] == row["chat_id"]
+                   and (row["chat_id"], rows[i + len(run)]["message_id"]) not in self.gone):
+                # one direction per run (search pages are newest first, so usually descending)
+                diff = rows[i + len(run)]["message_id"] - run[-1]["message_id"]
+                if not diff or diff * step < 0:
+                    break
+                step = diff
+                run.append(rows[i + len(run)])
+            i += len(run)
+            if len(run) > 1 and await self._copy_run(chat_id, run):
+                continue
+            for r in run:
+                if not await self._copy_one(chat_id, r):
+                    await self.send_stored_rows(chat_id, [r])
+        await self.send_stored_rows(chat_id, stored)
+
+    async def _copy_run(self, chat_id: int, run) -> bool:
+        """One copyMessages call for a same-chat run (ids sorted, as the method requires).
+        False if it failed or some originals were skipped: the partial copy is removed and the
+        caller goes one by one."""
+        ids = sorted(r["message_id"] for r in run)
+        try:
+            copied = await self.call(chat_id, lambda: self.bot.copy_messages(
+                chat_id=chat_id, from_chat_id=run[0]["chat_id"], message_ids=ids), cost=len(ids))
+        except TelegramBadRequest as e:
+            logger.info("copyMessages from %s failed (%s), copying one by one", run[0]["chat_id"], e.message)
+            return False
+        except Exception:  # network errors, flood control after the retries: the rest of the page still goes out
+            logger.exception("copyMessages from %s failed, copying one by one", run[0]["chat_id"])
+            return False
+        if len(copied) == len(ids):
+            return True
+        if copied:
+            await self.call(chat_id, lambda: self.bot.delete_messages(chat_id, [m.message_id for m in copied]))
+        return False
+
+    async def _copy_one(self, chat_id: int, row) -> bool:
+        try:
+            await self.call(chat_id, lambda: self.bot.copy_message(
+                chat_id=chat_id, from_chat_id=row["chat_id"], message_id=row["message_id"]))
+            return True
+        except TelegramBadRequest as e:
+            if any(err in (e.message or "").lower() for err in GONE_ERRORS):
+                logger.info("Original %s:%s is gone: %s", row["chat_id"], row["message_id"], e.message)
+                await self.mark_gone(row["chat_id"], row["message_id"])
+            else:  # this time only: send the stored content, try the original again next search
+                logger.warning("Copy of %s:%s failed: %s", row["chat_id"], row["message_id"], e.message)
+        except Exception:
+            logger.exception("Copy of %s:%s failed", row["chat_id"], row["message_id"])
+        return False
+
+    async def mark_gone(self, chat_id: int, message_id: int):
+        self.gone.add((chat_id, message_id))
+        await self.db.aio.mark_gone(chat_id, message_id)
+
+    # ---- Fallback: stored content
+    async def send_stored_rows(self, chat_id: int, rows):
+        """Re-sends stored media by file_id (no re-upload), grouping compatible neighbours into albums."""
+        i = 0
+        while i < len(rows):
+            kind = _album_kind(rows[i])
+            group = rows[i:i + 1]
+            while (kind and len(group) < ALBUM_MAX and i + len(group) < len(rows)
+                   and _album_kind(rows[i + len(group)]) == kind):
+                group.append(rows[i + len(group)])
+            i += len(group)
+            if len(group) > 1 and await self._send_album(chat_id, group):
+                continue
+            for row in group:
+                await self.send_stored(chat_id, row)
+
+    async def _send_album(self, chat_id: int, group) -> bool:
+        media, long_texts = [], []
+        for row in group:
+            caption, rest = _caption(row["text"])
+            media.append(ALBUM_MEDIA[row["media_type"]](media=row["file_id"], caption=caption, parse_mode=None))
+            if rest:
+                long_texts.append(rest)
+        try:
+            await self.call(chat_id, lambda: self.bot.send_media_group(chat_id, media=media), cost=len(media))
+        except TelegramBadRequest as e:
+            logger.info("Album of stored media failed (%s), sending items one by one", e.message)
+            return False
+        for text in long_texts:
+            await self._send_text(chat_id, text)
+        return True
+
+    async def send_stored(self, chat_id: int, row):
+        """Fallback for one result: its media by file_id with the stored caption, else the stored text."""
+        send = SEND_MEDIA.get(row["media_type"]) if row["file_id"] else None
+        if send is not None:
+            caption, rest = _caption(row["text"])
+            kwargs = {} if row["media_type"] == "sticker" else {"caption": caption, "parse_mode": None}
+            try:
+                await self.call(chat_id, lambda: getattr(self.bot, send)(chat_id, row["file_id"], **kwargs))
+                if rest or (row["media_type"] == "sticker" and row["text"]):
+                    await self._send_text(chat_id, row["text"])
+                return
+            except TelegramBadRequest as e:
+                logger.info("Stored %s of %s:%s can't be re-sent: %s", row["media_type"], row["chat_id"],
+                            row["message_id"], e.message)
+        await self._send_text(chat_id, row["text"])
+
+    async def _send_text(self, chat_id: int, text: str):
+        await self.call(chat_id, lambda: self.bot.send_message(chat_id, text or "(no text)", parse_mode=None))
+
+
+SEND_MEDIA = {
+    "photo": "send_photo",
+    "video": "send_video",
+    "document": "send_document",
+    "audio": "send_audio",
+    "voice": "send_voice",
+    "sticker": "send_sticker",
+}
+ALBUM_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+ALBUM_MAX = 10
+CAPTION_LIMIT = 1024
+
+
+def _album_kind(row):
+    """Rows with the same kind may share an album: photos mix with videos, documents and audio only with their own."""
+    if not row["file_id"] or row["media_type"] not in ALBUM_MEDIA:
+        return None
+    return "visual" if row["media_type"] in ("photo", "video") else row["media_type"]
+
+
+def _caption(text):
+    """(caption, text to send separately): long texts go out as a message of their own."""
+    text = text or ""
+    if len(text) <= CAPTION_LIMIT:
+        return text or None, None
+    return None, text
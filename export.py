@@ -0,0 +1,114 @@
+import csv
+import gzip
+import io
+import tempfile
+import time
+import zipfile
+from typing import AsyncGenerator
+
+from aiogram.types import InputFile
+
+# Bot API refuses documents above 50 MB; keep a margin for buffered compressor output
+TG_DOCUMENT_LIMIT = 50 * 1024 * 1024
+PART_LIMIT = TG_DOCUMENT_LIMIT - 2 * 1024 * 1024
+SPOOL_MAX = 8 * 1024 * 1024
+CSV_HEADER = ["chat_id", "message_id", "date", "text", "media_type", "sender_id", "sender_username", "male_id"]
+
+
+class SpooledInputFile(InputFile):
+    """Uploads an already written (spooled) temp file in chunks."""
+
+    def __init__(self, file, filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+
+class _Part:
+    """One compressed CSV file: gzip, or a zip archive with a single member."""
+
+    def __init__(self, fmt: str, name: str):
+        self.raw = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+        self.zip = None
+        if fmt == "zip":
+            self.zip = zipfile.ZipFile(self.raw, "w", zipfile.ZIP_DEFLATED)
+            stream = self.zip.open(f"{name}.csv", "w", force_zip64=True)
+        else:
+            stream = gzip.GzipFile(filename=f"{name}.csv", fileobj=self.raw, mode="wb")
+        self.text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        self.csv = csv.writer(self.text)
+        self.csv.writerow(CSV_HEADER)
+
+    def size(self) -> int:
+        return self.raw.tell()
+
+    def close(self):
+        self.text.flush()
+        self.text.detach().close()
+        if self.zip is not None:
+            self.zip.close()
+        self.raw.seek(0)
+        return self.raw
+
+
+def export_csv(db, male_ids: list[str], fmt: str = "gzip", part_limit: int = PART_LIMIT,
+               batch: int = 1000) -> list:
+    """Writes all messages of `male_ids` as compressed CSV, split into parts below `part_limit` bytes.
+
+    Blocking: run it on a reader thread (db.aio.run(..., write=False)). Returns open
+    temp files, the caller closes them.
+    """
+    parts = []
+    part = None
+    try:
+        for rows in db.iter_by_males(male_ids, batch):
+            if part is None or part.size() >= part_limit:
+                if part is not None:
+                    parts.append(part.close())
+                part = _Part(fmt, export_name(male_ids))
+            part.csv.writerows(
+                [r["chat_id"], r["message_id"], r["date"], (r["text"] or "").replace("\n", " "),
+                 r["media_type"], r["sender_id"], r["sender_username"], r["male_id"]]
+                for r in rows
+            )
+        if part is not None:
+            parts.append(part.close())
+    except Exception:
+        for f in parts:
+            f.close()
+        if part is not None:
+            part.raw.close()
+        raise
+    return parts
+
+
+def export_name(male_ids: list[str]) -> str:
+    return f"export_{male_ids[0]}" if len(male_ids) == 1 else f"export_{len(male_ids)}_ids"
+
+
+def part_filename(male_ids: list[str], fmt: str, index: int, total: int) -> str:
+    ext = "zip" if fmt == "zip" else "csv.gz"
+    suffix = f".part{index}" if total > 1 else ""
+    return f"{export_name(male_ids)}{suffix}.{ext}"
+
+
+SUMMARY_HEADER = ["male_id", "msg_count", "chat_count", "first_seen", "last_seen", "top_chats"]
+
+
+def summary_csv(rows) -> bytes:
+    """Bulk lookup report (get_male_stats_many rows) as a small uncompressed CSV."""
+    out = io.StringIO()
+    w = csv.writer(out)
+    w.writerow(SUMMARY_HEADER)
+    for r in rows:
+        w.writerow([r["male_id"], r["msg_count"] or 0, r["chat_count"] or 0, _day(r["first_date"]),
+                    _day(r["last_date"]), r["chats"] or ""])
+    return out.getvalue().encode("utf-8-sig")  # BOM: Excel opens it as UTF-8
+
+
+def _day(ts) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(ts)) if ts else ""
@@ -19,7 +19,7 @@ def register(dp, bot, db, t, lang_for, OWNER_ID):
             return
         secret = "".join(random.choices("ABCDEFGHJKLMNPQRSTUVWXYZ23456789", k=8))
         logger.info("Generated auth secret %s for user %s", secret, uid)
-        db.set_setting(f"auth_secret:{uid}", secret)
+        await db.aio.set_setting(f"auth_secret:{uid}", secret)
         await message.answer(t(lang, "auth_secret_dm", secret=secret))
 
     @dp.message(Command("authorize"))
@@ -38,7 +38,7 @@ def register(dp, bot, db, t, lang_for, OWNER_ID):
             await message.reply(t(lang, "authorize_need_token"))
             return
         supplied = parts[1].strip()
-        expected = db.get_setting(f"auth_secret:{uid}")
+        expected = await db.aio.get_setting(f"auth_secret:{uid}")
         if not expected or supplied != expected:
             logger.warning("User %s supplied invalid or expired token for chat %s", uid, message.chat.id)
             await message.reply(t(lang, "authorize_bad_or_expired"))
@@ -54,8 +54,8 @@ def register(dp, bot, db, t, lang_for, OWNER_ID):
             logger.warning("Chat %s has no female id for authorization by user %s", message.chat.id, uid)
             await message.reply(t(lang, "group_no_female_id"))
             return
-        db.add_allowed_chat(message.chat.id, title, female_id, uid)
-        db.del_setting(f"auth_secret:{uid}")
+        await db.aio.add_allowed_chat(message.chat.id, title, female_id, uid)
+        await db.aio.del_setting(f"auth_secret:{uid}")
         logger.info("Chat %s authorized with female id %s by user %s", message.chat.id, female_id, uid)
         await message.reply(t(lang, "authorize_ok", fid=female_id))
 
@@ -69,7 +69,6 @@ def register(dp, bot, db, t, lang_for, OWNER_ID):
             logger.warning("User %s attempted to unauthorize chat %s without permission", uid, message.chat.id)
             await message.reply(t(lang, "unauthorize_only_superadmin"))
             return
-        db.conn.execute("DELETE FROM allowed_chats WHERE chat_id=?", (message.chat.id,))
-        db.conn.commit()
+        await db.aio.remove_allowed_chat(message.chat.id)
         logger.info("Chat %s unauthorized by user %s", message.chat.id, uid)
         await message.reply(t(lang, "unauthorize_ok"))
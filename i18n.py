@@ -12,6 +12,10 @@ RU = {
     "menu_lang_set": "Язык переключён.",
     "search_enter_id": "Введи 10-значный ID мужчины.",
     "search_not_found": "Ничего не найдено по этому ID.",
+    "search_suggest": "По этому ID ничего нет. Похожие известные ID:",
+    "prefix_found": "ID, начинающиеся с {prefix}: {count}",
+    "prefix_first": "Показаны первые {shown}, уточни запрос.",
+    "prefix_none": "Нет известных ID, начинающихся с {prefix}.",
     "more": "Показать ещё",
     "admin_only": "Только для админов.",
     "admin_menu": "Админ-меню",
@@ -33,7 +37,7 @@ RU = {
     "export_male": "Экспорт по мужскому ID",
     "export_all": "Полный экспорт",
     "enter_female_id": "Введи 10-значный женский ID.",
-    "enter_male_id": "Введи 10-значный мужской ID.",
+    "enter_male_id": "Введи 10-значный мужской ID (можно несколько через пробел или с новой строки).",
     "bad_id": "Нужно ровно 10 цифр.",
     "rate_limited": "Слишком часто. Подожди пару секунд.",
     "prompt_add_user": "Отправьте @username пользователя (без ссылки), которого нужно ДОБАВИТЬ к использованию бота.",
@@ -43,13 +47,36 @@ RU = {
     "admin_remove_user": "➖ Удалить пользователя",
     "not_authorized": "У вас нет доступа. Обратитесь к администратору бота.",
     "only_superadmin": "Это действие доступно только суперадмину.",
+    "maintenance_report": "Перенесено в архив: {archived}\nБД: {db_mb} МБ, WAL: {wal_mb} МБ\n"
+                          "Освобождено: {reclaimed_mb} МБ, свободных страниц: {free_pages}",
 
     "add_chat_admins_only": "Добавлять чаты могут только админы или суперадмин.",
     "auth_secret_dm": "Пароль для авторизации чата: <b>{secret}</b>\nПерейдите в нужную группу и отправьте: <code>/authorize {secret}</code>",
     "authorize_need_token": "Нужно использовать формат: /authorize <пароль>, полученный в личке от бота.",
     "authorize_bad_or_expired": "Пароль не подходит или устарел. Сгенерируйте новый в личке.",
     "unauthorize_ok": "Чат удалён из разрешённых.",
-    "unauthorize_only_superadmin": "Удалять чаты может только суперадмин."
+    "unauthorize_only_superadmin": "Удалять чаты может только суперадмин.",
+
+    "find_usage": "Формат: /find <слова или @username>. Слово* — поиск по началу слова.",
+    "find_pending": "Полнотекстовый индекс ещё строится ({pct}%). Попробуй позже.",
+    "watch_usage": "Формат: /watch ID [ID ...] — сообщать о новых сообщениях с этими ID; /unwatch ID [ID ...] или /unwatch all; /watches — список.",
+    "watch_added": "Добавлено: {added}. Всего отслеживается: {total}.",
+    "watch_limit": "Можно отслеживать не больше {limit} ID.",
+    "unwatch_done": "Снято: {removed}. Осталось: {total}.",
+    "watches_list": "Отслеживаемые ID ({total}):",
+    "watches_empty": "Ты ничего не отслеживаешь. /watch ID — добавить.",
+    "watch_digest": "🔔 Отслеживаемые ID в новых сообщениях:",
+    "watch_digest_more": "…и ещё {n}",
+    "bulk_usage": "Формат: /bulk ID ID ... (или список ID сообщением, или файл .txt/.csv) — сводка по всем ID сразу.",
+    "bulk_too_many": "За раз можно проверить не больше {limit} ID.",
+    "bulk_bad_file": "Нужен файл .txt или .csv до {mb} МБ со списком ID.",
+    "bulk_summary": "Проверено ID: {total}. Есть в базе: {found}, нет: {missing}.",
+    "bulk_line": "<code>{id}</code> — сообщений: {count}, чатов: {chats}, последнее: {last}",
+    "bulk_more": "…и ещё {n} — в файле.",
+    "bulk_missing": "Нет в базе: {ids}",
+    "bulk_report": "📄 Все сообщения (CSV)",
+    "bulk_expired": "Результаты устарели — проверь список ещё раз.",
+    "find_not_found": "Ничего не найдено."
 }
 
 UK = {
@@ -61,6 +88,10 @@ UK = {
     "menu_lang_set": "Мову перемкнено.",
     "search_enter_id": "Введи 10-значний ID чоловіка.",
     "search_not_found": "Нічого не знайдено за цим ID.",
+    "search_suggest": "За цим ID нічого немає. Схожі відомі ID:",
+    "prefix_found": "ID, що починаються з {prefix}: {count}",
+    "prefix_first": "Показано перші {shown}, уточни запит.",
+    "prefix_none": "Немає відомих ID, що починаються з {prefix}.",
     "more": "Показати ще",
     "admin_only": "Лише для адміністраторів.",
     "admin_menu": "Адмін-меню",
@@ -82,7 +113,7 @@ UK = {
     "export_male": "Експорт за чоловічим ID",
     "export_all": "Повний експорт",
     "enter_female_id": "Введи 10-значний жіночий ID.",
-    "enter_male_id": "Введи 10-значний чоловічий ID.",
+    "enter_male_id": "Введи 10-значний чоловічий ID (можна кілька через пробіл або з нового рядка).",
     "bad_id": "Потрібно рівно 10 цифр.",
     "rate_limited": "Занадто часто. Зачекай кілька секунд.",
     "prompt_add_user": "Надішліть @username користувача (без посилання), якого потрібно ДОДАТИ до використання бота.",
@@ -92,13 +123,36 @@ UK = {
     "admin_remove_user": "➖ Удалити користувача",
     "not_authorized": "У вас немає доступу. Зверніться до адміністратора бота.",
     "only_superadmin": "Ця дія доступна лише суперадміну.",
+    "maintenance_report": "Перенесено в архів: {archived}\nБД: {db_mb} МБ, WAL: {wal_mb} МБ\n"
+                          "Звільнено: {reclaimed_mb} МБ, вільних сторінок: {free_pages}",
 
     "add_chat_admins_only": "Додавати чати можуть лише адміни або суперадмін.",
     "auth_secret_dm": "Пароль для авторизації чату: <b>{secret}</b>\nПерейдіть у потрібну групу та надішліть: <code>/authorize {secret}</code>",
     "authorize_need_token": "Потрібно використати формат: /authorize <пароль>, отриманий у особистих повідомленнях від бота.",
     "authorize_bad_or_expired": "Пароль не підходить або застарів. Згенеруйте новий в особистих.",
     "unauthorize_ok": "Чат видалено зі списку дозволених.",
-    "unauthorize_only_superadmin": "Видаляти чати може лише суперадмін."
+    "unauthorize_only_superadmin": "Видаляти чати може лише суперадмін.",
+
+    "find_usage": "Формат: /find <слова або @username>. Слово* — пошук за початком слова.",
+    "find_pending": "Повнотекстовий індекс ще будується ({pct}%). Спробуй пізніше.",
+    "watch_usage": "Формат: /watch ID [ID ...] — повідомляти про нові повідомлення з цими ID; /unwatch ID [ID ...] або /unwatch all; /watches — список.",
+    "watch_added": "Додано: {added}. Всього відстежується: {total}.",
+    "watch_limit": "Можна відстежувати не більше {limit} ID.",
+    "unwatch_done": "Знято: {removed}. Залишилось: {total}.",
+    "watches_list": "Відстежувані ID ({total}):",
+    "watches_empty": "Ти нічого не відстежуєш. /watch ID — додати.",
+    "watch_digest": "🔔 Відстежувані ID у нових повідомленнях:",
+    "watch_digest_more": "…і ще {n}",
+    "bulk_usage": "Формат: /bulk ID ID ... (або список ID повідомленням, або файл .txt/.csv) — зведення по всіх ID одразу.",
+    "bulk_too_many": "За раз можна перевірити не більше {limit} ID.",
+    "bulk_bad_file": "Потрібен файл .txt або .csv до {mb} МБ зі списком ID.",
+    "bulk_summary": "Перевірено ID: {total}. Є в базі: {found}, немає: {missing}.",
+    "bulk_line": "<code>{id}</code> — повідомлень: {count}, чатів: {chats}, останнє: {last}",
+    "bulk_more": "…і ще {n} — у файлі.",
+    "bulk_missing": "Немає в базі: {ids}",
+    "bulk_report": "📄 Усі повідомлення (CSV)",
+    "bulk_expired": "Результати застаріли — перевір список ще раз.",
+    "find_not_found": "Нічого не знайдено."
 }
 
 def t(lang: Lang, key: str, **kwargs) -> str:
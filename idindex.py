@@ -0,0 +1,114 @@
+"""In-memory index of known male IDs for prefix and typo-tolerant lookups.
+
+IDs are kept as int64 in a sorted `array('q')` (8 bytes per ID) plus a small
+sorted buffer of recent additions that is merged in when it grows. A prefix
+is a range scan; "did you mean" tries the 90 one-digit substitutions and 9
+adjacent swaps of an ID with binary searches, well under a millisecond for
+millions of IDs.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterable
+
+ID_LEN = 10
+MERGE_AT = 4096
+
+
+def _fmt(n: int) -> str:
+    return f"{n:0{ID_LEN}d}"
+
+
+class IdIndex:
+    def __init__(self):
+        self._base = array("q")
+        self._delta: list[int] = []
+        self._lock = threading.Lock()
+        self.last_message_id = 0  # high-water mark for refresh()
+
+    def __len__(self) -> int:
+        return len(self._base) + len(self._delta)
+
+    def __contains__(self, male_id: str) -> bool:
+        return self._has(int(male_id))
+
+    # ---- Building
+    def load(self, db):
+        """Full build from male_stats (every ID ever seen, archived ones included). Blocking."""
+        started = time.monotonic()
+        conn = db.rconn
+        last = conn.execute("SELECT coalesce(MAX(id), 0) FROM messages").fetchone()[0]
+        ids = array("q", sorted(int(r[0]) for r in conn.execute("SELECT male_id FROM male_stats")))
+        with self._lock:
+            self._base, self._delta = ids, [x for x in self._delta if not _contains(ids, x)]
+            self.last_message_id = max(self.last_message_id, last)
+        return {"ids": len(ids), "ms": round((time.monotonic() - started) * 1000, 1)}
+
+    def refresh(self, db) -> int:
+        """Adds IDs of messages stored since the last load/refresh (e.g. by other worker processes). Blocking."""
+        rows = db.rconn.execute(
+            """SELECT m.id, mm.male_id FROM messages m JOIN message_male_ids mm ON mm.message_id_ref = m.id
+               WHERE m.id > ? ORDER BY m.id""", (self.last_message_id,)).fetchall()
+        if rows:
+            self.add(r[1] for r in rows)
+            self.last_message_id = max(self.last_message_id, rows[-1][0])
+        return len(rows)
+
+    def add(self, male_ids: Iterable):
+        with self._lock:
+            for male_id in male_ids:
+                n = int(male_id)
+                if not _contains(self._base, n) and not _contains(self._delta, n):
+                    insort(self._delta, n)
+            if len(self._delta) >= MERGE_AT:
+                self._merge()
+
+    def _merge(self):
+        """Copies base in slices between the buffered IDs (memcpy speed, no re-sort)."""
+        base, merged, pos = self._base, array("q"), 0
+        for n in self._delta:
+            i = bisect_left(base, n, pos)
+            merged.extend(base[pos:i])
+            merged.append(n)
+            pos = i
+        merged.extend(base[pos:])
+        self._base, self._delta = merged, []
+
+    # ---- Lookups
+    def _has(self, n: int) -> bool:
+        return _contains(self._base, n) or _contains(self._delta, n)
+
+    def prefix(self, prefix: str, limit: int = 10) -> tuple[int, list[str]]:
+        """(number of known IDs starting with `prefix`, the first `limit` of them)."""
+        pad = ID_LEN - len(prefix)
+        lo, hi = int(prefix + "0" * pad), int(prefix + "9" * pad)
+        base, delta = self._base, self._delta
+        b0, b1 = bisect_left(base, lo), bisect_right(base, hi)
+        d0, d1 = bisect_left(delta, lo), bisect_right(delta, hi)
+        first = sorted(base[b0:min(b1, b0 + limit)].tolist() + delta[d0:min(d1, d0 + limit)])[:limit]
+        return (b1 - b0) + (d1 - d0), [_fmt(n) for n in first]
+
+    def similar(self, male_id: str, limit: int = 10) -> list[str]:
+        """Known IDs one digit substitution or one adjacent transposition away from `male_id`."""
+        found = []
+        digits = list(male_id)
+        for i, d in enumerate(male_id):
+            for c in "0123456789":
+                if c != d:
+                    digits[i] = c
+                    n = int("".join(digits))
+                    if self._has(n):
+                        found.append(n)
+            digits[i] = d
+        for i in range(ID_LEN - 1):
+            if male_id[i] != male_id[i + 1]:
+                n = int(male_id[:i] + male_id[i + 1] + male_id[i] + male_id[i + 2:])
+                if self._has(n):
+                    found.append(n)
+        return [_fmt(n) for n in sorted(set(found))[:limit]]
+
+
+def _contains(seq, n: int) -> bool:
+    i = bisect_left(seq, n)
+    return i < len(seq) and seq[i] == n
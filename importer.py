@@ -0,0 +1,226 @@
+"""Offline import of chat history from a Telegram Desktop export (result.json).
+
+    python importer.py path/to/result.json [--chat-id -100...] [--workers 4]
+
+Only messages with 10-digit IDs are stored, exactly like live indexing. Rows are
+deduplicated on (chat_id, message_id) and progress is checkpointed in `settings`
+in the same transaction, so an interrupted import resumes where it stopped.
+The bot may keep running: writes go in bounded transactions that wait for its
+lock instead of failing.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from db import DB
+from logging_config import setup_logging
+from utils import extract_male_ids
+
+logger = logging.getLogger("importer")
+
+MEDIA_TYPES = {
+    "video_file": "video",
+    "video_message": "video",
+    "animation": "document",
+    "voice_message": "voice",
+    "audio_file": "audio",
+    "sticker": "sticker",
+}
+FROM_ID_RE = re.compile(r"(?:user|channel)?(\d+)$")
+
+
+class ExportReader:
+    """Streams the `messages` array of result.json one object at a time."""
+
+    def __init__(self, path: str, chunk_size: int = 1 << 20):
+        self.path = path
+        self.chunk_size = chunk_size
+        with open(path, encoding="utf-8") as f:
+            head = ""
+            while '"messages"' not in head:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    raise ValueError("no \"messages\" array: not a single-chat Telegram export")
+                head += chunk
+        # chat fields precede the messages array
+        head = head.split('"messages"', 1)[0]
+        self.header = dict(re.findall(r'"(type|id)"\s*:\s*"?([\w-]+)"?', head))
+
+    def __iter__(self):
+        decoder = json.JSONDecoder()
+        with open(self.path, encoding="utf-8") as f:
+            buf = ""
+            while '"messages"' not in buf:
+                buf += f.read(self.chunk_size)
+            buf = buf.split('"messages"', 1)[1]
+            pos = buf.index("[") + 1
+            eof = False
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buf) and buf[pos] == "]":
+                    return
+                try:
+                    if pos >= len(buf):
+                        raise json.JSONDecodeError("need more data", buf, pos)
+                    obj, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    # object cut by the chunk boundary: drop what's consumed and read on
+                    chunk = f.read(self.chunk_size)
+                    eof = not chunk
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+                yield obj
+
+    def chat_id(self) -> int:
+        """Bot API chat id for the exported chat (supergroups and channels get the -100 prefix)."""
+        raw = int(self.header["id"])
+        if self.header.get("type", "").endswith(("supergroup", "channel")):
+            return int(f"-100{raw}")
+        return -raw
+
+
+def flatten_text(text) -> str:
+    if isinstance(text, str):
+        return text
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in text or [])
+
+
+def parse_batch(chat_id: int, messages: list[dict]) -> list[tuple[dict, list[str]]]:
+    """Runs in worker processes: export objects -> (save_message kwargs, male_ids) for indexed ones."""
+    out = []
+    for msg in messages:
+        if msg.get("type") != "message":
+            continue
+        text = flatten_text(msg.get("text"))
+        male_ids = extract_male_ids(text)
+        if not male_ids:
+            continue
+        if "date_unixtime" in msg:
+            date = int(msg["date_unixtime"])
+        else:
+            date = int(datetime.fromisoformat(msg["date"]).timestamp())
+        if "photo" in msg:
+            media_type = "photo"
+        elif "media_type" in msg:
+            media_type = MEDIA_TYPES.get(msg["media_type"], "document")
+        elif "file" in msg:
+            media_type = "document"
+        else:
+            media_type = "text"
+        sender = FROM_ID_RE.match(str(msg.get("from_id") or ""))
+        out.append((dict(
+            chat_id=chat_id,
+            message_id=msg["id"],
+            sender_id=int(sender.group(1)) if sender else None,
+            sender_username=None,  # exports carry display names only
+            sender_first_name=msg.get("from"),
+            date=date,
+            text=text,
+            media_type=media_type,
+            file_id=None,
+            is_forward=1 if "forwarded_from" in msg else 0,
+        ), male_ids))
+    return out
+
+
+def batches(messages, size: int, after: int):
+    batch = []
+    for msg in messages:
+        if msg.get("id", 0) <= after:
+            continue
+        batch.append(msg)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run(path: str, db_path: str, chat_id: int = None, workers: int = None, parse_size: int = 5000,
+        commit_size: int = 5000, pause_ms: int = 50, restart: bool = False):
+    reader = ExportReader(path)
+    chat_id = chat_id or reader.chat_id()
+    key = f"import:{chat_id}"
+    workers = workers or os.cpu_count() or 1
+    db = DB(db_path, readers=1)
+    conn = db.conn
+    saved = {p: conn.execute(f"PRAGMA {p}").fetchone()[0] for p in ("synchronous", "cache_size", "temp_store")}
+    # bulk-load settings for this connection only; the bot's connections are unaffected
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=60000")
+    after = 0 if restart else int(db.get_setting(key) or 0)
+    if after:
+        logger.info("Resuming %s after message %s", chat_id, after)
+    if db.get_allowed_chat(chat_id) is None:
+        logger.warning("Chat %s is not in allowed_chats; its messages will still be searchable", chat_id)
+
+    started = time.perf_counter()
+    seen = stored = 0
+    pending: list[tuple[dict, list[str]]] = []
+
+    def collect(last_id: int, n: int, parsed: list):
+        nonlocal pending, seen, stored
+        pending.extend(parsed)
+        seen += n
+        if len(pending) < commit_size:
+            return
+        db.save_messages(pending, checkpoint=(key, str(last_id)))
+        stored += len(pending)
+        pending = []
+        time.sleep(pause_ms / 1000)  # lets the bot's writer in between bulk transactions
+        logger.info("%s messages read, %s stored, %.0f msg/min",
+                    seen, stored, seen / (time.perf_counter() - started) * 60)
+
+    last_id = after
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            window = []
+            for batch in batches(reader, parse_size, after):
+                window.append((batch[-1].get("id", 0), len(batch), pool.submit(parse_batch, chat_id, batch)))
+                # a few batches in flight keep the workers busy while memory stays bounded
+                if len(window) > workers * 2:
+                    last_id, n, fut = window.pop(0)
+                    collect(last_id, n, fut.result())
+            for last_id, n, fut in window:
+                collect(last_id, n, fut.result())
+        db.save_messages(pending, checkpoint=(key, str(last_id)))
+        stored += len(pending)
+    finally:
+        for pragma, value in saved.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+        db.close()
+    logger.info("Done: %s messages read, %s stored in %.1fs", seen, stored, time.perf_counter() - started)
+    return seen, stored
+
+
+def main():
+    load_dotenv()
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Import a Telegram Desktop chat export (result.json)")
+    parser.add_argument("path")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "./bot.db"))
+    parser.add_argument("--chat-id", type=int, help="Bot API chat id; derived from the export by default")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--commit-size", type=int, default=5000, help="stored messages per transaction")
+    parser.add_argument("--pause-ms", type=int, default=50, help="sleep between transactions")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+    run(args.path, args.db, chat_id=args.chat_id, workers=args.workers, commit_size=args.commit_size,
+        pause_ms=args.pause_ms, restart=args.restart)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """Write-behind buffer for indexed group messages.
+
+    Messages are flushed in one transaction every `batch_size` messages or
+    `flush_ms` milliseconds, whichever comes first. When `max_pending` messages
+    are waiting, `put` flushes inline so a stalled disk slows producers down
+    instead of growing the buffer forever.
+
+    Edits wait `edit_window_ms` after the first edit of a message: a burst of
+    edits to the same message is applied once, with its latest version, after
+    the buffered messages so an edit never overtakes its original.
+    """
+
+    def __init__(self, db, batch_size: int = 200, flush_ms: int = 250, max_pending: int = 10000,
+                 edit_window_ms: int = 1000):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_ms) / 1000
+        self.max_pending = max(self.batch_size, max_pending)
+        self._buf: list[tuple[dict, list[str]]] = []
+        self._keys: set[tuple[int, int]] = set()
+        self.edit_window = max(0, edit_window_ms) / 1000
+        self._edits: dict[tuple[int, int], tuple[float, dict, list[str]]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # counters
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.edits = 0
+        self.edits_applied = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def depth(self) -> int:
+        return len(self._buf)
+
+    def is_pending(self, chat_id: int, message_id: int) -> bool:
+        """True while the message is buffered or being flushed."""
+        return (chat_id, message_id) in self._keys
+
+    async def put(self, row: dict, male_ids: list[str]):
+        self._buf.append((row, male_ids))
+        self._keys.add((row["chat_id"], row["message_id"]))
+        self.enqueued += 1
+        if len(self._buf) >= self.max_pending:
+            await self.flush()
+        elif len(self._buf) >= self.batch_size:
+            self._wakeup.set()
+
+    async def put_edit(self, row: dict, male_ids: list[str]):
+        key = (row["chat_id"], row["message_id"])
+        first = self._edits[key][0] if key in self._edits else time.monotonic()
+        self._edits[key] = (first, row, male_ids)  # the latest version wins
+        self.edits += 1
+
+    async def flush_edits(self, force: bool = False):
+        """Applies edits whose window has passed (all of them with force)."""
+        deadline = time.monotonic() - self.edit_window
+        due = [k for k, (first, _, _) in self._edits.items() if force or first <= deadline]
+        if not due:
+            return
+        if any(k in self._keys for k in due):
+            await self.flush()  # originals first
+        batch = [self._edits.pop(k)[1:] for k in due if k in self._edits]
+        async with self._flush_lock:
+            try:
+                await self.db.aio.apply_edits(batch)
+                self.edits_applied += len(batch)
+            except Exception:
+                logger.exception("Dropping %s edits", len(batch))
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buf:
+                return
+            batch, self._buf = self._buf, []
+            started = time.perf_counter()
+            try:
+                await self.db.aio.save_messages(batch)
+                self.written += len(batch)
+            except Exception:
+                logger.exception("Batch of %s messages failed, retrying one by one", len(batch))
+                await self._flush_one_by_one(batch)
+            finally:
+                self._keys = {(r["chat_id"], r["message_id"]) for r, _ in self._buf}
+                elapsed = (time.perf_counter() - started) * 1000
+                self.flushes += 1
+                self.last_flush_ms = elapsed
+                self.max_flush_ms = max(self.max_flush_ms, elapsed)
+                self.total_flush_ms += elapsed
+
+    async def _flush_one_by_one(self, batch: list[tuple[dict, list[str]]]):
+        for item in batch:
+            try:
+                await self.db.aio.save_messages([item])
+                self.written += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Dropping message %s:%s", item[0]["chat_id"], item[0]["message_id"])
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                await self.flush_edits()
+            except Exception:
+                logger.exception("Ingest flush failed")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self.flush_edits(force=True)
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._buf),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "edits": self.edits,
+            "edits_applied": self.edits_applied,
+            "edits_pending": len(self._edits),
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+        }
@@ -42,19 +42,182 @@ CREATE TABLE IF NOT EXISTS messages (
     media_type TEXT,
     file_id TEXT,
     is_forward INTEGER DEFAULT 0,
+    text_hash BLOB,  -- body in `texts` (text is then NULL); added to older databases by DB.ensure_schema
     UNIQUE(chat_id, message_id)
 );
 
+-- male_id is the 10-digit ID as an INTEGER (half the size of the string, in the table and the
+-- index); string parameters convert by column affinity, and printf('%010d', male_id) gives the
+-- string back with its leading zeros. The primary key clusters the links by (male_id,
+-- message_id_ref), so search reads them without a separate covering index. Databases from
+-- before keep a TEXT column until migrate_ids.py rebuilds the table; all queries work on both.
+-- DB.ensure_schema adds the table's other index: idx_links_msg (message_id_ref) on the
+-- INTEGER table, the covering idx_male_ref (male_id, message_id_ref) on the TEXT one.
 CREATE TABLE IF NOT EXISTS message_male_ids (
+    male_id INTEGER NOT NULL,
     message_id_ref INTEGER NOT NULL,
-    male_id TEXT NOT NULL,
-    UNIQUE(message_id_ref, male_id),
+    PRIMARY KEY (male_id, message_id_ref),
     FOREIGN KEY(message_id_ref) REFERENCES messages(id) ON DELETE CASCADE
-);
-CREATE INDEX IF NOT EXISTS idx_male_id ON message_male_ids(male_id);
+) WITHOUT ROWID;
 
 CREATE INDEX IF NOT EXISTS idx_messages_chat ON messages(chat_id, message_id);
+-- id is the rowid, so this already orders by (date, id) for keyset pagination
 CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date);
+CREATE INDEX IF NOT EXISTS idx_messages_text_hash ON messages(text_hash) WHERE text_hash IS NOT NULL;
+
+-- content-addressed, compressed message bodies (textstore.py); read them with inflate(body)
+CREATE TABLE IF NOT EXISTS texts (
+    hash BLOB PRIMARY KEY,  -- blake2b-128 of the UTF-8 text
+    body BLOB NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS text_dicts (
+    id INTEGER PRIMARY KEY,  -- first byte of the bodies compressed with it
+    dict BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Aggregates kept current by triggers, so counts and stats don't scan the link table.
+-- DB.rebuild_stats() recomputes them from scratch.
+CREATE TABLE IF NOT EXISTS male_stats (
+    male_id TEXT PRIMARY KEY,
+    msg_count INTEGER NOT NULL DEFAULT 0,
+    chat_count INTEGER NOT NULL DEFAULT 0,
+    first_date INTEGER,
+    last_date INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS male_chat_stats (
+    male_id TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    msg_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY(male_id, chat_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS stats_totals (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+
+-- a row here only inside archive.py's batch transaction (never visible to other connections):
+-- archived rows leave the all-time aggregates alone, archive_index keeps counting them
+CREATE TABLE IF NOT EXISTS archiving (
+    id INTEGER PRIMARY KEY CHECK (id = 1)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_messages_ins AFTER INSERT ON messages BEGIN
+    INSERT INTO stats_totals(key, value) VALUES('messages', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1;
+END;
+
+-- unlink before the row disappears so trg_links_del still sees its chat and date
+CREATE TRIGGER IF NOT EXISTS trg_messages_del BEFORE DELETE ON messages
+WHEN NOT EXISTS (SELECT 1 FROM archiving) BEGIN
+    DELETE FROM message_male_ids WHERE message_id_ref = OLD.id;
+    UPDATE stats_totals SET value = value - 1 WHERE key = 'messages';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_male_stats_ins AFTER INSERT ON male_stats BEGIN
+    INSERT INTO stats_totals(key, value) VALUES('men', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_male_stats_del AFTER DELETE ON male_stats BEGIN
+    UPDATE stats_totals SET value = value - 1 WHERE key = 'men';
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_links_ins AFTER INSERT ON message_male_ids BEGIN
+    INSERT INTO male_chat_stats(male_id, chat_id, msg_count)
+        SELECT printf('%010d', NEW.male_id), chat_id, 1 FROM messages WHERE id = NEW.message_id_ref
+        ON CONFLICT(male_id, chat_id) DO UPDATE SET msg_count = msg_count + 1;
+    INSERT INTO male_stats(male_id, msg_count, chat_count, first_date, last_date)
+        SELECT printf('%010d', NEW.male_id), 1, 1, date, date FROM messages WHERE id = NEW.message_id_ref
+        ON CONFLICT(male_id) DO UPDATE SET
+            msg_count = msg_count + 1,
+            chat_count = (SELECT COUNT(*) FROM male_chat_stats WHERE male_id = printf('%010d', NEW.male_id)),
+            first_date = min(coalesce(first_date, excluded.first_date), coalesce(excluded.first_date, first_date)),
+            last_date = max(coalesce(last_date, excluded.last_date), coalesce(excluded.last_date, last_date));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_links_del AFTER DELETE ON message_male_ids
+WHEN NOT EXISTS (SELECT 1 FROM archiving) BEGIN
+    UPDATE male_chat_stats SET msg_count = msg_count - 1
+        WHERE male_id = printf('%010d', OLD.male_id)
+          AND chat_id = (SELECT chat_id FROM messages WHERE id = OLD.message_id_ref);
+    DELETE FROM male_chat_stats WHERE male_id = printf('%010d', OLD.male_id) AND msg_count <= 0;
+    UPDATE male_stats SET msg_count = msg_count - 1
+        WHERE male_id = printf('%010d', OLD.male_id);
+    DELETE FROM male_stats WHERE male_id = printf('%010d', OLD.male_id) AND msg_count <= 0;
+    -- first/last date only need a rescan when the removed message was at an edge; archived
+    -- messages of the ID still count (archive_index)
+    UPDATE male_stats SET
+        chat_count = (SELECT COUNT(*) FROM male_chat_stats WHERE male_id = printf('%010d', OLD.male_id)),
+        first_date = CASE WHEN (SELECT date FROM messages WHERE id = OLD.message_id_ref) > first_date THEN first_date
+            ELSE (SELECT MIN(d) FROM (
+                SELECT MIN(m.date) AS d FROM message_male_ids mm JOIN messages m ON m.id = mm.message_id_ref
+                WHERE mm.male_id = OLD.male_id
+                UNION ALL
+                SELECT MIN(first_date) FROM archive_index WHERE male_id = printf('%010d', OLD.male_id))) END,
+        last_date = CASE WHEN (SELECT date FROM messages WHERE id = OLD.message_id_ref) < last_date THEN last_date
+            ELSE (SELECT MAX(d) FROM (
+                SELECT MAX(m.date) AS d FROM message_male_ids mm JOIN messages m ON m.id = mm.message_id_ref
+                WHERE mm.male_id = OLD.male_id
+                UNION ALL
+                SELECT MAX(last_date) FROM archive_index WHERE male_id = printf('%010d', OLD.male_id))) END
+        WHERE male_id = printf('%010d', OLD.male_id);
+END;
+
+-- Full-text index over message bodies and sender usernames. It reads content through
+-- a view, so the way messages store their text can change without touching the index.
+CREATE VIEW IF NOT EXISTS messages_fts_src AS
+    SELECT m.id, coalesce(m.text, inflate(t.body)) AS text, m.sender_username
+    FROM messages m LEFT JOIN texts t ON t.hash = m.text_hash;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, sender_username,
+    content='messages_fts_src', content_rowid='id',
+    tokenize="unicode61 remove_diacritics 2 tokenchars '_'"
+);
+
+-- Databases that predate the index are backfilled in batches (DB.fts_backfill_batch):
+-- ids in (after, upto] are not indexed yet, so deletes and edits there must not touch it.
+CREATE TABLE IF NOT EXISTS fts_backfill (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    after INTEGER NOT NULL,
+    upto INTEGER NOT NULL
+);
+
+-- bodies in `texts` are removed only by DB.gc_texts(), so OLD.text_hash still resolves here.
+-- DB.ensure_schema replaces triggers whose definition here has changed.
+CREATE TRIGGER IF NOT EXISTS trg_fts_ins AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, text, sender_username) VALUES (NEW.id,
+        coalesce(NEW.text, (SELECT inflate(body) FROM texts WHERE hash = NEW.text_hash)), NEW.sender_username);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_fts_del AFTER DELETE ON messages
+WHEN NOT EXISTS (SELECT 1 FROM fts_backfill WHERE OLD.id > after AND OLD.id <= upto) BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, text, sender_username) VALUES ('delete', OLD.id,
+        coalesce(OLD.text, (SELECT inflate(body) FROM texts WHERE hash = OLD.text_hash)), OLD.sender_username);
+END;
+
+-- an inline text moved to `texts` unchanged (DB.dedup_texts_batch) keeps its index entry
+CREATE TRIGGER IF NOT EXISTS trg_fts_upd AFTER UPDATE OF text, text_hash, sender_username ON messages
+WHEN NOT EXISTS (SELECT 1 FROM fts_backfill WHERE OLD.id > after AND OLD.id <= upto)
+    AND NOT (OLD.text IS NOT NULL AND NEW.text IS NULL AND NEW.sender_username IS OLD.sender_username
+             AND (SELECT inflate(body) FROM texts WHERE hash = NEW.text_hash) = OLD.text) BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, text, sender_username) VALUES ('delete', OLD.id,
+        coalesce(OLD.text, (SELECT inflate(body) FROM texts WHERE hash = OLD.text_hash)), OLD.sender_username);
+    INSERT INTO messages_fts(rowid, text, sender_username) VALUES (NEW.id,
+        coalesce(NEW.text, (SELECT inflate(body) FROM texts WHERE hash = NEW.text_hash)), NEW.sender_username);
+END;
+
+-- originals that can no longer be copied; search results go straight to the stored fallback
+CREATE TABLE IF NOT EXISTS gone_messages (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY(chat_id, message_id)
+) WITHOUT ROWID;
 
 CREATE TABLE IF NOT EXISTS searches (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -64,7 +227,32 @@ CREATE TABLE IF NOT EXISTS searches (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE IF NOT EXISTS ratelimits (
-    user_id INTEGER PRIMARY KEY,
-    last_action_ts INTEGER
-);
+-- sliding windows of the in-memory rate limiter (ratelimit.py), saved periodically;
+-- hits: comma-separated unix timestamps inside the window
+CREATE TABLE IF NOT EXISTS ratelimit_windows (
+    user_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    hits TEXT NOT NULL,
+    PRIMARY KEY (user_id, action)
+) WITHOUT ROWID;
+
+-- what archive.py moved to the per-month files, so searches open only the months that have an ID
+-- and rebuild_stats() keeps the aggregates all-time
+CREATE TABLE IF NOT EXISTS archive_index (
+    male_id TEXT NOT NULL,
+    month TEXT NOT NULL,  -- YYYY-MM
+    chat_id INTEGER NOT NULL,
+    msg_count INTEGER NOT NULL,
+    first_date INTEGER,
+    last_date INTEGER,
+    PRIMARY KEY (male_id, month, chat_id)
+) WITHOUT ROWID;
+
+-- watchlists (watch.py): male_id as INTEGER like message_male_ids, printf('%010d', ...) for the string
+CREATE TABLE IF NOT EXISTS watches (
+    male_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (male_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_watches_user ON watches(user_id);
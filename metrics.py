@@ -0,0 +1,189 @@
+import functools
+import inspect
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+REDACT_KEYS = {"value", "secret", "password", "token"}
+MAX_ARG_LEN = 64
+
+# tuned from bot.py via configure()
+SLOW_MS = 200.0
+ARG_SAMPLE = 1.0
+
+
+def configure(slow_ms: float = None, arg_sample: float = None):
+    global SLOW_MS, ARG_SAMPLE
+    if slow_ms is not None:
+        SLOW_MS = slow_ms
+    if arg_sample is not None:
+        ARG_SAMPLE = arg_sample
+
+
+class MethodStats:
+    __slots__ = ("calls", "errors", "total_ms", "max_ms", "buckets", "_lock")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self._lock = threading.Lock()
+
+    def observe(self, ms: float, error: bool):
+        with self._lock:
+            self.calls += 1
+            self.errors += error
+            self.total_ms += ms
+            if ms > self.max_ms:
+                self.max_ms = ms
+            self.buckets[bisect_left(BUCKETS_MS, ms)] += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the histogram bucket holding the q-quantile."""
+        if not self.calls:
+            return 0.0
+        rank = q * self.calls
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+
+class Registry:
+    def __init__(self):
+        self.methods: dict[str, MethodStats] = {}
+        self.collectors = {}
+
+    def method(self, name: str) -> MethodStats:
+        return self.methods.setdefault(name, MethodStats())
+
+    def add_collector(self, name: str, fn):
+        """fn() -> dict of gauge values, reported as <name>_<key>."""
+        self.collectors[name] = fn
+
+    def gauges(self) -> dict:
+        out = {}
+        for name, fn in self.collectors.items():
+            try:
+                for key, value in fn().items():
+                    out[f"{name}_{key}"] = value
+            except Exception:
+                logger.exception("Metrics collector %s failed", name)
+        return out
+
+    def render_text(self) -> str:
+        lines = ["method calls err avg p50 p95 p99 max (ms)"]
+        busiest = sorted(self.methods.items(), key=lambda kv: kv[1].total_ms, reverse=True)
+        for name, s in busiest:
+            if not s.calls:
+                continue
+            lines.append(
+                f"{name.split('.')[-1]} {s.calls} {s.errors} {s.total_ms / s.calls:.1f} "
+                f"{s.quantile(.5):g} {s.quantile(.95):g} {s.quantile(.99):g} {s.max_ms:.0f}"
+            )
+        lines += [f"{k}: {v}" for k, v in self.gauges().items()]
+        return "\n".join(lines)
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# TYPE db_call_duration_ms histogram",
+        ]
+        for name, s in self.methods.items():
+            label = f'method="{name}"'
+            seen = 0
+            for bound, n in zip(BUCKETS_MS, s.buckets):
+                seen += n
+                lines.append(f'db_call_duration_ms_bucket{{{label},le="{bound}"}} {seen}')
+            lines.append(f'db_call_duration_ms_bucket{{{label},le="+Inf"}} {s.calls}')
+            lines.append(f"db_call_duration_ms_sum{{{label}}} {s.total_ms:.3f}")
+            lines.append(f"db_call_duration_ms_count{{{label}}} {s.calls}")
+        lines.append("# TYPE db_call_errors_total counter")
+        for name, s in self.methods.items():
+            lines.append(f'db_call_errors_total{{method="{name}"}} {s.errors}')
+        for key, value in self.gauges().items():
+            lines.append(f"# TYPE {key} gauge")
+            lines.append(f"{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _redact(key: str, value):
+    """Log-safe form of an argument: containers may hold message texts at any depth
+    (batches of rows), so sequences are logged as type and length only and dicts
+    are redacted key by key."""
+    if key in REDACT_KEYS:
+        return "***"
+    if isinstance(value, str) and (key == "text" or len(value) > MAX_ARG_LEN):
+        return f"<{len(value)} chars>"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, dict):
+        if len(value) > 10:
+            return f"<dict of {len(value)}>"
+        return {k: _redact(str(k), v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return f"<{type(value).__name__} of {len(value)}>"
+    return value
+
+
+def _format_args(sig: inspect.Signature, args, kwargs) -> dict:
+    try:
+        bound = sig.bind(*args, **kwargs)
+    except TypeError:
+        return {}
+    return {k: _redact(k, v) for k, v in bound.arguments.items() if k != "self"}
+
+
+def profiled(func):
+    """Counts calls, errors and latency of a DB method; logs slow calls and,
+    at DEBUG, a sample of calls with redacted arguments."""
+    name = func.__qualname__
+    sig = inspect.signature(func)
+    log = logging.getLogger(func.__module__)
+    stats = REGISTRY.method(name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        error = False
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            error = True
+            log.exception("Error in %s", name)
+            raise
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            stats.observe(ms, error)
+            if ms >= SLOW_MS:
+                log.warning("Slow %s: %.1f ms %s", name, ms, _format_args(sig, args, kwargs))
+            elif log.isEnabledFor(logging.DEBUG) and (ARG_SAMPLE >= 1 or random.random() < ARG_SAMPLE):
+                log.debug("%s %.2f ms %s", name, ms, _format_args(sig, args, kwargs))
+    return wrapper
+
+
+async def start_http(host: str, port: int):
+    """Serves REGISTRY in Prometheus text format at http://host:port/metrics."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=REGISTRY.render_prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics endpoint on http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,145 @@
+"""Online migration of message_male_ids to INTEGER male IDs (see messages.sql).
+
+    python3 migrate_ids.py ./bot.db [--batch 20000]
+
+The bot keeps running. A WITHOUT ROWID copy is filled in male_id order from
+the old table's covering index idx_male_ref, in short transactions; triggers
+on the old table mirror links added or removed meanwhile. The swap (drop the
+old table, rename the copy, recreate its index and the triggers that use it)
+is one transaction, after the copy is checked against the original. The old
+indexes are dropped with the old table and not rebuilt: the copy is stored in
+(male_id, message_id_ref) primary key order, which is what idx_male_ref covered.
+Interrupted runs resume from the checkpoint in `settings`.
+"""
+import argparse
+import logging
+import time
+
+from db import DB, LINKS_BY_MESSAGE_INDEX, integer_male_ids, schema_statements
+
+logger = logging.getLogger("migrate_ids")
+
+NEW_TABLE = "message_male_ids_int"
+CHECKPOINT = "migrate_ids:after"
+# triggers that read or write message_male_ids; recreated from messages.sql after the swap
+LINK_TRIGGERS = ("trg_messages_del", "trg_links_ins", "trg_links_del")
+MIRROR_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS trg_migrate_links_ins AFTER INSERT ON message_male_ids BEGIN
+    INSERT OR IGNORE INTO {NEW_TABLE}(male_id, message_id_ref) VALUES (CAST(NEW.male_id AS INTEGER), NEW.message_id_ref);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_migrate_links_del AFTER DELETE ON message_male_ids BEGIN
+    DELETE FROM {NEW_TABLE} WHERE male_id = CAST(OLD.male_id AS INTEGER) AND message_id_ref = OLD.message_id_ref;
+END;
+"""
+
+
+def prepare(db: DB):
+    with db.write_lock:
+        conn = db.conn
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {NEW_TABLE} (
+                             male_id INTEGER NOT NULL,
+                             message_id_ref INTEGER NOT NULL,
+                             PRIMARY KEY (male_id, message_id_ref),
+                             FOREIGN KEY(message_id_ref) REFERENCES messages(id) ON DELETE CASCADE
+                         ) WITHOUT ROWID""")
+        conn.executescript(MIRROR_TRIGGERS)
+
+
+def copy_batch(db: DB, after: tuple[str, int], limit: int) -> tuple[int, tuple[str, int]]:
+    """Copies the next `limit` links after (male_id, message_id_ref) in index order."""
+    with db.write_lock:
+        conn = db.conn
+        with conn:
+            # read and copy in one write transaction: a link the bot deletes in between
+            # would otherwise be copied after its mirror trigger already ran
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """SELECT male_id, message_id_ref FROM message_male_ids
+                   WHERE (male_id, message_id_ref) > (?, ?) ORDER BY male_id, message_id_ref LIMIT ?""",
+                (*after, limit)).fetchall()
+            if not rows:
+                return 0, after
+            last = (rows[-1][0], rows[-1][1])
+            conn.executemany(f"INSERT OR IGNORE INTO {NEW_TABLE}(male_id, message_id_ref) VALUES (CAST(? AS INTEGER), ?)",
+                             [tuple(r) for r in rows])
+            conn.execute("INSERT OR REPLACE INTO settings(key, value) VALUES(?, ?)", (CHECKPOINT, f"{last[0]}:{last[1]}"))
+        return len(rows), last
+
+
+def swap(db: DB) -> int:
+    """Replaces the old table with the copy in one transaction. Returns the number of links."""
+    with db.write_lock:
+        conn = db.conn
+        triggers = schema_statements(LINK_TRIGGERS)
+        if len(triggers) != len(LINK_TRIGGERS):
+            raise RuntimeError("messages.sql doesn't define all link triggers")
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute("SELECT COUNT(*) FROM message_male_ids").fetchone()[0]
+            new = conn.execute(f"SELECT COUNT(*) FROM {NEW_TABLE}").fetchone()[0]
+            missing = conn.execute(
+                f"""SELECT COUNT(*) FROM message_male_ids o WHERE NOT EXISTS (
+                        SELECT 1 FROM {NEW_TABLE} n
+                        WHERE n.male_id = CAST(o.male_id AS INTEGER) AND n.message_id_ref = o.message_id_ref)"""
+            ).fetchone()[0]
+            if old != new or missing:
+                raise RuntimeError(f"copy differs: {old} links, {new} copied, {missing} missing")
+            for name in LINK_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+            conn.execute("DROP TABLE message_male_ids")  # with its indexes and mirror triggers
+            conn.execute(f"ALTER TABLE {NEW_TABLE} RENAME TO message_male_ids")
+            conn.execute(LINKS_BY_MESSAGE_INDEX)
+            for sql in triggers:
+                conn.execute(sql)
+            conn.execute("DELETE FROM settings WHERE key = ?", (CHECKPOINT,))
+        return new
+
+
+def migrate(db: DB, batch: int = 20000, pause: float = 0.01) -> dict:
+    if integer_male_ids(db.conn):
+        return {"migrated": 0, "status": "already INTEGER"}
+    started = time.perf_counter()
+    pages_before = db.conn.execute("PRAGMA page_count").fetchone()[0]
+    total = db.conn.execute("SELECT COUNT(*) FROM message_male_ids").fetchone()[0]
+    prepare(db)
+    saved = db.get_setting(CHECKPOINT)
+    after = (saved.split(":")[0], int(saved.split(":")[1])) if saved else ("", 0)
+    copied = 0
+    while True:
+        n, after = copy_batch(db, after, batch)
+        if not n:
+            break
+        copied += n
+        elapsed = time.perf_counter() - started
+        logger.info("%s/%s links, %.0f/s", copied, total, copied / elapsed if elapsed else 0)
+        time.sleep(pause)  # let the bot's writes in
+    links = swap(db)
+    db.conn.execute("PRAGMA optimize")
+    page_size = db.conn.execute("PRAGMA page_size").fetchone()[0]
+    free = db.conn.execute("PRAGMA freelist_count").fetchone()[0]
+    used = db.conn.execute("PRAGMA page_count").fetchone()[0] - free
+    return {
+        "migrated": links,
+        "used_bytes_before": pages_before * page_size,
+        "used_bytes_after": used * page_size,
+        "free_bytes": free * page_size,  # reusable; VACUUM (/maintenance full) returns it to the OS
+        "s": round(time.perf_counter() - started, 1),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Convert message_male_ids to INTEGER male IDs, online")
+    parser.add_argument("db")
+    parser.add_argument("--batch", type=int, default=20000, help="links per transaction")
+    args = parser.parse_args()
+    db = DB(args.db, readers=1)
+    try:
+        for key, value in migrate(db, args.batch).items():
+            print(f"{key}: {value}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Policy(NamedTuple):
+    limit: int      # actions allowed ...
+    window: float   # ... per this many seconds
+
+
+# (role, action) -> Policy; None means unlimited. "*" matches any action of the role.
+DEFAULT_POLICIES: dict[tuple[str, str], Optional[Policy]] = {
+    ("owner", "*"): None,
+    ("admin", "search"): Policy(1, 2),
+    ("admin", "more"): Policy(5, 10),
+    ("admin", "export"): Policy(3, 60),
+    ("admin", "bulk"): Policy(3, 60),
+    ("user", "search"): Policy(1, 5),
+    ("user", "more"): Policy(3, 10),
+    ("user", "export"): Policy(1, 300),
+    ("user", "bulk"): Policy(1, 300),
+}
+
+
+def parse_policies(spec: str) -> dict[tuple[str, str], Optional[Policy]]:
+    """'admin.search=1/2,owner.*=0' -> policies; a limit of 0 means unlimited."""
+    policies = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        key, _, value = item.partition("=")
+        role, _, action = key.strip().partition(".")
+        limit, _, window = value.partition("/")
+        policies[(role, action or "*")] = Policy(int(limit), float(window or 1)) if int(limit) else None
+    return policies
+
+
+class RateLimiter:
+    """Sliding-window limiter kept in memory; windows are saved to SQLite now and then
+    (and on shutdown) so limits survive restarts without a write per check."""
+
+    def __init__(self, db, policies: Optional[dict] = None):
+        self.db = db
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(policies or {})
+        self.max_window = max((p.window for p in self.policies.values() if p), default=0)
+        self.hits: dict[tuple[int, str], deque] = {}
+        self._dirty: set[tuple[int, str]] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def policy(self, role: str, action: str) -> Optional[Policy]:
+        if (role, action) in self.policies:
+            return self.policies[(role, action)]
+        return self.policies.get((role, "*"))
+
+    def allow(self, user_id: int, role: str, action: str, now: Optional[float] = None) -> bool:
+        policy = self.policy(role, action)
+        if policy is None:
+            return True
+        now = time.time() if now is None else now
+        key = (user_id, action)
+        hits = self.hits.get(key)
+        if hits is None:
+            hits = self.hits[key] = deque()
+        while hits and hits[0] <= now - policy.window:
+            hits.popleft()
+        if len(hits) >= policy.limit:
+            return False
+        hits.append(now)
+        self._dirty.add(key)
+        return True
+
+    def load(self):
+        horizon = time.time() - self.max_window
+        for user_id, action, hits in self.db.load_rate_limits():
+            recent = [float(ts) for ts in hits.split(",") if ts and float(ts) > horizon]
+            if recent:
+                self.hits[(user_id, action)] = deque(recent)
+            else:
+                self._dirty.add((user_id, action))  # expired: deleted on the next flush
+
+    def _expire(self, now: float) -> set[tuple[int, str]]:
+        """Drops hits older than the longest window, and the windows left empty; returns their keys."""
+        horizon = now - self.max_window
+        expired = set()
+        for key, hits in self.hits.items():
+            while hits and hits[0] <= horizon:
+                hits.popleft()
+            if not hits:
+                expired.add(key)
+        for key in expired:
+            del self.hits[key]
+        return expired
+
+    async def flush(self, now: Optional[float] = None):
+        # users who went quiet no longer need memory, nor a row (empty hits delete it)
+        dirty, self._dirty = self._dirty | self._expire(time.time() if now is None else now), set()
+        if not dirty:
+            return
+        items = [(user_id, action, ",".join(f"{ts:.3f}" for ts in self.hits.get((user_id, action), ())))
+                 for user_id, action in dirty]
+        await self.db.aio.save_rate_limits(items)
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Saving rate limits failed")
+
+    def start(self, interval: float = 60):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
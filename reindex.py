@@ -0,0 +1,125 @@
+"""Re-extracts male IDs from every stored message after the rules in utils change.
+
+    python reindex.py [--workers 4] [--chunk 5000] [--dry-run]
+
+Messages are read in rowid order, `chunk` at a time, and their texts parsed in a
+process pool. Only links that differ from the stored ones are written, one short
+transaction per chunk together with the checkpoint in `settings`, so the bot can
+keep running and an interrupted reindex resumes where it stopped. Messages in
+archive files (archive.py) are not touched. `--dry-run` only counts the changes.
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+from db import DB
+from logging_config import setup_logging
+from utils import extract_male_ids
+
+logger = logging.getLogger("reindex")
+
+CHECKPOINT = "reindex:after"
+
+
+def extract_batch(texts: list[str]) -> list[list[str]]:
+    """Runs in worker processes."""
+    return [extract_male_ids(text) for text in texts]
+
+
+def read_chunks(db: DB, after: int, size: int):
+    """Yields lists of (id, text, text_hash, decoded text) in id order."""
+    while True:
+        rows = db.rconn.execute(
+            """SELECT id, text, text_hash,
+                      coalesce(text, (SELECT inflate(body) FROM texts WHERE hash = text_hash))
+               FROM messages WHERE id > ? ORDER BY id LIMIT ?""", (after, size)).fetchall()
+        if not rows:
+            return
+        yield [tuple(r) for r in rows]
+        after = rows[-1][0]
+
+
+def _eta(seconds: float) -> str:
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02d}:{s:02d}"
+
+
+def run(db_path: str, workers: int = None, chunk: int = 5000, pause_ms: int = 20, dry_run: bool = False,
+        restart: bool = False) -> dict:
+    workers = workers or os.cpu_count() or 1
+    db = DB(db_path, readers=1)
+    db.conn.execute("PRAGMA busy_timeout=60000")
+    after = 0 if restart or dry_run else int(db.get_setting(CHECKPOINT) or 0)
+    if after:
+        logger.info("Resuming after message %s", after)
+    total = db.rconn.execute("SELECT COUNT(*) FROM messages WHERE id > ?", (after,)).fetchone()[0]
+
+    started = time.perf_counter()
+    seen = changed = removed = added = 0
+
+    def apply(rows: list[tuple], male_ids: list[list[str]]):
+        nonlocal seen, changed, removed, added
+        batch = [(r[0], r[1], r[2], ids) for r, ids in zip(rows, male_ids)]
+        if dry_run:
+            diff = db.diff_links(batch)
+            n, drop, add = len(diff), sum(len(d[1]) for d in diff), sum(len(d[2]) for d in diff)
+        else:
+            n, drop, add = db.relink_messages(batch, checkpoint=(CHECKPOINT, str(rows[-1][0])))
+            time.sleep(pause_ms / 1000)  # lets the bot's writer in between transactions
+        seen += len(rows)
+        changed, removed, added = changed + n, removed + drop, added + add
+        rate = seen / (time.perf_counter() - started)
+        logger.info("%s/%s messages, %s changed (-%s +%s links), %.0f msg/s, ETA %s",
+                    seen, total, changed, removed, added, rate, _eta(max(total - seen, 0) / rate))
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            window = []
+            for rows in read_chunks(db, after, chunk):
+                window.append((rows, pool.submit(extract_batch, [r[3] for r in rows])))
+                # a few chunks in flight keep the workers busy while memory stays bounded
+                if len(window) > workers * 2:
+                    rows, fut = window.pop(0)
+                    apply(rows, fut.result())
+            for rows, fut in window:
+                apply(rows, fut.result())
+        if not dry_run:
+            db.del_setting(CHECKPOINT)  # finished: the next run starts from the beginning
+    finally:
+        db.close()
+    report = {
+        "messages": seen,
+        "messages_changed": changed,
+        "links_removed": removed,
+        "links_added": added,
+        "dry_run": dry_run,
+        "s": round(time.perf_counter() - started, 1),
+    }
+    logger.info("Done: %s", report)
+    return report
+
+
+def main():
+    load_dotenv()
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Re-extract male IDs from all stored messages")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "./bot.db"))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=5000, help="messages per transaction")
+    parser.add_argument("--pause-ms", type=int, default=20, help="sleep between transactions")
+    parser.add_argument("--dry-run", action="store_true", help="only count the links that would change")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+    report = run(args.db, workers=args.workers, chunk=args.chunk, pause_ms=args.pause_ms,
+                 dry_run=args.dry_run, restart=args.restart)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from aiogram.types import Message
+
+from utils import ID_RE
+
+BARE_ID_RE = re.compile(r"\d{10}")
+FEMALE_ID_RE = re.compile(r"f:(\d{10})")
+PREFIX_RE = re.compile(r"(\d{4,9})\*?")
+
+
+class StateStore:
+    """Per-user conversation state that expires after `ttl` seconds; at most `maxsize` users are kept."""
+
+    def __init__(self, ttl: float = 600, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = max(1, maxsize)
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, user_id: int, value: Any):
+        with self._lock:
+            self._data[user_id] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, user_id: int, default=None):
+        with self._lock:
+            item = self._data.get(user_id)
+            if item is None:
+                return default
+            if item[1] <= time.monotonic():
+                del self._data[user_id]
+                return default
+            return item[0]
+
+    def pop(self, user_id: int, default=None):
+        value = self.get(user_id, default)
+        with self._lock:
+            self._data.pop(user_id, None)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TextRouter:
+    """Routes private text messages to actions with dict lookups.
+
+    Button texts come from the i18n tables (`actions` maps an i18n key to an
+    action name), so they can't drift from the keyboards. A text with IDs goes
+    to the action the user was prompted for (one-shot, see `states`); a bare
+    10-digit ID without a prompt is a male search, `f:<id>` a female search,
+    a pasted list of several IDs a bulk lookup and 4-9 digits (optionally
+    ending in `*`) an ID prefix lookup. Anything else is left to later
+    handlers (extensions).
+    """
+
+    def __init__(self, tables, actions: dict[str, str], states: StateStore):
+        self.buttons: dict[str, str] = {}
+        for table in tables:
+            for key, action in actions.items():
+                text = table[key]
+                if self.buttons.setdefault(text, action) != action:
+                    raise ValueError(f"button {text!r} is bound to both {self.buttons[text]} and {action}")
+        self.states = states
+
+    def resolve(self, user_id: int, text: str) -> Optional[str]:
+        action = self.buttons.get(text)
+        if action is not None:
+            self.states.pop(user_id)  # navigating away cancels a pending prompt
+            return action
+        if not ID_RE.search(text):
+            return "male_prefix" if PREFIX_RE.fullmatch(text.strip()) else None
+        pending = self.states.pop(user_id)
+        if pending is not None:
+            return pending
+        text = text.strip()
+        if BARE_ID_RE.fullmatch(text):
+            return "male_search"
+        if FEMALE_ID_RE.fullmatch(text):
+            return "female_search"
+        if len(ID_RE.findall(text)) > 1:
+            return "male_bulk"
+        return None
+
+    def __call__(self, message: Message):
+        """aiogram filter: the action is passed to the handler as `action`."""
+        if not message.text or not message.from_user:
+            return False
+        action = self.resolve(message.from_user.id, message.text)
+        return {"action": action} if action else False
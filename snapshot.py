@@ -0,0 +1,96 @@
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import AsyncGenerator, Optional
+
+from aiogram.types import InputFile
+
+from export import PART_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# settings holds one-time auth secrets and must not leave the server by default
+DEFAULT_EXCLUDE = ("settings",)
+
+
+def make_snapshot(db_path: str, dest_dir: Optional[str] = None, exclude=DEFAULT_EXCLUDE,
+                  pages: int = 1024, sleep: float = 0.005) -> Path:
+    """Consistent gzip'ed copy of a live WAL database, made with the online backup API.
+
+    The source read transaction is held open for the whole copy, so every step
+    reads the same snapshot (WAL contents included) and concurrent writers never
+    force a restart or wait on us. Rows of `exclude` tables are removed from the
+    copy and the copy is vacuumed so they don't survive in free pages.
+    Blocking: run it in a thread.
+    """
+    started = time.perf_counter()
+    dest = Path(dest_dir or tempfile.gettempdir())
+    dest.mkdir(parents=True, exist_ok=True)
+    # unique name: two exports in the same second must not share (and unlink) one file
+    fd, name = tempfile.mkstemp(prefix=time.strftime("snapshot-%Y%m%d-%H%M%S-"), suffix=".db", dir=dest)
+    os.close(fd)
+    raw_path = Path(name)
+    src = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, isolation_level=None)
+    dst = sqlite3.connect(raw_path, isolation_level=None)
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # pins the read snapshot
+        src.backup(dst, pages=pages, sleep=sleep)
+        src.execute("COMMIT")
+        dst.execute("PRAGMA journal_mode=DELETE")
+        for table in exclude:
+            if dst.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+                dst.execute(f'DELETE FROM "{table}"')
+        dst.execute("VACUUM")
+    finally:
+        src.close()
+        dst.close()
+    gz_path = raw_path.with_name(raw_path.name + ".gz")
+    try:
+        with open(raw_path, "rb") as f_in, gzip.open(gz_path, "wb", compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+    finally:
+        raw_path.unlink(missing_ok=True)
+    logger.info("Snapshot %s (%s bytes) in %.1fs", gz_path, gz_path.stat().st_size, time.perf_counter() - started)
+    return gz_path
+
+
+def prune_snapshots(dest_dir: str, keep: int):
+    """Deletes all but the newest `keep` snapshots in `dest_dir`."""
+    snaps = sorted(Path(dest_dir).glob("snapshot-*.db.gz"))
+    for old in snaps[:-keep] if keep > 0 else snaps:
+        old.unlink(missing_ok=True)
+
+
+class FilePartInputFile(InputFile):
+    """Uploads `length` bytes of a file starting at `offset`, for files above the document limit."""
+
+    def __init__(self, path: Path, offset: int, length: int, filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            left = self.length
+            while left > 0 and (chunk := f.read(min(self.chunk_size, left))):
+                left -= len(chunk)
+                yield chunk
+
+
+def snapshot_parts(path: Path, part_limit: int = PART_LIMIT) -> list[FilePartInputFile]:
+    """Splits a snapshot into uploadable pieces; join them back with `cat name.0* > name`."""
+    size = path.stat().st_size
+    if size <= part_limit:
+        return [FilePartInputFile(path, 0, size, path.name)]
+    return [
+        FilePartInputFile(path, offset, min(part_limit, size - offset), f"{path.name}.{i:03d}")
+        for i, offset in enumerate(range(0, size, part_limit), 1)
+    ]
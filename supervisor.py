@@ -0,0 +1,300 @@
+"""Supervisor mode: updates are handled by N worker processes instead of one event loop.
+
+    python supervisor.py [--workers 4]
+
+This process receives updates (long polling, or the webhook server when
+WEBHOOK_PORT is set) and routes each one by chat: a chat's updates always go to
+the same worker, in order, so an edit is never handled before its original
+message. Private chats and their callbacks share the user's id, so per-user
+state (pending prompts, rate limits) stays in one worker.
+
+The supervisor is also the only SQLite writer: workers read through their own
+read-only connections and send every write here, where they run one at a time on
+a single connection. Writes that touch the lookup caches are announced to all
+workers so no worker keeps a stale admin, chat or language entry.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import pickle
+import queue
+import signal
+import threading
+
+import aiohttp
+
+from webhook import UpdateQueues, WebhookServer, chat_key
+
+logger = logging.getLogger("supervisor")
+
+
+# ---- Write channel
+def serve_writes(db, requests, results: list):
+    """Writer thread of the supervisor: runs workers' write calls on the single write connection.
+
+    A call without a method name is a job (AsyncDB.run, e.g. maintenance): it gets a
+    thread of its own and takes the write lock per batch, so other writes go on meanwhile."""
+    while True:
+        item = requests.get()
+        if item is None:
+            return
+        if item[2] is None:
+            threading.Thread(target=_serve, args=(db, results, item), name="db-job", daemon=True).start()
+        else:
+            _serve(db, results, item)
+
+
+def _serve(db, results: list, item):
+    worker, call_id, name, args, kwargs = item
+    meth = getattr(db, name) if name is not None else args[0]
+    args = args if name is not None else args[1:]
+    try:
+        value, ok = meth(*args, **kwargs), True
+    except Exception as e:
+        value, ok = e, False
+        try:
+            pickle.dumps(e)
+        except Exception:
+            value = RuntimeError(repr(e))
+    if ok and getattr(meth, "_db_invalidates", False):
+        # before the result, so the caller has dropped its entry by the time it reads again
+        for q in results:
+            q.put(("invalidate", name))
+    results[worker].put(("result", call_id, ok, value))
+
+
+class RemoteWriter:
+    """Worker end of the write channel; plugs into AsyncDB.route_writes()."""
+
+    def __init__(self, index: int, requests, results, db):
+        self.index = index
+        self.requests = requests
+        self.results = results
+        self.db = db
+        self.loop = None
+        self._ids = itertools.count()
+        self._pending: dict[tuple[int, int], asyncio.Future] = {}
+        self._thread = threading.Thread(target=self._listen, name="db-remote", daemon=True)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._thread.start()
+
+    def _listen(self):
+        while (msg := self.results.get()) is not None:
+            if msg[0] == "invalidate":
+                self.db.invalidate_caches(msg[1])
+                continue
+            _, call_id, ok, value = msg
+            fut = self._pending.pop(call_id, None)  # None: addressed to a previous, crashed worker
+            if fut is not None:
+                self.loop.call_soon_threadsafe(_resolve, fut, ok, value)
+
+    async def __call__(self, name: str, args: tuple, kwargs: dict):
+        call_id = (os.getpid(), next(self._ids))
+        fut = self.loop.create_future()
+        self._pending[call_id] = fut
+        self.requests.put((self.index, call_id, name, args, kwargs))
+        return await fut
+
+    def stop(self):
+        self.results.put(None)
+        self._thread.join()
+
+
+def _resolve(fut: asyncio.Future, ok: bool, value):
+    if fut.done():
+        return
+    if ok:
+        fut.set_result(value)
+    else:
+        fut.set_exception(value)
+
+
+# ---- Worker processes
+def worker_main(index: int, count: int, updates, requests, results, ready):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor stops workers through their queue
+    # the flood limit is shared by all workers; jobs and metrics run in the supervisor
+    os.environ["DELIVERY_GLOBAL_RATE"] = str(float(os.getenv("DELIVERY_GLOBAL_RATE", "25")) / count)
+    os.environ["METRICS_PORT"] = "0"
+    # read-only DB: no schema setup or admin seeding here, every write goes to the supervisor
+    os.environ["SUPERVISOR_WORKER"] = "1"
+    import bot as app
+    asyncio.run(run_worker(app, index, updates, requests, results, ready))
+
+
+async def run_worker(app, index: int, updates, requests, results, ready):
+    loop = asyncio.get_running_loop()
+    remote = RemoteWriter(index, requests, results, app.db)
+    remote.start(loop)
+    app.db.aio.route_writes(remote)
+    app.load_extensions()
+    app.ingest.start()
+    app.limiter.start(app.RATE_LIMIT_SAVE_S)
+    await app.dp.emit_startup(bot=app.bot)
+    handling = UpdateQueues(lambda update: app.dp.feed_raw_update(app.bot, update), app.WORKER_CONCURRENCY,
+                            app.WEBHOOK_QUEUE)
+    handling.start()
+
+    async def put_all(batch: list[dict]):
+        for update in batch:
+            await handling.put(update)
+
+    def pump():
+        while (batch := updates.get()) is not None:
+            asyncio.run_coroutine_threadsafe(put_all(batch), loop).result()
+
+    logger.info("Worker %s ready (pid %s)", index, os.getpid())
+    ready.release()
+    try:
+        await asyncio.to_thread(pump)
+    finally:
+        await handling.stop()
+        await app.ingest.stop()
+        await app.limiter.stop()
+        await app.dp.emit_shutdown(bot=app.bot)
+        await app.bot.session.close()
+        remote.stop()
+        app.db.close()
+
+
+# ---- Receiving
+def shard(batch: list[dict], workers: int) -> dict[int, list[dict]]:
+    """Worker index -> its updates of the batch, in their original order."""
+    shards: dict[int, list[dict]] = {}
+    for update in batch:
+        shards.setdefault(hash(chat_key(update)) % workers, []).append(update)
+    return shards
+
+
+async def poll(base: str, token: str, route, allowed_updates: list[str]):
+    """Long polling without parsing: each batch of raw updates goes straight to route()."""
+    offset = 0
+    async with aiohttp.ClientSession() as http:
+        try:
+            while True:
+                try:
+                    async with http.post(f"{base}/bot{token}/getUpdates", json={
+                        "offset": offset, "timeout": 30, "allowed_updates": allowed_updates,
+                    }, timeout=aiohttp.ClientTimeout(total=40)) as resp:
+                        data = await resp.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    logger.warning("getUpdates failed: %r", e)
+                    await asyncio.sleep(1)
+                    continue
+                if not data.get("ok"):
+                    logger.warning("getUpdates error: %s", data.get("description"))
+                    await asyncio.sleep(data.get("parameters", {}).get("retry_after", 1))
+                    continue
+                if data["result"]:
+                    await route(data["result"])
+                    offset = data["result"][-1]["update_id"] + 1
+        finally:
+            if offset:  # confirms what was routed, so a restart doesn't get it again
+                try:
+                    async with http.post(f"{base}/bot{token}/getUpdates",
+                                         json={"offset": offset, "timeout": 0, "limit": 1}):
+                        pass
+                except aiohttp.ClientError:
+                    pass
+
+
+async def supervise(workers: int = 0):
+    import bot as app
+    import metrics
+    workers = workers or app.WORKERS or os.cpu_count() or 1
+    app.load_extensions()  # only to know which update types to ask for
+    ctx = mp.get_context("spawn")
+    requests = ctx.Queue()
+    results = [ctx.Queue() for _ in range(workers)]
+    # items are lists of updates (one getUpdates response split by worker), so one
+    # pickle and pipe write carries many updates
+    updates = [ctx.Queue(max(1, app.WEBHOOK_QUEUE // workers)) for _ in range(workers)]
+    ready = ctx.Semaphore(0)
+
+    def spawn(i: int):
+        proc = ctx.Process(target=worker_main, args=(i, workers, updates[i], requests, results[i], ready),
+                           name=f"worker-{i}")
+        proc.start()
+        return proc
+
+    def wait_ready(timeout: float = 120):
+        for _ in range(workers):
+            if not ready.acquire(timeout=timeout):
+                logger.warning("Not all workers are ready after %ss, receiving anyway", timeout)
+                return
+
+    writer = threading.Thread(target=serve_writes, args=(app.db, requests, results), name="db-serve")
+    writer.start()
+    procs = [spawn(i) for i in range(workers)]
+
+    async def route(batch: list[dict]):
+        for i, items in shard(batch, workers).items():
+            while True:
+                try:
+                    updates[i].put_nowait(items)
+                    break
+                except queue.Full:  # that worker is behind: hold its chats (and the receiver) back
+                    await asyncio.sleep(0.01)
+
+    async def watch():
+        while True:
+            await asyncio.sleep(5)
+            for i, proc in enumerate(procs):
+                if not proc.is_alive():
+                    logger.error("Worker %s exited with %s, restarting", i, proc.exitcode)
+                    procs[i] = spawn(i)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    metrics_runner = await metrics.start_http(app.METRICS_HOST, app.METRICS_PORT) if app.METRICS_PORT else None
+    await asyncio.to_thread(wait_ready)  # updates received before the workers import would only queue up
+    jobs = [asyncio.create_task(watch()), asyncio.create_task(app.fts_backfill_loop())]
+    if app.SNAPSHOT_INTERVAL_H > 0:
+        jobs.append(asyncio.create_task(app.snapshot_loop()))
+    if app.MAINTENANCE_INTERVAL_H > 0:
+        jobs.append(asyncio.create_task(app.maintenance_loop()))
+    server = None
+    allowed_updates = app.dp.resolve_used_update_types()
+    if app.WEBHOOK_PORT:
+        server = WebhookServer(app.dp, app.bot, app.WEBHOOK_PATH, app.WEBHOOK_SECRET or None,
+                               app.WORKER_CONCURRENCY, app.WEBHOOK_QUEUE, feed=lambda update: route([update]))
+        await server.start(app.WEBHOOK_HOST, app.WEBHOOK_PORT, app.WEBHOOK_URL or None, allowed_updates)
+    else:
+        jobs.append(asyncio.create_task(poll(app.TELEGRAM_API_URL or "https://api.telegram.org",
+                                             app.BOT_TOKEN, route, allowed_updates)))
+    logger.info("Supervisor started %s workers", workers)
+    try:
+        await stop.wait()
+    finally:
+        if server:
+            await server.stop()
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+        for q in updates:
+            q.put(None)
+        # workers flush their buffers through the writer, so it stops last
+        await asyncio.to_thread(lambda: [proc.join() for proc in procs])
+        requests.put(None)
+        writer.join()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await app.bot.session.close()
+        app.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as a supervisor with N worker processes")
+    parser.add_argument("--workers", type=int, default=0, help="default: WORKERS or the number of CPUs")
+    args = parser.parse_args()
+    asyncio.run(supervise(args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import DB  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    d = DB(str(tmp_path / "bot.db"), readers=1)
+    yield d
+    d.close()
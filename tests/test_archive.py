@@ -0,0 +1,50 @@
+import time
+
+from archive import ArchiveStore, parse_retention
+
+NOW = int(time.time())
+DAY = 86400
+AGES = [1, 3, 40, 130, 160, 200, 260, 320, 330, 400]  # days; over 100 goes to the archive
+
+
+def msg(chat_id, message_id, text, days_ago):
+    return dict(chat_id=chat_id, message_id=message_id, sender_id=1, sender_username="u", sender_first_name="u",
+                date=NOW - days_ago * DAY, text=text, media_type="text", file_id=None, is_forward=0)
+
+
+def pages(db, archives, male_id, limit):
+    out, before = [], None
+    while True:
+        hot = db.search_by_male(male_id, limit=limit, before=before)
+        page = archives.search(db, male_id, limit, before, hot)
+        if not page:
+            return out
+        out.append([(r["chat_id"], r["message_id"], r["text"]) for r in page])
+        before = (page[-1]["date"], page[-1]["id"])
+
+
+def test_search_merges_hot_and_archived_rows_newest_first(db, tmp_path):
+    db.save_messages([(msg(-1 - i % 2, i, f"анкета 1000000001 #{i}", age), ["1000000001"])
+                      for i, age in enumerate(AGES)])
+    db.save_messages([(msg(-1, 100, "1000000002", 150), ["1000000002"])])
+    archives = ArchiveStore(str(tmp_path / "archive"))
+    assert archives.archive(db, days=100, pause=0) == {"archived": 8}
+    assert len(archives.months()) > 1
+
+    got = pages(db, archives, "1000000001", 4)
+    assert [len(p) for p in got] == [4, 4, 2]
+    assert [row for p in got for row in p] == [(-1 - i % 2, i, f"анкета 1000000001 #{i}") for i in range(len(AGES))]
+    assert pages(db, archives, "1000000002", 4) == [[(-1, 100, "1000000002")]]
+    assert pages(db, archives, "1000000003", 4) == []
+
+
+def test_retention_per_chat(db, tmp_path):
+    assert parse_retention("-1001:90, -1002:0") == {-1001: 90, -1002: 0}
+    db.save_messages([(msg(-1, 1, "1000000001", 50), ["1000000001"]),
+                      (msg(-2, 1, "1000000001", 50), ["1000000001"]),
+                      (msg(-2, 2, "1000000001", 500), ["1000000001"])])
+    archives = ArchiveStore(str(tmp_path / "archive"))
+    assert archives.archive(db, days=0, per_chat={-1: 30}, pause=0) == {"archived": 1}  # chat -2 keeps everything
+    hot = db.conn.execute("SELECT chat_id, message_id FROM messages ORDER BY id").fetchall()
+    assert [tuple(r) for r in hot] == [(-2, 1), (-2, 2)]
+    assert db.count_by_male("1000000001") == 3  # all-time, archived messages included
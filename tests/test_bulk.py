@@ -0,0 +1,39 @@
+import csv
+import io
+import time
+
+from export import SUMMARY_HEADER, summary_csv
+
+
+def msg(chat_id, message_id, date):
+    return dict(chat_id=chat_id, message_id=message_id, sender_id=1, sender_username="u", sender_first_name="u",
+                date=date, text="x", media_type="text", file_id=None, is_forward=0)
+
+
+def seed(db):
+    db.add_allowed_chat(-1, "Чат один", "2000000001", 1)
+    db.save_messages([(msg(-1, i, 1700000000 + i), ["1000000001"]) for i in range(1, 4)]
+                     + [(msg(-2, i, 1700000100 + i), ["1000000001", "1000000002"]) for i in range(1, 6)])
+
+
+def test_stats_of_many_ids_in_the_given_order(db):
+    seed(db)
+    rows = db.get_male_stats_many(["1000000002", "1234567890", "1000000001"], top_chats=2)
+    assert [r["male_id"] for r in rows] == ["1000000002", "1234567890", "1000000001"]
+    assert (rows[0]["msg_count"], rows[0]["chat_count"], rows[0]["chats"]) == (5, 1, "-2")
+    assert rows[1]["msg_count"] is None and rows[1]["chats"] is None
+    assert (rows[2]["msg_count"], rows[2]["chat_count"]) == (8, 2)
+    assert rows[2]["chats"] == "-2; Чат один"  # most messages first
+    assert (rows[2]["first_date"], rows[2]["last_date"]) == (1700000001, 1700000105)
+    assert db.get_male_stats_many(["1000000001"], top_chats=1)[0]["chats"] == "-2"
+
+
+def test_summary_csv(db):
+    seed(db)
+    data = summary_csv(db.get_male_stats_many(["1000000001", "1234567890"]))
+    assert data.startswith(b"\xef\xbb\xbf")  # BOM
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+    day = time.strftime("%Y-%m-%d", time.localtime(1700000105))
+    assert rows[0] == SUMMARY_HEADER
+    assert rows[1][:3] == ["1000000001", "8", "2"] and rows[1][4:] == [day, "-2; Чат один"]
+    assert rows[2] == ["1234567890", "0", "0", "", "", ""]
@@ -0,0 +1,72 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from db import LookupCache
+
+
+def thread_name():
+    return threading.current_thread().name
+
+
+def test_writes_are_serialized_and_reads_see_them(db):
+    async def run():
+        await asyncio.gather(*(db.aio.set_setting(f"k{i}", str(i)) for i in range(50)))
+        values = await asyncio.gather(*(db.aio.get_setting(f"k{i}") for i in range(50)))
+        return values, await db.aio.run(thread_name), await db.aio.run(thread_name, write=False)
+
+    values, writer, reader = asyncio.run(run())
+    assert values == [str(i) for i in range(50)]
+    assert writer.startswith("db-writer") and reader.startswith("db-reader")
+
+
+def test_readers_use_their_own_read_only_connection(db):
+    async def run():
+        conn = await db.aio.run(lambda: db.rconn, write=False)
+        with pytest.raises(sqlite3.OperationalError):
+            await db.aio.run(conn.execute, "DELETE FROM settings", write=False)
+        return conn
+
+    assert asyncio.run(run()) is not db.conn
+
+
+def test_lookup_cache_lru_and_ttl(monkeypatch):
+    cache = LookupCache(maxsize=2, ttl=10)
+    loads = []
+
+    def load(key):
+        return lambda: loads.append(key) or key * 2
+
+    assert [cache.get_or_load(k, load(k)) for k in (1, 2, 1, 3)] == [2, 4, 2, 6]
+    assert loads == [1, 2, 3]  # 1 was a hit
+    cache.get_or_load(2, load(2))  # 2 was the least recently used: evicted by 3
+    assert loads == [1, 2, 3, 2]
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    cache.get_or_load(2, load(2))
+    assert loads == [1, 2, 3, 2, 2]
+
+
+def test_lookup_cache_drops_a_load_raced_by_invalidation():
+    cache = LookupCache()
+
+    def load():
+        cache.invalidate(1)  # a write lands while the old value is being read
+        return "stale"
+
+    assert cache.get_or_load(1, load) == "stale"
+    assert cache.get_or_load(1, lambda: "fresh") == "fresh"
+
+
+def test_writes_invalidate_cached_lookups(db):
+    assert db.get_allowed_chat(-1) is None
+    assert not db.is_admin(5)
+    db.add_allowed_chat(-1, "Чат 1000000001", "1000000001", 5)
+    db.add_admin(5)
+    assert db.get_allowed_chat(-1)["female_id"] == "1000000001"
+    assert db.is_admin(5)
+    db.remove_allowed_chat(-1)
+    assert db.get_allowed_chat(-1) is None
@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import CopyMessage, CopyMessages, SendMediaGroup
+
+from delivery import Delivery
+
+
+class FakeBot:
+    """Records sends; copy_message fails for the ids in `errors` with the given description."""
+
+    def __init__(self, errors=None, batch_error=None, album_error=None):
+        self.errors = errors or {}
+        self.batch_error = batch_error  # raised by copy_messages
+        self.album_error = album_error  # send_media_group fails with this description
+        self.sent = []
+        self.batches = []
+
+    async def copy_messages(self, chat_id, from_chat_id, message_ids):
+        assert message_ids == sorted(message_ids)
+        if self.batch_error:
+            raise self.batch_error
+        copied = [m for m in message_ids if m not in self.errors]  # like Telegram: skips what can't be copied
+        self.batches.append(message_ids)
+        self.sent += [("copy", from_chat_id, m) for m in copied]
+        return [SimpleNamespace(message_id=m) for m in copied]
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.sent = [s for s in self.sent if not (s[0] == "copy" and s[2] in message_ids)]
+
+    async def copy_message(self, chat_id, from_chat_id, message_id):
+        if message_id in self.errors:
+            raise TelegramBadRequest(CopyMessage(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id),
+                                     self.errors[message_id])
+        self.sent.append(("copy", from_chat_id, message_id))
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.sent.append(("text", text))
+
+    async def send_media_group(self, chat_id, media):
+        if self.album_error:
+            raise TelegramBadRequest(SendMediaGroup(chat_id=chat_id, media=media), self.album_error)
+        self.sent.append(("album", [(m.type, m.media, m.caption) for m in media]))
+
+    async def send_photo(self, chat_id, photo, caption=None, parse_mode=None):
+        self.sent.append(("photo", photo, caption))
+
+    async def send_document(self, chat_id, document, caption=None, parse_mode=None):
+        self.sent.append(("document", document, caption))
+
+    async def send_voice(self, chat_id, voice, caption=None, parse_mode=None):
+        self.sent.append(("voice", voice, caption))
+
+    async def send_sticker(self, chat_id, sticker):
+        self.sent.append(("sticker", sticker))
+
+
+def row(chat_id, message_id, text="t", media_type="text", file_id=None):
+    return {"chat_id": chat_id, "message_id": message_id, "text": text, "media_type": media_type, "file_id": file_id}
+
+
+def deliver(db, bot, rows, **kwargs):
+    async def run():
+        d = Delivery(bot, db, global_rate=1000, chat_rate=1000, chat_burst=1000, **kwargs)
+        await d.send_rows(1, rows)
+        return d
+    return asyncio.run(run())
+
+
+def test_same_chat_runs_share_one_call(db):
+    bot = FakeBot()
+    page = [row(-100, 30), row(-100, 20), row(-100, 12), row(-200, 5), row(-200, 6), row(-100, 10)]
+    deliver(db, bot, page)
+    # a newest-first run arrives oldest first within the run; runs keep the page order
+    assert bot.batches == [[12, 20, 30], [5, 6]]
+    assert [m for _, _, m in bot.sent] == [12, 20, 30, 5, 6, 10]
+
+
+def test_run_direction_change_starts_a_new_run(db):
+    bot = FakeBot()
+    deliver(db, bot, [row(-100, 30), row(-100, 20), row(-100, 25), row(-100, 26)])
+    assert bot.batches == [[20, 30], [25, 26]]
+
+
+def test_failed_batch_falls_back_to_single_copies(db):
+    for error in (TelegramNetworkError(CopyMessages(chat_id=1, from_chat_id=-100, message_ids=[1]), "timeout"),
+                  TelegramRetryAfter(CopyMessages(chat_id=1, from_chat_id=-100, message_ids=[1]), "flood", 1)):
+        bot = FakeBot(batch_error=error)
+        deliver(db, bot, [row(-100, 30), row(-100, 20), row(-200, 7)], max_retries=0)
+        assert bot.sent == [("copy", -100, 30), ("copy", -100, 20), ("copy", -200, 7)]
+
+
+def test_only_missing_originals_are_cached(db):
+    bot = FakeBot({20: "Bad Request: message to copy not found", 10: "Bad Request: chat not found"})
+    d = deliver(db, bot, [row(-100, 30), row(-100, 20, "gone"), row(-100, 10, "kept")])
+    assert bot.sent == [("copy", -100, 30), ("text", "gone"), ("text", "kept")]
+    assert d.gone == {(-100, 20)}
+    assert db.load_gone_messages() == {(-100, 20)}
+
+
+def stored(media_types, text="t"):
+    return [row(-100, i, text, kind, f"file{i}" if kind != "text" else None) for i, kind in enumerate(media_types)]
+
+
+def send_stored(db, bot, rows):
+    async def run():
+        d = Delivery(bot, db, global_rate=1000, chat_rate=1000, chat_burst=1000)
+        await d.send_stored_rows(1, rows)
+    asyncio.run(run())
+
+
+def test_stored_media_is_grouped_into_albums(db):
+    bot = FakeBot()
+    rows = stored(["photo", "video", "photo", "document", "document", "voice", "photo", "text"])
+    rows[6]["text"] = "x" * 2000  # too long for a caption
+    send_stored(db, bot, rows)
+    assert bot.sent == [
+        ("album", [("photo", "file0", "t"), ("video", "file1", "t"), ("photo", "file2", "t")]),
+        ("album", [("document", "file3", "t"), ("document", "file4", "t")]),
+        ("voice", "file5", "t"),
+        ("photo", "file6", None), ("text", "x" * 2000),
+        ("text", "t"),
+    ]
+
+
+def test_failed_album_falls_back_to_single_sends(db):
+    bot = FakeBot(album_error="Bad Request: wrong file identifier")
+    send_stored(db, bot, stored(["photo", "photo", "sticker"], text="подпись"))
+    assert bot.sent == [("photo", "file0", "подпись"), ("photo", "file1", "подпись"),
+                        ("sticker", "file2"), ("text", "подпись")]
@@ -0,0 +1,55 @@
+import csv
+import gzip
+import io
+import os
+import zipfile
+
+from export import CSV_HEADER, export_csv, part_filename
+
+
+def seed(db, n=300):
+    db.save_messages([
+        (dict(chat_id=-1, message_id=i, sender_id=1, sender_username="u", sender_first_name="u",
+              date=1700000000 + i, text=f"{os.urandom(200).hex()}\nline", media_type="text", file_id=None,
+              is_forward=0), ["1000000001"] if i % 3 else ["1000000002"])
+        for i in range(1, n + 1)])
+
+
+def read_gzip(f):
+    return list(csv.reader(io.TextIOWrapper(gzip.GzipFile(fileobj=f, mode="rb"), encoding="utf-8", newline="")))
+
+
+def test_parts_stay_under_the_limit_and_keep_every_row(db):
+    seed(db)
+    parts = export_csv(db, ["1000000001", "1000000002"], part_limit=20000, batch=10)
+    try:
+        assert len(parts) > 2
+        rows = []
+        for f in parts:
+            f.seek(0, 2)
+            assert f.tell() < 20000 + 64 * 1024  # one batch past the limit at most, plus compressor buffers
+            f.seek(0)
+            part = read_gzip(f)
+            assert part[0] == CSV_HEADER
+            rows += part[1:]
+    finally:
+        for f in parts:
+            f.close()
+    assert len(rows) == 300
+    assert [r[7] for r in rows] == ["1000000001"] * 200 + ["1000000002"] * 100
+    assert all("\n" not in r[3] for r in rows)
+    ids = [int(r[1]) for r in rows[:200]]
+    assert ids == sorted(ids, reverse=True)  # newest first per ID
+
+
+def test_zip_and_names(db):
+    seed(db, 10)
+    parts = export_csv(db, ["1000000002"], fmt="zip")
+    assert len(parts) == 1
+    with zipfile.ZipFile(io.BytesIO(parts[0].read())) as z:
+        assert z.namelist() == ["export_1000000002.csv"]
+        assert len(z.read("export_1000000002.csv").decode().splitlines()) == 1 + 3
+    parts[0].close()
+    assert export_csv(db, ["1234567890"]) == []
+    assert part_filename(["1000000002"], "zip", 1, 1) == "export_1000000002.zip"
+    assert part_filename(["1", "2", "3"], "gzip", 2, 3) == "export_3_ids.part2.csv.gz"
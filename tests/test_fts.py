@@ -0,0 +1,56 @@
+from db import DB
+from utils import fts_query
+
+
+def msg(message_id, text, username="sender"):
+    return dict(chat_id=-1, message_id=message_id, sender_id=1, sender_username=username, sender_first_name="u",
+                date=1700000000 + message_id, text=text, media_type="text", file_id=None, is_forward=0)
+
+
+def found(db, text):
+    return sorted(r["message_id"] for r in db.search_text(fts_query(text), limit=100))
+
+
+def test_search_follows_inserts_edits_and_deletes(db):
+    db.save_messages([(msg(1, "Встреча в кофейне вечером"), []), (msg(2, "кофе и круассан", "barista_bob"), []),
+                      (msg(3, "ничего интересного"), [])])
+    assert found(db, "кофе") == [2]
+    assert found(db, "кофе*") == [1, 2]
+    assert found(db, "@barista_bob") == [2]
+    assert found(db, 'кофе "круассан') == [2]  # user quotes can't break the query
+    db.update_message_text(-1, 3, "теперь про кофе")
+    assert found(db, "кофе") == [2, 3]
+    assert found(db, "интересного") == []
+    with db.conn:
+        db.conn.execute("DELETE FROM messages WHERE message_id = 2")
+    assert found(db, "кофе") == [3]
+    rows = db.search_text(fts_query("кофейне"))
+    assert "\x02кофейне\x03" in rows[0]["snippet"]
+
+
+def test_backfill_of_a_database_that_predates_the_index(tmp_path):
+    path = str(tmp_path / "bot.db")
+    db = DB(path, readers=1)
+    db.save_messages([(msg(i, f"старое сообщение номер{i}"), []) for i in range(1, 101)])
+    with db.conn:  # as if the messages were stored before the index existed
+        db.conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('delete-all')")
+        db.conn.execute("DELETE FROM settings WHERE key = 'fts:built'")
+    db.close()
+
+    db = DB(path, readers=1)  # opens at once; the index is filled in the background
+    assert db.fts_backfill_state() == (0, 100)
+    assert found(db, "старое") == []
+    db.save_messages([(msg(101, "новое сообщение"), [])])
+    db.update_message_text(-1, 5, "исправленное сообщение")  # edits and deletes in the pending range
+    with db.conn:
+        db.conn.execute("DELETE FROM messages WHERE message_id = 6")
+    assert found(db, "новое") == [101]
+    while db.fts_backfill_batch(30):
+        pass
+    assert db.fts_backfill_state() is None
+    assert db.get_setting("fts:built") == "1"
+    db.conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('integrity-check')")
+    assert found(db, "старое") == [i for i in range(1, 101) if i not in (5, 6)]
+    assert found(db, "исправленное") == [5]
+    assert found(db, "сообщение") == [i for i in range(1, 102) if i != 6]
+    db.close()
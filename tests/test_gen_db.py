@@ -0,0 +1,42 @@
+import random
+
+from bench import gen_db
+from db import DB
+from utils import extract_male_ids, fts_query
+
+
+def test_ids_are_distinct_ten_digit_numbers():
+    ids = [gen_db.male_id(rank) for rank in range(1, 5001)]
+    assert len(set(ids)) == len(ids)
+    assert all(len(i) == 10 for i in ids)
+
+
+def test_zipf_is_skewed():
+    zipf = gen_db.Zipf(1000, rng=random.Random(1))
+    ranks = [zipf.rank() for _ in range(20000)]
+    assert min(ranks) >= 1 and max(ranks) <= 1000
+    assert ranks.count(1) > 10 * ranks.count(100)
+
+
+def test_generated_database_is_consistent(tmp_path):
+    path = str(tmp_path / "bench.db")
+    gen_db.generate(path, 1500, chats=5, batch=400)
+    gen_db.generate(path, 500, chats=5, seed=2)  # appends
+    db = DB(path, readers=1)
+    try:
+        rows = db.conn.execute("SELECT id, text FROM messages").fetchall()
+        assert len(rows) == 2000
+        links: dict[int, set] = {}
+        for ref, male_id in db.conn.execute(
+                "SELECT message_id_ref, printf('%010d', male_id) FROM message_male_ids"):
+            links.setdefault(ref, set()).add(male_id)
+        assert all(set(extract_male_ids(r["text"])) == links[r["id"]] for r in rows)  # as if ingested
+        stats = "SELECT * FROM male_stats ORDER BY male_id"
+        before = [tuple(r) for r in db.conn.execute(stats)]
+        db.rebuild_stats()
+        assert [tuple(r) for r in db.conn.execute(stats)] == before
+        assert db.count_stats()[:2] == (len(before), 2000)
+        assert db.search_text(fts_query("анкета"), limit=1)
+        assert db.conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='trigger'").fetchone()[0] > 0
+    finally:
+        db.close()
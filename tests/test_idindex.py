@@ -0,0 +1,42 @@
+import idindex
+from idindex import IdIndex
+
+
+def test_prefix_and_contains():
+    index = IdIndex()
+    index.add(["0000000042", "1234500000", "1234599999", "1234600000"])
+    assert "0000000042" in index and "0000000043" not in index
+    assert index.prefix("12345") == (2, ["1234500000", "1234599999"])
+    assert index.prefix("0000", limit=1) == (1, ["0000000042"])
+    assert index.prefix("9") == (0, [])
+
+
+def test_similar():
+    index = IdIndex()
+    index.add(["1234567890", "1234567891", "2134567890", "1234567809"])
+    # one substitution, one adjacent swap and the last two digits swapped; never the ID itself
+    assert index.similar("1234567890") == ["1234567809", "1234567891", "2134567890"]
+    assert index.similar("9999999999") == []
+
+
+def test_merge_keeps_order(monkeypatch):
+    monkeypatch.setattr(idindex, "MERGE_AT", 4)
+    index = IdIndex()
+    ids = [f"{n:010d}" for n in (50, 10, 40, 20, 30, 60, 10, 25)]
+    for i in range(0, len(ids), 2):
+        index.add(ids[i:i + 2])
+    assert len(index) == 7
+    assert list(index._base) == sorted(index._base)
+    assert index.prefix("00000000", limit=10)[1] == sorted(set(ids))
+
+
+def test_load_and_refresh(db):
+    row = dict(chat_id=-1, message_id=1, sender_id=1, sender_username="u", sender_first_name="u", date=1,
+               text="0000000001", media_type="text", file_id=None, is_forward=0)
+    db.save_messages([(row, ["0000000001"])])
+    index = IdIndex()
+    assert index.load(db)["ids"] == 1
+    db.save_messages([(dict(row, message_id=2, text="0000000002"), ["0000000002"])])
+    assert index.refresh(db) == 1
+    assert index.refresh(db) == 0
+    assert "0000000002" in index
@@ -0,0 +1,56 @@
+import json
+
+import importer
+from db import DB
+
+
+def export(tmp_path, n=40):
+    messages = [{"id": 1, "type": "service", "action": "create_group"}]
+    for i in range(2, n + 1):
+        m = {"id": i, "type": "message", "date": "2024-01-01T00:00:00", "date_unixtime": str(1704067200 + i),
+             "from": "Alice", "from_id": "user42"}
+        if i % 4 == 0:
+            m["text"] = ["анкета ", {"type": "code", "text": f"{1000000000 + i}"}, " пишите"]
+            m["photo"] = "photos/1.jpg"
+        elif i % 4 == 1:
+            m["text"] = f"{1000000000 + i}"
+            m["media_type"] = "voice_message"
+            m["forwarded_from"] = "Bob"
+        else:
+            m["text"] = "без ID"
+        messages.append(m)
+    path = tmp_path / "result.json"
+    path.write_text(json.dumps({"name": "chat", "type": "private_supergroup", "id": 12345,
+                                "messages": messages}, ensure_ascii=False, indent=1), encoding="utf-8")
+    return str(path)
+
+
+def test_reader_streams_across_chunk_boundaries(tmp_path):
+    reader = importer.ExportReader(export(tmp_path), chunk_size=64)
+    assert reader.chat_id() == -10012345
+    assert [m["id"] for m in reader] == list(range(1, 41))
+
+
+def test_import_stores_indexed_messages_and_resumes(tmp_path):
+    path, db_path = export(tmp_path), str(tmp_path / "bot.db")
+    assert importer.run(path, db_path, workers=1, parse_size=7, commit_size=3, pause_ms=0) == (40, 19)
+    db = DB(db_path, readers=1)
+    try:
+        rows = db.conn.execute("SELECT * FROM messages ORDER BY message_id").fetchall()
+        assert len(rows) == 19 and {r["chat_id"] for r in rows} == {-10012345}
+        photo = next(r for r in rows if r["message_id"] == 4)
+        assert (photo["text"], photo["media_type"], photo["sender_id"]) == ("анкета 1000000004 пишите", "photo", 42)
+        voice = next(r for r in rows if r["message_id"] == 5)
+        assert (voice["media_type"], voice["is_forward"], voice["date"]) == ("voice", 1, 1704067205)
+        assert db.count_by_male("1000000004") == 1
+        assert db.get_setting("import:-10012345") == "40"
+    finally:
+        db.close()
+    # a second run starts after the checkpoint: nothing is read again
+    assert importer.run(path, db_path, workers=1, pause_ms=0) == (0, 0)
+    # from the start again: rows are deduplicated on (chat_id, message_id)
+    assert importer.run(path, db_path, workers=1, pause_ms=0, restart=True) == (40, 19)
+    db = DB(db_path, readers=1)
+    assert db.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 19
+    assert db.count_by_male("1000000004") == 1
+    db.close()
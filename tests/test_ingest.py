@@ -0,0 +1,79 @@
+import asyncio
+
+from ingest import IngestQueue
+
+
+def msg(message_id, text="1000000001", chat_id=-1):
+    return dict(chat_id=chat_id, message_id=message_id, sender_id=1, sender_username="u", sender_first_name="u",
+                date=1700000000 + message_id, text=text, media_type="text", file_id=None, is_forward=0)
+
+
+def stored(db):
+    return [tuple(r) for r in db.conn.execute("SELECT message_id, text FROM messages ORDER BY message_id")]
+
+
+def test_full_batch_is_one_transaction(db):
+    async def run():
+        q = IngestQueue(db, batch_size=3, flush_ms=60000)
+        q.start()
+        for i in range(1, 6):
+            await q.put(msg(i), ["1000000001"])
+        assert q.is_pending(-1, 5) and q.written == 0
+        await asyncio.sleep(0.1)
+        assert (q.written, q.flushes, q.depth()) == (5, 1, 0)
+        assert not q.is_pending(-1, 5)
+        await q.stop()
+    asyncio.run(run())
+    assert len(stored(db)) == 5
+    assert db.count_by_male("1000000001") == 5
+
+
+def test_small_batch_waits_for_the_interval(db):
+    async def run():
+        q = IngestQueue(db, batch_size=100, flush_ms=50)
+        q.start()
+        await q.put(msg(1), [])
+        await asyncio.sleep(0.01)
+        assert q.written == 0
+        await asyncio.sleep(0.2)
+        assert q.written == 1
+        await q.stop()
+    asyncio.run(run())
+
+
+def test_backpressure_flushes_inline(db):
+    async def run():
+        q = IngestQueue(db, batch_size=2, flush_ms=60000, max_pending=4)  # not started
+        for i in range(1, 5):
+            await q.put(msg(i), [])
+        assert (q.written, q.depth()) == (4, 0)
+    asyncio.run(run())
+
+
+def test_failed_batch_is_retried_one_by_one(db):
+    async def run():
+        q = IngestQueue(db)
+        await q.put(msg(1), [])
+        await q.put(msg(2, chat_id=None), [])  # NOT NULL chat_id: fails the batch
+        await q.put(msg(3), [])
+        await q.flush()
+        return q
+    q = asyncio.run(run())
+    assert (q.written, q.failed) == (2, 1)
+    assert [r[0] for r in stored(db)] == [1, 3]
+
+
+def test_edit_burst_is_applied_once_after_the_original(db):
+    async def run():
+        q = IngestQueue(db, edit_window_ms=60000)
+        await q.put(msg(1, "1000000001"), ["1000000001"])
+        await q.put_edit(msg(1, "1000000002"), ["1000000002"])
+        await q.put_edit(msg(1, "1000000003"), ["1000000003"])
+        await q.flush_edits()
+        assert q.edits_applied == 0  # still inside the window
+        await q.flush_edits(force=True)  # flushes the original first
+        return q
+    q = asyncio.run(run())
+    assert (q.edits, q.edits_applied) == (2, 1)
+    assert stored(db) == [(1, "1000000003")]
+    assert [db.count_by_male(m) for m in ("1000000001", "1000000002", "1000000003")] == [0, 0, 1]
@@ -0,0 +1,41 @@
+import logging
+
+import metrics
+
+SECRET = "PRIVATE TEXT 1234567890"
+
+
+class Store:
+    @metrics.profiled
+    def save_messages(self, batch, checkpoint=None):
+        return len(batch)
+
+    @metrics.profiled
+    def relink_messages(self, rows):
+        return len(rows)
+
+    @metrics.profiled
+    def save_message(self, chat_id, text, token=None):
+        return chat_id
+
+
+def test_nested_texts_are_not_logged(caplog):
+    metrics.configure(slow_ms=0)
+    try:
+        with caplog.at_level(logging.WARNING):
+            s = Store()
+            s.save_messages([({"chat_id": 1, "text": SECRET}, ["1234567890"])], checkpoint=("k", "1"))
+            s.relink_messages([(1, SECRET, None, ["1234567890"])])
+            s.save_message(1, SECRET, token="abc")
+    finally:
+        metrics.configure(slow_ms=200)
+    logged = caplog.text
+    assert "Slow Store.save_messages" in logged and "Slow Store.relink_messages" in logged
+    assert SECRET not in logged and "abc" not in logged
+    assert "<list of 1>" in logged
+
+
+def test_redact_dicts_by_key():
+    assert metrics._redact("row", {"chat_id": 5, "text": "hi"}) == {"chat_id": 5, "text": "<2 chars>"}
+    assert metrics._redact("blob", b"\x00" * 3) == "<3 bytes>"
+    assert metrics._redact("limit", 5) == 5
@@ -0,0 +1,126 @@
+"""Upgrading a database created by the first release (TEXT male IDs, inline texts, no FTS)."""
+import sqlite3
+
+import pytest
+
+import migrate_ids
+import textstore
+from db import DB, integer_male_ids
+
+BASELINE_SCHEMA = """
+CREATE TABLE settings (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    sender_id INTEGER,
+    sender_username TEXT,
+    sender_first_name TEXT,
+    date INTEGER,
+    text TEXT,
+    media_type TEXT,
+    file_id TEXT,
+    is_forward INTEGER DEFAULT 0,
+    UNIQUE(chat_id, message_id)
+);
+CREATE TABLE message_male_ids (
+    message_id_ref INTEGER NOT NULL,
+    male_id TEXT NOT NULL,
+    UNIQUE(message_id_ref, male_id),
+    FOREIGN KEY(message_id_ref) REFERENCES messages(id) ON DELETE CASCADE
+);
+CREATE INDEX idx_male_id ON message_male_ids(male_id);
+"""
+MESSAGES = 300
+
+
+def male_id(i: int) -> str:
+    return f"{i % 40:010d}"  # leading zeros must survive the INTEGER column
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    for i in range(1, MESSAGES + 1):
+        text = f"анкета {male_id(i)} и {male_id(i + 1)}, пишите в личку" + " подробности" * (i % 3)
+        conn.execute("INSERT INTO messages(chat_id, message_id, sender_username, date, text) VALUES(?,?,?,?,?)",
+                     (-(i % 4) - 1, i, f"user{i % 7}", 1700000000 + i, text))
+        conn.executemany("INSERT INTO message_male_ids(message_id_ref, male_id) VALUES(?,?)",
+                         [(i, male_id(i)), (i, male_id(i + 1))])
+    conn.commit()
+    conn.close()
+    db = DB(path, readers=1)
+    while db.fts_backfill_batch(100):
+        pass
+    yield db
+    db.close()
+
+
+def links(db):
+    return sorted(tuple(r) for r in db.conn.execute(
+        "SELECT printf('%010d', male_id), message_id_ref FROM message_male_ids"))
+
+
+def assert_consistent(db):
+    db.conn.execute("INSERT INTO messages_fts(messages_fts) VALUES('integrity-check')")
+    live = sorted(tuple(r) for r in db.conn.execute("SELECT * FROM male_stats"))
+    db.rebuild_stats()
+    assert live == sorted(tuple(r) for r in db.conn.execute("SELECT * FROM male_stats"))
+
+
+def test_baseline_opens(baseline):
+    assert not integer_male_ids(baseline.conn)
+    assert baseline.count_by_male(male_id(5)) == sum(male_id(5) in (male_id(i), male_id(i + 1))
+                                                     for i in range(1, MESSAGES + 1))
+    assert baseline.fts_backfill_state() is None
+    assert baseline.search_text("подробности", limit=1000)
+    assert_consistent(baseline)
+
+
+def test_migrate_ids(baseline):
+    before = links(baseline)
+    counts = {m: baseline.count_by_male(m) for m in (male_id(0), male_id(7))}
+    report = migrate_ids.migrate(baseline, batch=50, pause=0)
+    assert report["migrated"] == len(before)
+    assert integer_male_ids(baseline.conn)
+    assert links(baseline) == before
+    assert {m: baseline.count_by_male(m) for m in counts} == counts
+    assert baseline.get_setting(migrate_ids.CHECKPOINT) is None
+    assert migrate_ids.migrate(baseline)["status"] == "already INTEGER"
+    # the link triggers were recreated on the new table
+    baseline.apply_edits([(dict(chat_id=-2, message_id=1, sender_id=None, sender_username="user1",
+                                sender_first_name=None, date=1700000001, text="0000000099", media_type=None,
+                                file_id=None, is_forward=0), ["0000000099"])])
+    assert baseline.get_male_stats("0000000099")["msg_count"] == 1
+    assert_consistent(baseline)
+
+
+def test_dedup_texts(baseline):
+    texts = dict(baseline.conn.execute("SELECT id, text FROM messages").fetchall())
+    found = len(baseline.search_text("подробности", limit=1000))
+    report = textstore.migrate(baseline, batch=64, pause=0)
+    assert report["converted"] == MESSAGES
+    assert report["distinct_texts"] < MESSAGES
+    rows = baseline.conn.execute(
+        "SELECT m.id, m.text, inflate(t.body) FROM messages m JOIN texts t ON t.hash = m.text_hash").fetchall()
+    assert {r[0]: r[2] for r in rows} == texts
+    assert all(r[1] is None for r in rows)
+    assert len(baseline.search_text("подробности", limit=1000)) == found
+    assert_consistent(baseline)
+
+
+def plan(db, sql, *args):
+    return " ".join(r[3] for r in db.conn.execute("EXPLAIN QUERY PLAN " + sql, args))
+
+
+def test_links_are_read_in_key_order(baseline):
+    sql = "SELECT message_id_ref FROM message_male_ids WHERE male_id = ? ORDER BY message_id_ref DESC LIMIT 5"
+    assert "idx_male_ref" in plan(baseline, sql, male_id(3))
+    migrate_ids.migrate(baseline, batch=50, pause=0)
+    indexes = {r[0] for r in baseline.conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='message_male_ids'")}
+    assert indexes == {"idx_links_msg"}
+    assert "PRIMARY KEY" in plan(baseline, sql, male_id(3))
+    assert "TEMP B-TREE" not in plan(baseline, sql, male_id(3))
@@ -0,0 +1,44 @@
+import asyncio
+
+from ratelimit import Policy, RateLimiter, parse_policies
+
+
+def test_denies_over_the_limit_and_recovers_after_the_window(db):
+    limiter = RateLimiter(db, {("user", "search"): Policy(2, 10)})
+    assert limiter.allow(1, "user", "search", now=100)
+    assert limiter.allow(1, "user", "search", now=101)
+    assert not limiter.allow(1, "user", "search", now=105)
+    assert limiter.allow(2, "user", "search", now=105)  # per user
+    assert limiter.allow(1, "user", "more", now=105)  # per action
+    assert not limiter.allow(1, "user", "search", now=109.5)
+    assert limiter.allow(1, "user", "search", now=110)  # the first hit left the window
+
+
+def test_policies():
+    assert parse_policies("admin.search=1/2, owner.*=0,user=5/60") == {
+        ("admin", "search"): Policy(1, 2), ("owner", "*"): None, ("user", "*"): Policy(5, 60)}
+    limiter = RateLimiter(None, parse_policies("user.*=1/60"))
+    assert limiter.policy("user", "search") == limiter.policies[("user", "search")]  # exact match wins
+    assert limiter.policy("user", "anything") == Policy(1, 60)
+    assert all(limiter.allow(1, "owner", "export", now=n) for n in range(10))
+
+
+def test_flush_saves_windows_and_forgets_quiet_users(db):
+    limiter = RateLimiter(db, {("user", "search"): Policy(1, 5)})
+    limiter.allow(1, "user", "search", now=1000)
+    limiter.allow(2, "user", "search", now=1000 + limiter.max_window)
+    asyncio.run(limiter.flush(now=1001))
+    assert {r[:2] for r in db.load_rate_limits()} == {(1, "search"), (2, "search")}
+
+    asyncio.run(limiter.flush(now=1001 + limiter.max_window))
+    assert list(limiter.hits) == [(2, "search")]
+    assert {r[:2] for r in db.load_rate_limits()} == {(2, "search")}
+
+
+def test_windows_survive_a_restart(db):
+    limiter = RateLimiter(db)
+    assert limiter.allow(1, "user", "export")
+    asyncio.run(limiter.stop())
+    restarted = RateLimiter(db)
+    restarted.load()
+    assert not restarted.allow(1, "user", "export")
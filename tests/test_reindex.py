@@ -0,0 +1,55 @@
+import reindex
+from db import DB
+
+
+def msg(message_id, text):
+    return dict(chat_id=-1, message_id=message_id, sender_id=1, sender_username="u", sender_first_name="u",
+                date=1700000000 + message_id, text=text, media_type="text", file_id=None, is_forward=0)
+
+
+def links(db):
+    return sorted(tuple(r) for r in db.conn.execute(
+        "SELECT m.message_id, printf('%010d', mm.male_id) FROM message_male_ids mm "
+        "JOIN messages m ON m.id = mm.message_id_ref"))
+
+
+def seed(path):
+    # links as an older version of the rules saw them
+    db = DB(path, readers=1)
+    db.save_messages([(msg(i, f"анкета {1000000000 + i} и {2000000000 + i}"), [f"{1000000000 + i}"])
+                      for i in range(1, 11)])
+    db.save_messages([(msg(11, "без ID"), ["1000000099"])])
+    db.close()
+
+
+def test_reindex_writes_only_the_difference(tmp_path):
+    path = str(tmp_path / "bot.db")
+    seed(path)
+    dry = reindex.run(path, workers=1, chunk=3, pause_ms=0, dry_run=True)
+    assert (dry["messages"], dry["messages_changed"], dry["links_removed"], dry["links_added"]) == (11, 11, 1, 10)
+
+    report = reindex.run(path, workers=1, chunk=3, pause_ms=0)
+    assert (report["messages_changed"], report["links_removed"], report["links_added"]) == (11, 1, 10)
+    db = DB(path, readers=1)
+    try:
+        assert links(db) == sorted([(i, f"{1000000000 + i}") for i in range(1, 11)]
+                                   + [(i, f"{2000000000 + i}") for i in range(1, 11)])
+        assert db.get_setting(reindex.CHECKPOINT) is None
+        assert db.get_male_stats("1000000099") is None
+        assert db.get_male_stats("2000000001")["msg_count"] == 1
+    finally:
+        db.close()
+    assert reindex.run(path, workers=1, chunk=3, pause_ms=0)["messages_changed"] == 0
+
+
+def test_reindex_resumes_after_the_checkpoint(tmp_path):
+    path = str(tmp_path / "bot.db")
+    seed(path)
+    db = DB(path, readers=1)
+    db.set_setting(reindex.CHECKPOINT, "5")  # interrupted after message 5
+    db.close()
+    report = reindex.run(path, workers=1, chunk=3, pause_ms=0)
+    assert (report["messages"], report["messages_changed"]) == (6, 6)
+    db = DB(path, readers=1)
+    assert [m for m, male_id in links(db) if male_id.startswith("2")] == list(range(6, 11))
+    db.close()
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from i18n import RU, UK
+from router import StateStore, TextRouter
+
+ACTIONS = {"menu_search": "search_menu", "admin_stats": "stats", "admin_search_female": "prompt_female"}
+
+
+@pytest.fixture
+def router():
+    return TextRouter((RU, UK), ACTIONS, StateStore(ttl=60))
+
+
+def test_buttons_in_every_language(router):
+    for table in (RU, UK):
+        for key, action in ACTIONS.items():
+            assert router.resolve(1, table[key]) == action
+
+
+def test_conflicting_buttons_are_rejected():
+    with pytest.raises(ValueError):
+        TextRouter(({"a": "Same", "b": "Same"},), {"a": "one", "b": "two"}, StateStore())
+
+
+def test_ids(router):
+    assert router.resolve(1, " 1234567890 ") == "male_search"
+    assert router.resolve(1, "f:1234567890") == "female_search"
+    assert router.resolve(1, "1234567890\n2345678901") == "male_bulk"
+    assert router.resolve(1, "12345") == "male_prefix"
+    assert router.resolve(1, "123456*") == "male_prefix"
+    assert router.resolve(1, "123") is None
+    assert router.resolve(1, "привет") is None
+
+
+def test_prompt_is_one_shot(router):
+    router.states.set(1, "female_search")
+    assert router.resolve(2, "1234567890") == "male_search"  # other users are not affected
+    assert router.resolve(1, "1234567890") == "female_search"
+    assert router.resolve(1, "1234567890") == "male_search"
+
+
+def test_button_cancels_prompt(router):
+    router.states.set(1, "female_search")
+    assert router.resolve(1, RU["admin_stats"]) == "stats"
+    assert router.resolve(1, "1234567890") == "male_search"
+
+
+def test_state_store_expires(monkeypatch):
+    store = StateStore(ttl=10)
+    store.set(1, "x")
+    assert store.get(1) == "x"
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert store.get(1, "gone") == "gone"
+    assert len(store) == 0
+
+
+def test_state_store_evicts_least_recent():
+    store = StateStore(maxsize=2)
+    store.set(1, "a")
+    store.set(2, "b")
+    store.set(1, "a2")  # refreshes 1
+    store.set(3, "c")
+    assert (store.get(1), store.get(2), store.get(3)) == ("a2", None, "c")
+    assert store.pop(1) == "a2"
+    assert store.get(1) is None
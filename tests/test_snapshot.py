@@ -0,0 +1,39 @@
+import gzip
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from snapshot import make_snapshot, prune_snapshots, snapshot_parts
+
+
+def restore(path, tmp_path):
+    raw = tmp_path / (path.name + ".restored")
+    raw.write_bytes(gzip.decompress(path.read_bytes()))
+    return sqlite3.connect(raw)
+
+
+def test_concurrent_snapshots_get_their_own_files(db, tmp_path):
+    db.add_admin(42)
+    db.set_setting("auth:secret", "hunter2")
+    out = tmp_path / "out"
+    with ThreadPoolExecutor(2) as pool:
+        paths = list(pool.map(lambda _: make_snapshot(str(db.path), str(out)), range(2)))
+    assert paths[0] != paths[1]
+    for path in paths:
+        assert path.exists()
+        conn = restore(path, tmp_path)
+        assert conn.execute("SELECT user_id FROM admins").fetchall() == [(42,)]
+        assert conn.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 0  # excluded
+        conn.close()
+    assert sorted(p.name for p in out.iterdir()) == sorted(p.name for p in paths)  # no raw copies left
+
+
+def test_parts_and_prune(tmp_path):
+    path = tmp_path / "snapshot-20250101-000000-x.db.gz"
+    path.write_bytes(bytes(range(256)) * 10)
+    parts = snapshot_parts(path, part_limit=1000)
+    assert [p.filename for p in parts] == [f"{path.name}.{i:03d}" for i in (1, 2, 3)]
+    assert [p.length for p in parts] == [1000, 1000, 560]
+    for name in ("snapshot-20250102-000000-a.db.gz", "snapshot-20250103-000000-b.db.gz"):
+        (tmp_path / name).write_bytes(b"x")
+    prune_snapshots(str(tmp_path), keep=1)
+    assert [p.name for p in tmp_path.glob("snapshot-*.db.gz")] == ["snapshot-20250103-000000-b.db.gz"]
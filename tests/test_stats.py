@@ -0,0 +1,90 @@
+import time
+
+from archive import ArchiveStore
+
+NOW = int(time.time())
+DAY = 86400
+
+
+def msg(chat_id, message_id, text, days_ago=0):
+    return dict(chat_id=chat_id, message_id=message_id, sender_id=1, sender_username="u", sender_first_name="u",
+                date=NOW - days_ago * DAY, text=text, media_type="text", file_id=None, is_forward=0)
+
+
+def stats(db):
+    c = db.conn
+    return (sorted(tuple(r) for r in c.execute("SELECT * FROM male_stats")),
+            sorted(tuple(r) for r in c.execute("SELECT * FROM male_chat_stats")),
+            sorted(tuple(r) for r in c.execute("SELECT key, value FROM stats_totals")))
+
+
+def assert_matches_rebuild(db):
+    live = stats(db)
+    db.rebuild_stats()
+    assert live == stats(db)
+
+
+def seed(db):
+    db.save_messages([
+        (msg(-1, 1, "1000000001 и 1000000002", days_ago=300), ["1000000001", "1000000002"]),
+        (msg(-1, 2, "1000000001", days_ago=200), ["1000000001"]),
+        (msg(-2, 1, "1000000001", days_ago=5), ["1000000001"]),
+        (msg(-2, 2, "1000000003", days_ago=1), ["1000000003"]),
+    ])
+
+
+def test_insert(db):
+    seed(db)
+    assert db.get_male_stats("1000000001")["msg_count"] == 3
+    assert db.get_male_stats("1000000001")["chat_count"] == 2
+    assert db.count_stats()[:2] == (3, 4)
+    assert_matches_rebuild(db)
+
+
+def test_delete(db):
+    seed(db)
+    with db.conn:
+        db.conn.execute("DELETE FROM messages WHERE chat_id = -1 AND message_id = 1")
+    assert db.get_male_stats("1000000002") is None
+    assert db.get_male_stats("1000000001")["first_date"] == NOW - 200 * DAY
+    assert db.count_stats()[:2] == (2, 3)
+    assert_matches_rebuild(db)
+
+
+def test_edit(db):
+    seed(db)
+    # drops 1000000001 from the newest message of chat -2 and adds a new ID
+    db.apply_edits([(msg(-2, 1, "1000000004", days_ago=5), ["1000000004"])])
+    s = db.get_male_stats("1000000001")
+    assert (s["msg_count"], s["chat_count"], s["last_date"]) == (2, 1, NOW - 200 * DAY)
+    assert db.get_male_stats("1000000004")["msg_count"] == 1
+    assert_matches_rebuild(db)
+
+
+def test_archive_keeps_all_time_stats(db, tmp_path):
+    seed(db)
+    before = stats(db)[:2]
+    assert ArchiveStore(str(tmp_path / "archive")).archive(db, days=100, pause=0) == {"archived": 2}
+    assert db.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 2
+    assert stats(db)[:2] == before
+    assert db.count_stats()[:2] == (3, 4)
+    assert db.conn.execute("SELECT COUNT(*) FROM archiving").fetchone()[0] == 0
+    assert_matches_rebuild(db)
+    # the triggers are still there for ordinary deletes
+    with db.conn:
+        db.conn.execute("DELETE FROM messages WHERE chat_id = -2 AND message_id = 2")
+    assert db.get_male_stats("1000000003") is None
+    assert_matches_rebuild(db)
+
+
+def test_unlinking_hot_message_keeps_archived_dates(db, tmp_path):
+    db.save_messages([
+        (msg(-1, 1, "1000000005", days_ago=300), ["1000000005"]),
+        (msg(-1, 2, "1000000005", days_ago=1), ["1000000005"]),
+    ])
+    ArchiveStore(str(tmp_path / "archive")).archive(db, days=100, pause=0)
+    hot = db.conn.execute("SELECT id FROM messages WHERE message_id = 2").fetchone()[0]
+    db.unlink_all_male_ids(hot)
+    s = db.get_male_stats("1000000005")
+    assert (s["msg_count"], s["first_date"], s["last_date"]) == (1, NOW - 300 * DAY, NOW - 300 * DAY)
+    assert_matches_rebuild(db)
@@ -0,0 +1,62 @@
+import asyncio
+import queue
+import threading
+
+import pytest
+
+from db import DB
+from supervisor import RemoteWriter, serve_writes, shard
+from webhook import chat_key
+
+
+def update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": chat_id}, "text": "x"}}
+
+
+def job(x):
+    return threading.current_thread().name, x * 2
+
+
+def test_shard_keeps_each_chat_on_one_worker_in_order():
+    batch = [update(i, -100 - i % 7) for i in range(1, 50)]
+    shards = shard(batch, 4)
+    assert sum(len(items) for items in shards.values()) == len(batch)
+    for chat in {chat_key(u) for u in batch}:
+        holders = [i for i, items in shards.items() if any(chat_key(u) == chat for u in items)]
+        assert len(holders) == 1
+        ids = [u["update_id"] for u in shards[holders[0]] if chat_key(u) == chat]
+        assert ids == [u["update_id"] for u in batch if chat_key(u) == chat]
+
+
+def test_worker_writes_go_through_the_supervisor(tmp_path):
+    path = str(tmp_path / "bot.db")
+    writer_db = DB(path, readers=1)
+    worker_db = DB(path, readers=1, read_only=True)
+    requests, results = queue.Queue(), [queue.Queue()]
+    server = threading.Thread(target=serve_writes, args=(writer_db, requests, results), daemon=True)
+    server.start()
+    remote = RemoteWriter(0, requests, results[0], worker_db)
+    hooked = []
+    worker_db.on_invalidate(("add_admin",), lambda: hooked.append(1))
+
+    async def run():
+        remote.start(asyncio.get_running_loop())
+        worker_db.aio.route_writes(remote)
+        assert not await worker_db.aio.is_admin(5)  # cached by the worker
+        await worker_db.aio.add_admin(5)
+        assert await worker_db.aio.is_admin(5)  # the supervisor dropped the worker's entry
+        await worker_db.aio.set_user_lang(5, "uk")
+        with pytest.raises(TypeError):  # raised in the supervisor, re-raised here
+            await worker_db.aio.add_admin()
+        return await worker_db.aio.run(job, 21)
+
+    try:
+        assert asyncio.run(run()) == ("db-job", 42)
+    finally:
+        requests.put(None)
+        server.join()
+        remote.stop()
+    assert hooked == [1]  # only for the write it was registered for
+    assert writer_db.conn.execute("SELECT COUNT(*) FROM admins WHERE user_id = 5").fetchone()[0] == 1
+    worker_db.close()
+    writer_db.close()
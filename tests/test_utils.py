@@ -0,0 +1,14 @@
+import pytest
+
+from utils import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("parts", [(0,), (35, 36), (1700000000, 123456789), (2**62, 0, 7)])
+def test_cursor_round_trip(parts):
+    cursor = encode_cursor(*parts)
+    assert decode_cursor(cursor) == list(parts)
+    assert len(cursor.encode()) < 64  # fits callback data with a prefix
+
+
+def test_cursor_is_compact():
+    assert encode_cursor(35, 36) == "z.10"
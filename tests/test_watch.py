@@ -0,0 +1,79 @@
+import asyncio
+from html.parser import HTMLParser
+
+from watch import WatchDigest, WatchIndex, digest_lines, watch_list_messages
+
+
+class TagChecker(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.open, self.codes = [], []
+
+    def handle_starttag(self, tag, attrs):
+        self.open.append(tag)
+
+    def handle_endtag(self, tag):
+        assert self.open and self.open.pop() == tag
+
+    def handle_data(self, data):
+        if self.open:
+            self.codes.append(data)
+
+
+def test_watch_list_is_split_between_ids():
+    ids = [f"{n:010d}" for n in range(1000, 1500)]
+    assert len(" ".join(f"<code>{i}</code>" for i in ids)) > 4000
+    messages = watch_list_messages("Watched (500):", ids)
+    assert len(messages) == 4
+    assert messages[0].startswith("Watched (500):\n")
+    codes = []
+    for text in messages:
+        assert len(text) <= 4096
+        checker = TagChecker()
+        checker.feed(text)
+        checker.close()
+        assert checker.open == []
+        codes += checker.codes
+    assert codes == ids
+
+
+def test_index_match():
+    index = WatchIndex()
+    index.load([(1, "0000000001"), (2, "0000000001"), (1, "0000000002")])
+    assert sorted(index.match(["0000000001", "0000000003"])) == [(1, "0000000001"), (2, "0000000001")]
+    index.remove(2, ["0000000001"])
+    index.add(3, ["0000000002"])
+    assert sorted(index.match(["0000000001", "0000000002"])) == [(1, "0000000001"), (1, "0000000002"),
+                                                                 (3, "0000000002")]
+    assert len(index) == 3
+
+
+class FakeDelivery:
+    def __init__(self):
+        self.sent = []
+        self.bot = self
+
+    async def send_message(self, chat_id, text, disable_web_page_preview=None):
+        self.sent.append((chat_id, text))
+
+    async def call(self, chat_id, request):
+        return await request()
+
+
+def test_digest_sends_one_message_per_user():
+    delivery = FakeDelivery()
+    digest = WatchDigest(delivery, lambda user_id, items, dropped: f"{len(items)}+{dropped}", max_items=2)
+    digest.add([(1, "0000000001"), (2, "0000000001")], -1001, 10)
+    digest.add([(1, "0000000001")], -1001, 10)  # the same message edited: not again
+    digest.add([(1, "0000000002")], -1001, 11)
+    digest.add([(1, "0000000003")], -1001, 12)
+    asyncio.run(digest.flush())
+    assert sorted(delivery.sent) == [(1, "2+1"), (2, "1+0")]
+    asyncio.run(digest.flush())
+    assert len(delivery.sent) == 2
+
+
+def test_digest_lines_escape_titles():
+    lines = digest_lines([("0000000001", -1001234, 5), ("0000000002", -42, 6)], lambda chat_id: "<b>chat</b>")
+    assert lines[0] == '<code>0000000001</code> — <a href="https://t.me/c/1234/5">&lt;b&gt;chat&lt;/b&gt;</a>'
+    assert lines[1] == "<code>0000000002</code> — &lt;b&gt;chat&lt;/b&gt;"
@@ -0,0 +1,67 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import SECRET_HEADER, UpdateQueues, WebhookServer, chat_key
+
+
+def update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": chat_id}, "text": "x"}}
+
+
+def test_chat_key():
+    assert chat_key(update(1, -100)) == -100
+    assert chat_key({"update_id": 2, "callback_query": {"from": {"id": 7}}}) == 7
+    assert chat_key({"update_id": 3}) == 3
+
+
+def test_full_queue_answers_503_and_stop_drains():
+    handled = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def feed(u):
+            await release.wait()
+            handled.append(u["update_id"])
+
+        server = WebhookServer(None, None, secret="s3cret", workers=1, queue_size=1, feed=feed)
+        server.updates.start()
+        async with TestClient(TestServer(server.app)) as client:
+            headers = {SECRET_HEADER: "s3cret"}
+            assert (await client.post("/webhook", json=update(1, -1))).status == 401
+            assert (await client.post("/webhook", data="{", headers=headers)).status == 400
+            assert (await client.post("/webhook", json=update(1, -1), headers=headers)).status == 200
+            await asyncio.sleep(0.01)  # the worker takes it and waits in feed()
+            assert (await client.post("/webhook", json=update(2, -1), headers=headers)).status == 200
+            assert (await client.post("/webhook", json=update(3, -1), headers=headers)).status == 503
+            assert server.stats()["rejected"] == 1
+            release.set()
+            await server.stop()
+            assert (await client.post("/webhook", json=update(4, -1), headers=headers)).status == 503
+            assert (await client.get("/healthz")).status == 503
+
+    asyncio.run(run())
+    assert handled == [1, 2]
+
+
+def test_chats_run_in_parallel_and_in_order():
+    events = []
+
+    async def handle(u):
+        await asyncio.sleep(0.01 if u["message"]["chat"]["id"] == -101 else 0)
+        events.append(u["update_id"])
+
+    async def run():
+        queues = UpdateQueues(handle, workers=4, queue_size=100)
+        queues.start()
+        for i in range(1, 11):
+            await queues.put(update(i, -101 if i % 2 else -102))  # different queues of the 4
+        await queues.stop()
+        return queues
+
+    queues = asyncio.run(run())
+    assert queues.handled == 10
+    assert [e for e in events if e % 2] == [1, 3, 5, 7, 9]
+    assert [e for e in events if not e % 2] == [2, 4, 6, 8, 10]
+    assert events.index(10) < events.index(9)  # the slow chat doesn't hold up the other one
@@ -0,0 +1,175 @@
+"""Content-addressed message bodies.
+
+With dedup on, a text is stored once in `texts` under the BLAKE2b hash of its
+UTF-8 bytes and `messages.text_hash` points at it (`messages.text` stays NULL),
+so an announcement forwarded into fifty groups costs one compressed body.
+Bodies are decoded by the `inflate` SQL function only for the rows a query
+returns; the FTS view and triggers use it too.
+
+Body format (first byte):
+  0x00       stored as is (short texts that don't compress)
+  0x01-0x77  raw deflate with trained dictionary N (`text_dicts`)
+  0x78       plain zlib stream (also what archive files hold)
+
+Converting an existing database in place (online, short transactions):
+
+    python3 textstore.py ./bot.db [--train] [--batch 2000]
+"""
+import argparse
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+STORED = 0
+ZLIB = 0x78
+MAX_DICTS = ZLIB - 1
+MIN_DEDUP_LEN = 32  # shorter texts stay inline: the hash and row would cost more than they save
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class TextCodec:
+    """Compresses with the newest trained dictionary (if any) when that's smaller; decodes any body.
+
+    `loader` returns (id, dict) rows; it is called again when a body names a
+    dictionary this process hasn't seen (trained by another process)."""
+
+    def __init__(self, loader: Callable[[], Iterable[tuple[int, bytes]]], level: int = 9):
+        self.loader = loader
+        self.level = level
+        self.dicts: dict[int, bytes] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[int]:
+        return max(self.dicts) if self.dicts else None
+
+    def load(self):
+        with self._lock:
+            self.dicts = {int(i): bytes(d) for i, d in self.loader()}
+
+    def compress(self, text: str) -> bytes:
+        raw = text.encode("utf-8")
+        best = bytes([STORED]) + raw
+        z = zlib.compress(raw, self.level)
+        if len(z) < len(best):
+            best = z
+        dict_id = self.current
+        if dict_id is not None:
+            c = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=self.dicts[dict_id])
+            z = bytes([dict_id]) + c.compress(raw) + c.flush()
+            if len(z) < len(best):
+                best = z
+        return best
+
+    def inflate(self, blob) -> Optional[str]:
+        """SQL function: body -> text (plain text and NULL pass through)."""
+        if blob is None or isinstance(blob, str):
+            return blob
+        kind = blob[0]
+        if kind == STORED:
+            return bytes(blob[1:]).decode("utf-8")
+        if kind == ZLIB:
+            return zlib.decompress(blob).decode("utf-8")
+        if kind not in self.dicts:
+            self.load()
+        d = zlib.decompressobj(-15, zdict=self.dicts[kind])
+        return (d.decompress(blob[1:]) + d.flush()).decode("utf-8")
+
+
+def train_dict(samples: Iterable[str], size: int = 32768) -> bytes:
+    """A zlib preset dictionary from frequent word n-grams of `samples`.
+
+    Deflate finds matches at shorter distances cheaper, so the most valuable
+    strings (frequency x length) go last."""
+    counts: Counter = Counter()
+    for text in samples:
+        words = text.split()
+        for n in (1, 2, 3):
+            for i in range(len(words) - n + 1):
+                counts[" ".join(words[i:i + n])] += 1
+    picked, total = [], 0
+    for gram, count in sorted(counts.items(), key=lambda kv: kv[1] * len(kv[0]), reverse=True):
+        if count < 2:
+            break
+        piece = (gram + " ").encode("utf-8")
+        if total + len(piece) > size:
+            continue
+        picked.append(piece)
+        total += len(piece)
+    return b"".join(reversed(picked))
+
+
+# ---- Migration
+def payload_bytes(conn: sqlite3.Connection) -> tuple[int, int]:
+    """(bytes of inline texts, bytes of stored bodies)."""
+    inline = conn.execute("SELECT coalesce(SUM(length(CAST(text AS BLOB))), 0) FROM messages").fetchone()[0]
+    stored = conn.execute("SELECT coalesce(SUM(length(body)), 0) FROM texts").fetchone()[0]
+    return inline, stored
+
+
+def migrate(db, batch: int = 2000, train: bool = False, samples: int = 20000, pause: float = 0.01) -> dict:
+    """Moves inline texts into `texts`, `batch` rows per transaction. Resumable: converted rows are skipped."""
+    started = time.perf_counter()
+    inline_before, stored_before = payload_bytes(db.conn)
+    if train:
+        rows = db.conn.execute("SELECT coalesce(text, '') FROM messages WHERE length(text) >= ? "
+                               "ORDER BY id DESC LIMIT ?", (MIN_DEDUP_LEN, samples)).fetchall()
+        dict_id = db.add_text_dict(train_dict(r[0] for r in rows))
+        logger.info("Trained dictionary %s from %s texts", dict_id, len(rows))
+    last, converted = 0, 0
+    while True:
+        n, last = db.dedup_texts_batch(last, batch)
+        if n is None:
+            break
+        converted += n
+        logger.info("Converted %s texts (up to id %s)", converted, last)
+        time.sleep(pause)
+    freed = db.gc_texts()
+    inline_after, stored_after = payload_bytes(db.conn)
+    before, after = inline_before + stored_before, inline_after + stored_after
+    return {
+        "converted": converted,
+        "distinct_texts": db.conn.execute("SELECT COUNT(*) FROM texts").fetchone()[0],
+        "orphans_removed": freed,
+        "text_bytes_before": before,
+        "text_bytes_after": after,
+        "saved_bytes": before - after,
+        "saved_pct": round(100 * (before - after) / before, 1) if before else 0.0,
+        "s": round(time.perf_counter() - started, 1),
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Deduplicate and compress stored message texts in place")
+    parser.add_argument("db")
+    parser.add_argument("--batch", type=int, default=2000, help="rows per transaction")
+    parser.add_argument("--train", action="store_true", help="train a compression dictionary first")
+    parser.add_argument("--samples", type=int, default=20000, help="texts to train the dictionary on")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return the space to the OS")
+    args = parser.parse_args()
+
+    from archive import maintain
+    from db import DB
+    db = DB(args.db, readers=1, dedup_texts=True)
+    try:
+        report = migrate(db, args.batch, args.train, args.samples)
+        report.update(maintain(db, -1 if args.vacuum else 0))
+        for key, value in report.items():
+            print(f"{key}: {value}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
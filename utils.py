@@ -33,3 +33,36 @@ def extract_text_and_media(message: Message):
 
 def extract_male_ids(text: str):
     return list({m.group(1) for m in ID_RE.finditer(text or "")})
+
+_B36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def _to_b36(n: int) -> str:
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _B36[r] + out
+        if not n:
+            return out
+
+def encode_cursor(*parts: int) -> str:
+    """Compact cursor for callback data (Telegram allows 64 bytes): base36 parts joined by '.'."""
+    return ".".join(_to_b36(p) for p in parts)
+
+def decode_cursor(cursor: str) -> list[int]:
+    return [int(p, 36) for p in cursor.split(".")]
+
+FTS_TERM_RE = re.compile(r'([^\s"*]+)(\*?)')
+
+def fts_query(text: str) -> str:
+    """User input -> safe FTS5 query: every word is quoted (all must match), `word*` stays a prefix search."""
+    terms = []
+    for word, star in FTS_TERM_RE.findall(text or ""):
+        word = word.lstrip("@")
+        if word:
+            terms.append(f'"{word}"{star}')
+    return " ".join(terms)
+
+def message_link(chat_id: int, message_id: int):
+    """t.me link to a supergroup message (None for basic groups, which have no public links)."""
+    s = str(chat_id)
+    return f"https://t.me/c/{s[4:]}/{message_id}" if s.startswith("-100") else None
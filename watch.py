@@ -0,0 +1,158 @@
+"""Watchlists: admins subscribe to male IDs and get a digest DM when they show up in groups.
+
+Subscriptions live in `watches` and in memory as one dict keyed by the ID as
+an int (value: a user_id, or a tuple of them when several admins watch the
+same ID), so the ingest path pays one dict lookup per extracted ID. Matches
+are queued per user and sent as one digest per `interval`, through Delivery's
+rate limits.
+"""
+import asyncio
+import html
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from utils import message_link
+
+logger = logging.getLogger(__name__)
+
+
+class WatchIndex:
+    def __init__(self):
+        self._map: dict[int, object] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(1 if isinstance(v, int) else len(v) for v in self._map.values())
+
+    def load(self, rows: Iterable[tuple[int, str]]):
+        """(user_id, male_id) rows; replaces the index in one swap."""
+        built: dict[int, object] = {}
+        for user_id, male_id in rows:
+            _put(built, int(male_id), user_id)
+        with self._lock:
+            self._map = built
+
+    def add(self, user_id: int, male_ids: Iterable[str]):
+        with self._lock:
+            for male_id in male_ids:
+                _put(self._map, int(male_id), user_id)
+
+    def remove(self, user_id: int, male_ids: Iterable[str]):
+        with self._lock:
+            for male_id in male_ids:
+                key = int(male_id)
+                users = self._map.get(key)
+                if users == user_id:
+                    del self._map[key]
+                elif isinstance(users, tuple) and user_id in users:
+                    rest = tuple(u for u in users if u != user_id)
+                    self._map[key] = rest[0] if len(rest) == 1 else rest
+
+    def match(self, male_ids: Iterable[str]) -> list[tuple[int, str]]:
+        """(user_id, male_id) for every subscriber of the given IDs."""
+        if not self._map:
+            return []
+        out = []
+        for male_id in male_ids:
+            users = self._map.get(int(male_id))
+            if users is None:
+                continue
+            if isinstance(users, int):
+                out.append((users, male_id))
+            else:
+                out.extend((u, male_id) for u in users)
+        return out
+
+
+def _put(index: dict, key: int, user_id: int):
+    users = index.get(key)
+    if users is None:
+        index[key] = user_id
+    elif isinstance(users, int):
+        if users != user_id:
+            index[key] = (users, user_id)
+    elif user_id not in users:
+        index[key] = users + (user_id,)
+
+
+class WatchDigest:
+    """Collects matches per user and sends them as one DM per `interval` seconds."""
+
+    def __init__(self, delivery, render: Callable[[int, list, int], str], interval: float = 60,
+                 max_items: int = 30, seen_size: int = 50000):
+        self.delivery = delivery
+        self.render = render  # (user_id, [(male_id, chat_id, message_id)], dropped) -> HTML text
+        self.interval = interval
+        self.max_items = max_items
+        self._pending: dict[int, list] = {}
+        self._dropped: dict[int, int] = {}
+        self._seen: OrderedDict = OrderedDict()  # edits re-send the same IDs: alert once per message
+        self.seen_size = seen_size
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+
+    def add(self, matches: list[tuple[int, str]], chat_id: int, message_id: int):
+        for user_id, male_id in matches:
+            key = (user_id, male_id, chat_id, message_id)
+            if key in self._seen:
+                continue
+            self._seen[key] = None
+            if len(self._seen) > self.seen_size:
+                self._seen.popitem(last=False)
+            items = self._pending.setdefault(user_id, [])
+            if len(items) < self.max_items:
+                items.append((male_id, chat_id, message_id))
+            else:
+                self._dropped[user_id] = self._dropped.get(user_id, 0) + 1
+
+    async def flush(self):
+        pending, dropped = self._pending, self._dropped
+        self._pending, self._dropped = {}, {}
+        for user_id, items in pending.items():
+            text = self.render(user_id, items, dropped.get(user_id, 0))
+            try:
+                await self.delivery.call(user_id, lambda: self.delivery.bot.send_message(
+                    user_id, text, disable_web_page_preview=True))
+                self.sent += 1
+            except Exception:
+                logger.exception("Watch digest to %s failed", user_id)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"pending_users": len(self._pending), "digests_sent": self.sent}
+
+
+def digest_lines(items: list, chat_title: Callable[[int], str]) -> list[str]:
+    """One HTML line per match: ID and a link to the message (basic groups have none)."""
+    lines = []
+    for male_id, chat_id, message_id in items:
+        title = html.escape(chat_title(chat_id) or str(chat_id))
+        link = message_link(chat_id, message_id)
+        lines.append(f"<code>{male_id}</code> — " + (f'<a href="{link}">{title}</a>' if link else title))
+    return lines
+
+
+def watch_list_messages(header: str, male_ids: list[str], per_message: int = 150) -> list[str]:
+    """HTML messages listing the IDs, split between whole IDs so no tag is cut
+    (Telegram rejects the message otherwise); 150 IDs are ~3700 of the 4096 characters."""
+    out = []
+    for start in range(0, len(male_ids), per_message):
+        out.append(" ".join(f"<code>{i}</code>" for i in male_ids[start:start + per_message]))
+    if out:
+        out[0] = header + "\n" + out[0]
+    return out
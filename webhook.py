@@ -0,0 +1,139 @@
+import asyncio
+import hmac
+import logging
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def chat_key(update: dict) -> int:
+    """Chat (or user) the update belongs to; updates with the same key are handled in order."""
+    for kind in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if kind in update:
+            return update[kind]["chat"]["id"]
+    for kind in ("callback_query", "inline_query", "my_chat_member", "chat_member", "chat_join_request"):
+        if kind in update:
+            return update[kind]["from"]["id"]
+    return update.get("update_id", 0)
+
+
+class UpdateQueues:
+    """Bounded queues handled concurrently, one chat per queue: a chat's updates
+    run in order while different chats run in parallel."""
+
+    def __init__(self, handle: Callable[[dict], Awaitable], workers: int = 8, queue_size: int = 1000):
+        self.handle = handle
+        self.queues = [asyncio.Queue(max(1, queue_size // max(1, workers))) for _ in range(max(1, workers))]
+        self.handled = self.failed = 0
+        self._tasks: list[asyncio.Task] = []
+
+    def _queue(self, update: dict) -> asyncio.Queue:
+        return self.queues[hash(chat_key(update)) % len(self.queues)]
+
+    def offer(self, update: dict) -> bool:
+        """Queues without waiting; False when the chat's queue is full."""
+        try:
+            self._queue(update).put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def put(self, update: dict):
+        await self._queue(update).put(update)
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.handle(update)
+                self.handled += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Update %s failed", update.get("update_id"))
+            finally:
+                queue.task_done()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work(q)) for q in self.queues]
+
+    async def stop(self, timeout: float = 30):
+        """Lets queued updates finish (up to `timeout`), then stops the workers."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Drain timed out, %s updates dropped", self.depth())
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+
+class WebhookServer:
+    """Receives updates over HTTP and hands them to the dispatcher (or to `feed`).
+
+    Updates are acknowledged as soon as they are queued. When the chat's queue is
+    full the server answers 503 and Telegram redelivers later; on stop, queued
+    updates are drained first.
+    """
+
+    def __init__(self, dp, bot, path: str = "/webhook", secret: Optional[str] = None,
+                 workers: int = 8, queue_size: int = 1000, feed: Optional[Callable[[dict], Awaitable]] = None):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.updates = UpdateQueues(feed or (lambda update: dp.feed_raw_update(bot, update)), workers, queue_size)
+        self.draining = False
+        self.rejected = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle)
+        self.app.router.add_get("/healthz", self.health)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if self.draining:
+            return web.Response(status=503)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not self.updates.offer(update):
+            self.rejected += 1
+            return web.Response(status=503)
+        return web.Response()
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "draining" if self.draining else "ok", **self.stats()},
+                                 status=503 if self.draining else 200)
+
+    def stats(self) -> dict:
+        return {"queued": self.updates.depth(), "handled": self.updates.handled,
+                "failed": self.updates.failed, "rejected": self.rejected}
+
+    async def start(self, host: str, port: int, url: Optional[str] = None, allowed_updates=None):
+        """Starts the workers and the HTTP server; registers `url` with Telegram when given."""
+        self.updates.start()
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        if url:
+            await self.bot.set_webhook(url.rstrip("/") + self.path, secret_token=self.secret,
+                                       allowed_updates=allowed_updates or self.dp.resolve_used_update_types())
+        logger.info("Webhook server on %s:%s%s", host, port, self.path)
+
+    async def stop(self, timeout: float = 30):
+        """Stops accepting updates, drains the queues, then shuts down.
+        The webhook stays registered: Telegram keeps updates while the bot restarts."""
+        self.draining = True
+        await self.updates.stop(timeout)
+        if self._runner:
+            await self._runner.cleanup()